@@ -36,8 +36,59 @@ class Settings:
 
     # ML Model
     ML_MODEL_PATH: str = str(
-        PROJECT_ROOT / os.getenv("ML_MODEL_PATH", "ml_engine/eta_model.pkl")
+        PROJECT_ROOT / os.getenv("ML_MODEL_PATH", "ml_engine/eta_model.npz")
     )
+    # How often ML_MODEL_PATH is checked for a retrained model (0 disables hot-reload)
+    ML_RELOAD_POLL_SECONDS: float = float(os.getenv("ML_RELOAD_POLL_SECONDS", "30"))
+
+    # Per-route models ({route_id}.npz / {route_id}_hHH.npz), loaded on demand within a memory budget
+    ML_ROUTE_MODEL_DIR: str = str(PROJECT_ROOT / os.getenv("ML_ROUTE_MODEL_DIR", "ml_engine/route_models"))
+    ML_ROUTE_MODEL_MAX_MB: float = float(os.getenv("ML_ROUTE_MODEL_MAX_MB", "256"))
+
+    # Historical segment speed profiles (refreshed by `python -m ml_engine.segment_profiles`)
+    SEGMENT_PROFILE_RELOAD_SECONDS: float = float(os.getenv("SEGMENT_PROFILE_RELOAD_SECONDS", "900"))
+    SEGMENT_PROFILE_MIN_SAMPLES: int = int(os.getenv("SEGMENT_PROFILE_MIN_SAMPLES", "20"))
+    # Weight of the historical median vs. the instantaneous speed in /eta
+    SEGMENT_SPEED_WEIGHT: float = float(os.getenv("SEGMENT_SPEED_WEIGHT", "0.5"))
+
+    # ML serving mode: "model" evaluates the model, "grid" interpolates a precomputed table
+    ML_SERVING_MODE: str = os.getenv("ML_SERVING_MODE", "model")
+    ML_GRID_PATH: str = str(PROJECT_ROOT / os.getenv("ML_GRID_PATH", "ml_engine/eta_grid.npy"))
+    ML_GRID_ERROR_BUDGET_MIN: float = float(os.getenv("ML_GRID_ERROR_BUDGET_MIN", "0.25"))
+
+    # ML inference executor: "inline" (event loop), "thread" or "process"
+    ML_INFERENCE_MODE: str = os.getenv("ML_INFERENCE_MODE", "thread")
+    ML_INFERENCE_WORKERS: int = int(os.getenv("ML_INFERENCE_WORKERS", "2"))
+    ML_INFERENCE_MAX_PENDING: int = int(os.getenv("ML_INFERENCE_MAX_PENDING", "64"))
+    ML_INFERENCE_TIMEOUT_MS: float = float(os.getenv("ML_INFERENCE_TIMEOUT_MS", "250"))
+
+    # ETA micro-batching of concurrent /eta requests
+    ETA_BATCH_MAX_WAIT_MS: float = float(os.getenv("ETA_BATCH_MAX_WAIT_MS", "2.0"))
+    ETA_BATCH_MAX_SIZE: int = int(os.getenv("ETA_BATCH_MAX_SIZE", "256"))
+    # Batches predicted at once; beyond this requests wait in the queue
+    ETA_BATCH_MAX_IN_FLIGHT: int = int(os.getenv("ETA_BATCH_MAX_IN_FLIGHT", "4"))
+
+    # Quantized /eta prediction cache
+    ETA_CACHE_MAX_ENTRIES: int = int(os.getenv("ETA_CACHE_MAX_ENTRIES", "10000"))
+    ETA_CACHE_TTL_SECONDS: float = float(os.getenv("ETA_CACHE_TTL_SECONDS", "60"))
+
+    # Vector tiles of the route network: LRU size and disk cache directory (empty disables it)
+    TILE_CACHE_MAX_ENTRIES: int = int(os.getenv("TILE_CACHE_MAX_ENTRIES", "2048"))
+    _tile_cache_dir = os.getenv("TILE_CACHE_DIR", "data/tile_cache")
+    TILE_CACHE_DIR: str = str(PROJECT_ROOT / _tile_cache_dir) if _tile_cache_dir else ""
+
+    # Road paths through stops: "osrm", "osrm:<url>" (OSRM-compatible server) or "great_circle"
+    PATH_BACKEND: str = os.getenv("PATH_BACKEND", "osrm")
+    OSRM_URL: str = os.getenv("OSRM_URL", "https://router.project-osrm.org")
+    _path_cache_dir = os.getenv("PATH_CACHE_DIR", "data/path_cache")
+    PATH_CACHE_DIR: str = str(PROJECT_ROOT / _path_cache_dir) if _path_cache_dir else ""
+
+    # GTFS feed (zip or directory) whose stop_times drive schedule adherence; empty disables it
+    _gtfs_feed_path = os.getenv("GTFS_FEED_PATH", "")
+    GTFS_FEED_PATH: str = str(PROJECT_ROOT / _gtfs_feed_path) if _gtfs_feed_path else ""
+
+    # Timezone of the network's clock: hour-of-day features and profiles use it in training and serving
+    TRANSIT_TIMEZONE: str = os.getenv("TRANSIT_TIMEZONE", "UTC")
 
     # Logging
     LOG_LEVEL: str = os.getenv("LOG_LEVEL", "INFO")
@@ -49,6 +100,13 @@ class Settings:
     # Simulator
     BUS_POLL_STALE_SECONDS: int = 120  # Buses older than 2 min are "inactive"
 
+    # Live data — derived views are rebuilt at most once per tick
+    LIVE_TICK_SECONDS: float = float(os.getenv("LIVE_TICK_SECONDS", "1.0"))
+
+    # Stop arrival/departure events: detection radius and how often they are written
+    STOP_EVENT_RADIUS_M: float = float(os.getenv("STOP_EVENT_RADIUS_M", "30"))
+    STOP_EVENTS_FLUSH_SECONDS: float = float(os.getenv("STOP_EVENTS_FLUSH_SECONDS", "5"))
+
     # Authentication
     JWT_SECRET: str = os.getenv("JWT_SECRET", "change-me-in-production")
     SIMULATOR_API_KEY: str = os.getenv("SIMULATOR_API_KEY", "sim-key-change-me")
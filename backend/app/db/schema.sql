@@ -56,10 +56,44 @@ ON vehicle_logs (vehicle_id, time DESC);
 CREATE INDEX IF NOT EXISTS idx_vehicle_latest_last_update
 ON vehicle_latest_positions (last_update DESC);
 
+-- 5. Segment speed profiles (feature store, refreshed by ml_engine/segment_profiles.py)
+-- Speed histograms per (route, stop-to-stop segment, hour of week); buckets are 5 km/h wide
+CREATE TABLE IF NOT EXISTS segment_speed_hist (
+    route_id VARCHAR(50) NOT NULL,
+    segment_index INT NOT NULL, -- i = from the route's i-th to (i+1)-th stop
+    hour_of_week SMALLINT NOT NULL, -- 0 = Monday 00:00 in TRANSIT_TIMEZONE
+    bucket SMALLINT NOT NULL,
+    samples BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (route_id, segment_index, hour_of_week, bucket)
+);
+
+-- Progress of incremental feature-store jobs
+CREATE TABLE IF NOT EXISTS feature_store_watermarks (
+    name VARCHAR(100) PRIMARY KEY,
+    watermark TIMESTAMPTZ NOT NULL
+);
+
+-- 6. Stop events: one row per bus visit to a stop, written in bulk by the API's stop event detector
+-- arrive/depart are the first and last pings within the stop's radius
+CREATE TABLE IF NOT EXISTS stop_events (
+    vehicle_id VARCHAR(50) NOT NULL,
+    route_id VARCHAR(50) NOT NULL,
+    stop_id INT NOT NULL, -- no foreign key: history outlives edits to the stops table
+    arrive TIMESTAMPTZ NOT NULL,
+    depart TIMESTAMPTZ NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_stop_events_stop_arrive
+ON stop_events (route_id, stop_id, arrive DESC);
+
+CREATE INDEX IF NOT EXISTS idx_stop_events_vehicle_arrive
+ON stop_events (vehicle_id, arrive DESC);
+
 -- Convert to Hypertable for efficiency (TimescaleDB feature, graceful)
 DO $$
 BEGIN
     PERFORM create_hypertable('vehicle_logs', 'time', if_not_exists => TRUE);
+    PERFORM create_hypertable('stop_events', 'arrive', if_not_exists => TRUE);
 EXCEPTION WHEN OTHERS THEN
     RAISE NOTICE 'Could not create hypertable (TimescaleDB may not be available). Using regular table.';
 END $$;
@@ -0,0 +1,158 @@
+"""
+Async micro-batcher for single-row ETA predictions.
+
+Concurrent /eta requests are queued for at most `max_wait_ms` (or until
+`max_batch_size` rows are waiting) and answered with one vectorized
+`ETAPredictor.apredict_batch` call, so per-call model overhead is paid once
+per burst instead of once per request. Requests for different models (e.g.
+per-route models from the registry) share a batch window and are split into
+one model call per predictor.
+
+At most `max_in_flight` batches are predicted at once; while that many are
+running the collector stops taking requests off the queue, so a burst
+waits in the queue instead of piling up concurrent model calls.
+"""
+
+import asyncio
+import logging
+import time
+
+import numpy as np
+
+from backend.app.metrics import ETA_BATCH_QUEUE_WAIT, ETA_BATCH_SIZE
+from ml_engine.predictor import ETAPredictor
+
+logger = logging.getLogger("smart_transit.eta_batcher")
+
+
+class ETAMicroBatcher:
+    """Coalesces concurrent scalar predictions into batched model calls."""
+
+    def __init__(self, predictor: ETAPredictor, max_wait_ms: float = 2.0, max_batch_size: int = 256,
+                 max_in_flight: int = 4):
+        self.predictor = predictor
+        self.max_wait = max_wait_ms / 1000.0
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_in_flight = max(1, max_in_flight)
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._queue: asyncio.Queue | None = None
+        self._worker: asyncio.Task | None = None
+        self._slots: asyncio.Semaphore | None = None
+        # Batches being predicted; each removes itself when done
+        self._in_flight: set[asyncio.Task] = set()
+
+    def _ensure_worker(self) -> asyncio.Queue:
+        # The queue and worker are bound to the loop that first uses them
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._worker is None or self._worker.done():
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._slots = asyncio.Semaphore(self.max_in_flight)
+            self._worker = loop.create_task(self._run(self._queue))
+        return self._queue
+
+    async def predict(
+        self, distance_meters: float, current_speed: float, hour_of_day: int, predictor: ETAPredictor | None = None,
+    ) -> tuple[float, str]:
+        """
+        Queue one prediction (speed in m/s) and wait for its batch.
+
+        Args:
+            predictor: Model to predict with; defaults to the batcher's own.
+
+        Returns:
+            (ETA in minutes, source) as reported by `ETAPredictor.apredict_batch`.
+        """
+        queue = self._ensure_worker()
+        future = asyncio.get_running_loop().create_future()
+        queue.put_nowait((
+            predictor or self.predictor, distance_meters, current_speed, hour_of_day, future, time.perf_counter(),
+        ))
+        return await future
+
+    async def _run(self, queue: asyncio.Queue) -> None:
+        loop = asyncio.get_running_loop()
+        slots = self._slots
+        while True:
+            # Backpressure: wait for a free slot before collecting the next batch
+            await slots.acquire()
+            batch = []
+            try:
+                batch.append(await queue.get())
+                deadline = loop.time() + self.max_wait
+                while len(batch) < self.max_batch_size:
+                    if not queue.empty():
+                        batch.append(queue.get_nowait())
+                        continue
+                    remaining = deadline - loop.time()
+                    if remaining <= 0:
+                        break
+                    try:
+                        batch.append(await asyncio.wait_for(queue.get(), remaining))
+                    except asyncio.TimeoutError:
+                        break
+            except BaseException:
+                slots.release()
+                self._fail(item[4] for item in batch)
+                raise
+            # Keep collecting the next batch while this one is being predicted
+            task = loop.create_task(self._run_batch(batch))
+            self._in_flight.add(task)
+            task.add_done_callback(self._in_flight.discard)
+            task.add_done_callback(lambda _: slots.release())
+
+    async def _run_batch(self, batch: list) -> None:
+        started = time.perf_counter()
+        ETA_BATCH_SIZE.observe(len(batch))
+        groups: dict[int, list] = {}
+        for item in batch:
+            ETA_BATCH_QUEUE_WAIT.observe(started - item[-1])
+            groups.setdefault(id(item[0]), []).append(item)
+        try:
+            await asyncio.gather(*(self._run_group(group) for group in groups.values()))
+        finally:
+            # Callers still unanswered, e.g. when close() cancelled the batch
+            self._fail(item[4] for item in batch)
+
+    async def _run_group(self, group: list) -> None:
+        predictor = group[0][0]
+        _, distances, speeds, hours, futures, _ = zip(*group)
+        try:
+            results, source = await predictor.apredict_batch(
+                np.fromiter(distances, dtype=np.float64, count=len(group)),
+                np.fromiter(speeds, dtype=np.float64, count=len(group)),
+                np.fromiter(hours, dtype=np.float64, count=len(group)),
+            )
+        except Exception as e:
+            logger.error("Micro-batch prediction failed (%d rows): %s", len(group), e)
+            for future in futures:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for future, minutes in zip(futures, results.tolist()):
+            # Callers that disconnected leave a cancelled future behind
+            if not future.done():
+                future.set_result((minutes, source))
+
+    @staticmethod
+    def _fail(futures) -> None:
+        for future in futures:
+            if not future.done():
+                future.set_exception(RuntimeError("ETA micro-batcher closed"))
+
+    async def close(self) -> None:
+        """Stop the worker and the batches in flight; callers still waiting get an error."""
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+        tasks = list(self._in_flight)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        while self._queue is not None and not self._queue.empty():
+            self._fail([self._queue.get_nowait()[4]])
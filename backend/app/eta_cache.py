@@ -0,0 +1,90 @@
+"""
+Quantized memoization of /eta predictions.
+
+Many /eta calls are near-duplicates (several clients watching one bus, the
+frontend clamping speed to a floor), so inputs are snapped to a grid —
+distance to `distance_step_m`, speed to `speed_step_kmh` — and the model's
+answer for the grid point is reused. Entries live in a bounded LRU with a
+TTL and are dropped wholesale when the global model's version changes.
+Answers from per-route models carry the model file and its signature in
+their key, so routes never share entries with each other or with the
+global model, and a route model reloaded from a new file starts afresh.
+"""
+
+import time
+from collections import OrderedDict
+
+from backend.app.metrics import ETA_CACHE_ENTRIES, ETA_CACHE_REQUESTS
+
+CacheKey = tuple[int, int, int, tuple | None]
+
+
+class ETAPredictionCache:
+    """Bounded LRU/TTL cache of (minutes, source) keyed by quantized inputs."""
+
+    def __init__(
+        self,
+        max_entries: int = 10_000,
+        ttl_seconds: float = 60.0,
+        distance_step_m: float = 10.0,
+        speed_step_kmh: float = 0.5,
+    ):
+        self.max_entries = max(1, max_entries)
+        self.ttl = ttl_seconds
+        self.distance_step_m = distance_step_m
+        self.speed_step_kmh = speed_step_kmh
+        self._entries: OrderedDict[CacheKey, tuple[float, float, str]] = OrderedDict()
+        self._model_version = None
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, distance_meters: float, speed_kmh: float, hour: int, model: tuple | None = None) -> CacheKey:
+        """`model` identifies the route model that will answer (path, file signature), None for the global one."""
+        return (
+            round(distance_meters / self.distance_step_m),
+            round(speed_kmh / self.speed_step_kmh),
+            hour,
+            model,
+        )
+
+    def representative(self, key: CacheKey) -> tuple[float, float, int]:
+        """Inputs at the grid point, so every caller sharing a key gets the same answer."""
+        distance_q, speed_q, hour, _ = key
+        return distance_q * self.distance_step_m, speed_q * self.speed_step_kmh, hour
+
+    def _sync_version(self, model_version) -> None:
+        if model_version != self._model_version:
+            self._entries.clear()
+            self._model_version = model_version
+            ETA_CACHE_ENTRIES.set(0)
+
+    def get(self, key: CacheKey, model_version) -> tuple[float, str] | None:
+        self._sync_version(model_version)
+        entry = self._entries.get(key)
+        if entry is not None and time.monotonic() < entry[0]:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            ETA_CACHE_REQUESTS.labels(result="hit").inc()
+            return entry[1], entry[2]
+        if entry is not None:
+            del self._entries[key]
+        self.misses += 1
+        ETA_CACHE_REQUESTS.labels(result="miss").inc()
+        return None
+
+    def put(self, key: CacheKey, model_version, minutes: float, source: str) -> None:
+        self._sync_version(model_version)
+        self._entries[key] = (time.monotonic() + self.ttl, minutes, source)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        ETA_CACHE_ENTRIES.set(len(self._entries))
+
+    def clear(self) -> None:
+        self._entries.clear()
+        ETA_CACHE_ENTRIES.set(0)
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
@@ -0,0 +1,233 @@
+"""
+Live headway and bunching monitor.
+
+Each route keeps its buses as a list sorted by distance along the route, so
+a ping moves one entry with two binary searches and only the pairs it is in
+(the bus ahead of it and the bus behind it) are re-examined. A pair is
+bunched when its gap falls below BUNCHING_RATIO of the even spacing for the
+route (its length over the number of live buses on it) and gapped above
+GAP_RATIO of it. Alerts are raised and cleared on transitions only, and
+recent headways are sampled per route for their distribution.
+"""
+
+import bisect
+import time
+from collections import deque
+from datetime import datetime, timezone
+from typing import NamedTuple
+
+import numpy as np
+
+BUNCHING_RATIO = 0.25
+GAP_RATIO = 2.0
+# Followers slower than this are timed at it, so a bus waiting at a stop has a finite headway
+MIN_HEADWAY_SPEED_KMH = 10.0
+# Buses silent for longer than this leave the route (matches the active fleet window)
+STALE_SECONDS = 300.0
+# Headway samples kept per route for its distribution
+SAMPLES_PER_ROUTE = 2000
+
+
+class _Bus(NamedTuple):
+    route_id: str
+    along: float
+    speed_kmh: float
+    route_length_m: float
+    updated: float
+
+
+class HeadwayMonitor:
+    """Buses ordered along each route, with per-pair alert state and headway samples."""
+
+    def __init__(self):
+        # route_id -> sorted [(distance along, vehicle_id)]
+        self._order: dict[str, list] = {}
+        self._buses: dict[str, _Bus] = {}
+        # (route_id, follower vehicle_id) -> active alert
+        self._alerts: dict[tuple[str, str], dict] = {}
+        # route_id -> recent (headway_m, headway_s) of followers to their leaders
+        self._samples: dict[str, deque] = {}
+
+    def update(self, vehicle_id: str, route_id: str, along: float, speed_kmh: float,
+               route_length_m: float) -> list[dict]:
+        """
+        Move a bus to its new position along its route.
+
+        Returns:
+            Alerts raised or cleared by the move.
+        """
+        previous = self._buses.get(vehicle_id)
+        changes = []
+        # A bus staying on its route keeps its alert; _evaluate decides whether it still holds
+        old_follower = self._remove(vehicle_id, changes, keep_alert=previous is not None and previous.route_id == route_id)
+        order = self._order.setdefault(route_id, [])
+        bisect.insort(order, (along, vehicle_id))
+        self._buses[vehicle_id] = _Bus(route_id, along, speed_kmh, route_length_m, time.monotonic())
+
+        i = bisect.bisect_left(order, (along, vehicle_id))
+        leader = self._neighbour(order, i, +1, changes)
+        follower = self._neighbour(order, i, -1, changes)
+        headway = self._evaluate(route_id, vehicle_id, leader, changes)
+        if headway is not None:
+            self._samples.setdefault(route_id, deque(maxlen=SAMPLES_PER_ROUTE)).append(headway)
+        if follower is not None:
+            self._evaluate(route_id, follower, vehicle_id, changes)
+        # After an overtake or a route change the bus that followed it has a new leader
+        if old_follower is not None and old_follower != follower:
+            self._reevaluate(old_follower, changes)
+        return changes
+
+    def remove(self, vehicle_id: str) -> list[dict]:
+        changes = []
+        old_follower = self._remove(vehicle_id, changes)
+        if old_follower is not None:
+            self._reevaluate(old_follower, changes)
+        return changes
+
+    def _remove(self, vehicle_id: str, changes: list, keep_alert: bool = False) -> str | None:
+        """Take a bus off its route, clearing its alert into `changes`; returns the bus that followed it."""
+        bus = self._buses.pop(vehicle_id, None)
+        if bus is None:
+            return None
+        order = self._order[bus.route_id]
+        i = bisect.bisect_left(order, (bus.along, vehicle_id))
+        follower = None
+        if i < len(order) and order[i] == (bus.along, vehicle_id):
+            follower = order[i - 1][1] if i > 0 else None
+            del order[i]
+        if not keep_alert:
+            alert = self._alerts.pop((bus.route_id, vehicle_id), None)
+            if alert is not None:
+                changes.append(self._cleared(alert))
+        return follower
+
+    def _reevaluate(self, vehicle_id: str, changes: list) -> None:
+        """Re-examine a bus against whichever live bus is now ahead of it."""
+        bus = self._buses.get(vehicle_id)
+        if bus is None:
+            return
+        order = self._order[bus.route_id]
+        i = bisect.bisect_left(order, (bus.along, vehicle_id))
+        self._evaluate(bus.route_id, vehicle_id, self._neighbour(order, i, +1, changes), changes)
+
+    def _neighbour(self, order: list, i: int, step: int, changes: list) -> str | None:
+        """Nearest live bus ahead (+1) or behind (-1) position i; silent ones are dropped on the way."""
+        now = time.monotonic()
+        j = i + step
+        while 0 <= j < len(order):
+            vehicle_id = order[j][1]
+            if now - self._buses[vehicle_id].updated <= STALE_SECONDS:
+                return vehicle_id
+            self._remove(vehicle_id, changes)
+            if step < 0:
+                j -= 1
+        return None
+
+    def headway(self, follower_id: str, leader_id: str) -> tuple[float, float]:
+        """(meters, seconds) from a bus to the one ahead of it."""
+        follower, leader = self._buses[follower_id], self._buses[leader_id]
+        meters = leader.along - follower.along
+        speed_m_s = max(follower.speed_kmh, MIN_HEADWAY_SPEED_KMH) / 3.6
+        return meters, meters / speed_m_s
+
+    def expected_headway_m(self, route_id: str) -> float | None:
+        """Even spacing of the route's live buses along it."""
+        order = self._order.get(route_id)
+        if not order:
+            return None
+        # Silent buses not yet dropped would make the spacing look tighter than it is
+        now = time.monotonic()
+        live = sum(now - self._buses[vehicle_id].updated <= STALE_SECONDS for _, vehicle_id in order)
+        if live < 2:
+            return None
+        return self._buses[order[0][1]].route_length_m / live
+
+    def _evaluate(self, route_id: str, follower_id: str, leader_id: str | None, changes: list) -> tuple | None:
+        """Update the alert state of one (follower, leader) pair; returns its headway."""
+        key = (route_id, follower_id)
+        previous = self._alerts.get(key)
+        expected = self.expected_headway_m(route_id)
+        if leader_id is None or expected is None:
+            if previous is not None:
+                del self._alerts[key]
+                changes.append(self._cleared(previous))
+            return None
+
+        meters, seconds = self.headway(follower_id, leader_id)
+        kind = "bunching" if meters < BUNCHING_RATIO * expected else "gap" if meters > GAP_RATIO * expected else None
+        if kind is None:
+            if previous is not None:
+                del self._alerts[key]
+                changes.append(self._cleared(previous))
+        elif previous is None or previous["kind"] != kind or previous["leader"] != leader_id:
+            alert = {
+                "type": "headway_alert",
+                "kind": kind,
+                "route_id": route_id,
+                "follower": follower_id,
+                "leader": leader_id,
+                "headway_m": round(meters, 1),
+                "headway_s": round(seconds, 1),
+                "expected_headway_m": round(expected, 1),
+                "since": datetime.now(timezone.utc).isoformat(),
+            }
+            self._alerts[key] = alert
+            changes.append(alert)
+        else:
+            previous.update(headway_m=round(meters, 1), headway_s=round(seconds, 1),
+                            expected_headway_m=round(expected, 1))
+        return meters, seconds
+
+    @staticmethod
+    def _cleared(alert: dict) -> dict:
+        return {**alert, "kind": "cleared", "cleared_kind": alert["kind"],
+                "at": datetime.now(timezone.utc).isoformat()}
+
+    # --- Reads ---
+
+    def alerts(self, route_id: str | None = None) -> list[dict]:
+        return [dict(a) for (r, _), a in sorted(self._alerts.items()) if route_id is None or r == route_id]
+
+    def route_headways(self, route_id: str) -> dict | None:
+        """Buses front to back with their headway to the bus ahead, plus the route's headway distribution."""
+        order = self._order.get(route_id)
+        if not order:
+            return None
+        now = time.monotonic()
+        live = [vehicle_id for _, vehicle_id in reversed(order) if now - self._buses[vehicle_id].updated <= STALE_SECONDS]
+
+        buses = []
+        for k, vehicle_id in enumerate(live):
+            leader = live[k - 1] if k > 0 else None
+            meters, seconds = self.headway(vehicle_id, leader) if leader is not None else (None, None)
+            buses.append({
+                "vehicle_id": vehicle_id,
+                "distance_along_m": self._buses[vehicle_id].along,
+                "leader": leader,
+                "headway_m": None if meters is None else round(meters, 1),
+                "headway_s": None if seconds is None else round(seconds, 1),
+            })
+
+        samples = np.array(self._samples.get(route_id, ()), dtype=np.float64).reshape(-1, 2)
+        distribution = {"samples": int(samples.shape[0])}
+        if samples.shape[0]:
+            seconds = samples[:, 1]
+            p10, p50, p90 = np.percentile(seconds, [10, 50, 90])
+            mean = float(seconds.mean())
+            distribution.update(
+                mean_s=round(mean, 1), p10_s=round(float(p10), 1), p50_s=round(float(p50), 1),
+                p90_s=round(float(p90), 1),
+                # Coefficient of variation: 0 for perfectly even service
+                cv=round(float(seconds.std() / mean), 3) if mean > 0 else None,
+            )
+        expected = self.expected_headway_m(route_id)
+        return {
+            "route_id": route_id,
+            "expected_headway_m": None if expected is None else round(expected, 1),
+            "buses": buses,
+            "distribution": distribution,
+            "alerts": self.alerts(route_id),
+        }
+
+
+headway_monitor = HeadwayMonitor()
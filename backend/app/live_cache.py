@@ -0,0 +1,127 @@
+"""
+Per-tick caching of live fleet data.
+
+Bus positions change at most once per simulator tick, so anything derived
+from them (the active fleet, encoded feeds) is built once per tick and the
+same object is handed to every reader in between.
+"""
+
+import asyncio
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable
+
+from backend.app.config import settings
+from backend.app.db.pool import get_pool
+from backend.app.route_snapping import route_snapper
+from backend.app.schedule_adherence import schedule_adherence
+from backend.app.spatial_index import vehicle_grid
+
+
+@dataclass(frozen=True)
+class CachedValue:
+    value: Any
+    built_at: datetime
+
+
+class TickCache:
+    """
+    Keyed cache whose entries expire after one tick.
+
+    Concurrent readers of an expired key wait on a single rebuild instead of
+    each running the builder themselves.
+    """
+
+    def __init__(self, tick_seconds: float):
+        self.tick_seconds = tick_seconds
+        self._entries: dict[str, tuple[float, CachedValue]] = {}
+        self._locks: dict[str, asyncio.Lock] = {}
+
+    def _fresh(self, key: str) -> CachedValue | None:
+        entry = self._entries.get(key)
+        if entry is not None and time.monotonic() - entry[0] < self.tick_seconds:
+            return entry[1]
+        return None
+
+    async def get(self, key: str, builder: Callable[[], Awaitable[Any]]) -> CachedValue:
+        """Return the cached value for `key`, rebuilding it if the tick expired."""
+        cached = self._fresh(key)
+        if cached is not None:
+            return cached
+
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            cached = self._fresh(key)
+            if cached is not None:
+                return cached
+            value = CachedValue(await builder(), datetime.now(timezone.utc))
+            self._entries[key] = (time.monotonic(), value)
+            return value
+
+    def invalidate(self, key: str | None = None) -> None:
+        """Drop one entry, or every entry when no key is given."""
+        if key is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(key, None)
+
+
+tick_cache = TickCache(settings.LIVE_TICK_SECONDS)
+
+ACTIVE_FLEET_QUERY = """
+    SELECT vehicle_id, route_id, latitude, longitude, speed, passenger_count, last_update
+    FROM vehicle_latest_positions
+    WHERE last_update > NOW() - INTERVAL '5 minutes'
+    ORDER BY vehicle_id
+"""
+
+
+async def _load_active_fleet() -> list[dict]:
+    pool = get_pool()
+    if pool is None:
+        return []
+    async with pool.acquire() as conn:
+        rows = await conn.fetch(ACTIVE_FLEET_QUERY)
+    buses = [
+        {
+            "vehicle_id": row["vehicle_id"],
+            "route_id": row["route_id"],
+            "lat": float(row["latitude"]),
+            "lng": float(row["longitude"]),
+            "speed": float(row["speed"]),
+            "passenger_count": row["passenger_count"],
+            "last_update": row["last_update"],
+        }
+        for row in rows
+    ]
+    # Picks up pings received by other workers and drops buses that went silent
+    vehicle_grid.sync(buses)
+    return buses
+
+
+async def get_active_fleet() -> CachedValue:
+    """Buses seen in the last 5 minutes, fetched from the DB at most once per tick."""
+    return await tick_cache.get("active_fleet", _load_active_fleet)
+
+
+async def get_live_buses(bbox: tuple[float, float, float, float] | None = None) -> list[dict]:
+    """
+    Active buses as JSON-ready dicts, each snapped to its route and, when
+    a GTFS feed is configured, matched to a scheduled trip with its delay.
+
+    With a bbox (min_lat, min_lng, max_lat, max_lng) only the grid cells
+    overlapping it are read, so the cost follows the buses in view rather
+    than the size of the fleet.
+    """
+    fleet = await get_active_fleet()
+    buses = fleet.value if bbox is None else vehicle_grid.within_bbox(*bbox)
+    buses = [dict(bus) for bus in buses]
+    pool = get_pool()
+    await route_snapper.ensure_loaded(pool)
+    route_snapper.annotate(buses)
+    await schedule_adherence.ensure_loaded(pool)
+    schedule_adherence.annotate(buses)
+    for bus in buses:
+        bus["last_update"] = bus["last_update"].isoformat()
+    return buses
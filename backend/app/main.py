@@ -14,11 +14,19 @@ from slowapi import _rate_limit_exceeded_handler
 from slowapi.errors import RateLimitExceeded
 
 from backend.app.config import settings
-from backend.app.db.pool import create_pool, close_pool
+from backend.app.db.pool import create_pool, close_pool, get_pool
+from backend.app.eta_batcher import ETAMicroBatcher
+from backend.app.eta_cache import ETAPredictionCache
+from backend.app.model_reloader import ModelReloader, SegmentProfileReloader
 from backend.app.rate_limit import limiter
+from backend.app.spatial_index import stop_index
+from backend.app.stop_boards import stop_boards
+from backend.app.stop_events import StopEventFlusher, stop_event_detector
+from ml_engine.inference_pool import InferenceExecutor
+from ml_engine.model_registry import ModelRegistry
 from ml_engine.predictor import ETAPredictor
 
-from backend.app.routers import auth, eta, health, routes, stats, tracking, websocket
+from backend.app.routers import auth, eta, gtfs_rt, health, routes, stats, stops, tiles, tracking, websocket
 
 # --- Logging Setup ---
 logging.basicConfig(
@@ -39,21 +47,97 @@ async def lifespan(application: FastAPI):
 
     # 1. Database connection pool
     await create_pool()
-
-    # 2. ML Model
-    if os.path.exists(settings.ML_MODEL_PATH):
-        application.state.eta_predictor = ETAPredictor(model_path=settings.ML_MODEL_PATH)
-        if application.state.eta_predictor.ready:
-            logger.info("ML model loaded successfully from %s", settings.ML_MODEL_PATH)
-        else:
-            logger.warning("ML model file exists but failed to load — using rule-based fallback.")
-    else:
-        application.state.eta_predictor = ETAPredictor(model_path="NON_EXISTENT")
+    if get_pool() is not None:
+        try:
+            await stop_index.ensure_loaded(get_pool())
+        except Exception as e:
+            logger.warning("Stop index not built at startup (%s) — will retry on first use.", e)
+
+    # 2. ML Model — starts on the rule-based fallback; the reloader warms it up in the background
+    application.state.eta_predictor = ETAPredictor(model_path=settings.ML_MODEL_PATH, lazy=True)
+    if not os.path.exists(settings.ML_MODEL_PATH):
         logger.warning("ML model not found at %s — using rule-based fallback.", settings.ML_MODEL_PATH)
 
+    if settings.ML_SERVING_MODE == "grid":
+        # Recorded now, applied to every model the reloader loads
+        application.state.eta_predictor.enable_grid(settings.ML_GRID_PATH, settings.ML_GRID_ERROR_BUDGET_MIN)
+
+    # 3. Inference executor keeping model calls off the event loop
+    executor = None
+    if settings.ML_INFERENCE_MODE != "inline":
+        executor = InferenceExecutor(
+            model_path=settings.ML_MODEL_PATH,
+            mode=settings.ML_INFERENCE_MODE,
+            workers=settings.ML_INFERENCE_WORKERS,
+            max_pending=settings.ML_INFERENCE_MAX_PENDING,
+            timeout_ms=settings.ML_INFERENCE_TIMEOUT_MS,
+            grid_config=(
+                (settings.ML_GRID_PATH, settings.ML_GRID_ERROR_BUDGET_MIN) if settings.ML_SERVING_MODE == "grid" else None
+            ),
+        )
+        application.state.eta_predictor.executor = executor
+        logger.info("ML inference running in a %s pool (%d workers).", executor.mode, executor.workers)
+
+    # Per-route models, resolved per request and falling back to the global model
+    application.state.model_registry = ModelRegistry(
+        settings.ML_ROUTE_MODEL_DIR,
+        fallback=application.state.eta_predictor,
+        max_bytes=int(settings.ML_ROUTE_MODEL_MAX_MB * 1024 * 1024),
+        executor=executor,
+    )
+
+    model_reloader = ModelReloader(
+        application.state.eta_predictor,
+        poll_seconds=settings.ML_RELOAD_POLL_SECONDS,
+        registry=application.state.model_registry,
+    )
+    model_reloader.start()
+
+    # Historical segment speeds blended into /eta (needs the database)
+    profile_reloader = None
+    if get_pool() is not None:
+        profile_reloader = SegmentProfileReloader(
+            application.state.eta_predictor,
+            get_pool(),
+            reload_seconds=settings.SEGMENT_PROFILE_RELOAD_SECONDS,
+            min_samples=settings.SEGMENT_PROFILE_MIN_SAMPLES,
+        )
+        profile_reloader.start()
+
+    # Stop arrival/departure events detected from pings, written to the database in bulk;
+    # the same tick takes silent buses off the stop boards
+    stop_event_flusher = None
+    if get_pool() is not None:
+        stop_event_flusher = StopEventFlusher(
+            stop_event_detector, get_pool(), settings.STOP_EVENTS_FLUSH_SECONDS, boards=stop_boards,
+        )
+        stop_event_flusher.start()
+
+    # 4. Micro-batcher coalescing concurrent /eta requests into one model call
+    application.state.eta_batcher = ETAMicroBatcher(
+        application.state.eta_predictor,
+        max_wait_ms=settings.ETA_BATCH_MAX_WAIT_MS,
+        max_batch_size=settings.ETA_BATCH_MAX_SIZE,
+        max_in_flight=settings.ETA_BATCH_MAX_IN_FLIGHT,
+    )
+
+    # 5. Quantized prediction cache in front of the batcher
+    application.state.eta_cache = ETAPredictionCache(
+        max_entries=settings.ETA_CACHE_MAX_ENTRIES,
+        ttl_seconds=settings.ETA_CACHE_TTL_SECONDS,
+    )
+
     yield  # Application runs here
 
     # --- Shutdown ---
+    await model_reloader.close()
+    if profile_reloader is not None:
+        await profile_reloader.close()
+    await application.state.eta_batcher.close()
+    if stop_event_flusher is not None:
+        await stop_event_flusher.close()
+    if executor is not None:
+        executor.shutdown()
     await close_pool()
     logger.info("Smart-Transit API Gateway shut down.")
 
@@ -81,9 +165,12 @@ app.include_router(health.router)
 app.include_router(auth.router)
 app.include_router(tracking.router)
 app.include_router(routes.router)
+app.include_router(stops.router)
+app.include_router(tiles.router)
 app.include_router(eta.router)
 app.include_router(stats.router)
 app.include_router(websocket.router)
+app.include_router(gtfs_rt.router)
 from backend.app.routers import analytics
 app.include_router(analytics.router)
 from backend.app.routers import admin
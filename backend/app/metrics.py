@@ -0,0 +1,67 @@
+"""
+Application-level Prometheus metrics.
+
+Metrics register on the default registry, which the instrumentator already
+exposes at /metrics. Like the instrumentator, prometheus_client is treated as
+optional: without it every metric is a no-op.
+"""
+
+try:
+    from prometheus_client import Counter, Gauge, Histogram
+except ImportError:  # pragma: no cover - exercised only without prometheus_client
+    class _NoopMetric:
+        def __init__(self, *args, **kwargs):
+            pass
+
+        def labels(self, *args, **kwargs):
+            return self
+
+        def observe(self, *args, **kwargs):
+            pass
+
+        def inc(self, *args, **kwargs):
+            pass
+
+        def set(self, *args, **kwargs):
+            pass
+
+    Counter = Gauge = Histogram = _NoopMetric
+
+
+# --- ETA micro-batching ---
+ETA_BATCH_SIZE = Histogram(
+    "smart_transit_eta_batch_size",
+    "Number of /eta requests coalesced into one model call",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024),
+)
+ETA_BATCH_QUEUE_WAIT = Histogram(
+    "smart_transit_eta_batch_queue_wait_seconds",
+    "Time an /eta request waited for its micro-batch to run",
+    buckets=(0.0005, 0.001, 0.002, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25),
+)
+
+# --- ETA prediction cache ---
+ETA_CACHE_REQUESTS = Counter(
+    "smart_transit_eta_cache_requests_total",
+    "Quantized /eta cache lookups by result (hit or miss)",
+    ["result"],
+)
+ETA_CACHE_ENTRIES = Gauge(
+    "smart_transit_eta_cache_entries",
+    "Entries currently held in the /eta prediction cache",
+)
+
+# --- Per-route model registry ---
+MODEL_REGISTRY_LOOKUPS = Counter(
+    "smart_transit_model_registry_lookups_total",
+    "Route model lookups by result (hit, miss = loaded from disk, global = no route model)",
+    ["result"],
+)
+MODEL_REGISTRY_RESIDENT_MODELS = Gauge(
+    "smart_transit_model_registry_resident_models",
+    "Route models currently loaded",
+)
+MODEL_REGISTRY_RESIDENT_BYTES = Gauge(
+    "smart_transit_model_registry_resident_bytes",
+    "Size of the route model files currently loaded",
+)
@@ -0,0 +1,133 @@
+"""
+Background model warm-up and hot-reload.
+
+The API starts serving immediately with the rule-based fallback while the
+model loads in a worker thread. Afterwards the model file is polled, and
+when it changes (e.g. a retrained model is moved into place) the new version
+is loaded off the event loop and swapped in by `ETAPredictor.load`, so
+requests are never blocked or dropped. The per-route model registry, if
+given, is re-scanned on the same schedule, and segment speed profiles are
+re-read from the feature store on their own schedule.
+
+Publish new models by renaming them over the old file (as
+`export_gradient_boosting` does), never by rewriting it in place: compiled
+models are memory-mapped while they serve.
+"""
+
+import asyncio
+import logging
+import os
+
+from ml_engine.predictor import ETAPredictor
+
+logger = logging.getLogger("smart_transit.model_reloader")
+
+
+class ModelReloader:
+    """Loads the predictor's model in the background and reloads it when the file changes."""
+
+    def __init__(self, predictor: ETAPredictor, poll_seconds: float = 30.0, registry=None):
+        self.predictor = predictor
+        self.registry = registry
+        self.poll_seconds = poll_seconds
+        self._task: asyncio.Task | None = None
+        self._signature = None
+        self.reloads = 0
+
+    def _file_signature(self):
+        try:
+            stat = os.stat(self.predictor.model_path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    async def check(self) -> bool:
+        """
+        Load the model if its file changed since the last check.
+
+        Returns:
+            True if a new model was swapped in.
+        """
+        signature = self._file_signature()
+        if signature is None or signature == self._signature:
+            return False
+        self._signature = signature
+
+        # Mark warming before the thread starts so /health reports it right away
+        if not self.predictor.ready:
+            self.predictor.warming = True
+        loaded = await asyncio.to_thread(self.predictor.load)
+        if loaded:
+            self.reloads += 1
+        return loaded
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.check()
+                if self.registry is not None:
+                    await asyncio.to_thread(self.registry.refresh)
+            except Exception as e:
+                logger.error("Model reload check failed: %s", e)
+            if self.poll_seconds <= 0:
+                return
+            await asyncio.sleep(self.poll_seconds)
+
+    def start(self) -> None:
+        """Warm up now, then keep polling every `poll_seconds` (once only if <= 0)."""
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+class SegmentProfileReloader:
+    """Loads segment speed profiles from the feature store and re-reads them periodically."""
+
+    def __init__(self, predictor: ETAPredictor, pool, reload_seconds: float = 900.0, min_samples: int = 20):
+        self.predictor = predictor
+        self.pool = pool
+        self.reload_seconds = reload_seconds
+        self.min_samples = min_samples
+        self._task: asyncio.Task | None = None
+
+    async def load(self) -> None:
+        from ml_engine.segment_profiles import load_segment_profiles
+
+        profiles = await load_segment_profiles(self.pool, min_samples=self.min_samples)
+        # A single reference swap; predictions read whichever table was current
+        self.predictor.segment_profiles = profiles
+        logger.info(
+            "Segment speed profiles loaded: %d routes, %.1f MB",
+            len(profiles.route_offsets), profiles.nbytes / 1e6,
+        )
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.load()
+            except Exception as e:
+                logger.error("Segment profile load failed: %s", e)
+            if self.reload_seconds <= 0:
+                return
+            await asyncio.sleep(self.reload_seconds)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
@@ -3,8 +3,11 @@ Pydantic request/response models for the Smart-Transit API.
 """
 
 from datetime import datetime
-from typing import Optional
-from pydantic import BaseModel, Field
+from typing import Annotated, List, Optional
+from pydantic import BaseModel, Field, model_validator
+
+# Upper bound on rows per batched ETA request
+MAX_ETA_BATCH_SIZE = 10_000
 
 
 # --- Request Models ---
@@ -27,6 +30,26 @@ class TelemetryPing(BaseModel):
     timestamp: Optional[datetime] = None
 
 
+class ETABatchRequest(BaseModel):
+    """Many ETA queries answered with a single model call; results keep input order."""
+    distances_meters: List[Annotated[float, Field(gt=0)]] = Field(
+        ..., min_length=1, max_length=MAX_ETA_BATCH_SIZE, description="Distances remaining in meters"
+    )
+    speeds_kmh: List[Annotated[float, Field(ge=0)]] = Field(
+        ..., min_length=1, max_length=MAX_ETA_BATCH_SIZE, description="Vehicle speeds in km/h"
+    )
+    hours: Optional[List[Annotated[int, Field(ge=0, le=23)]]] = Field(
+        default=None, description="Hour of day per row (defaults to the current hour)"
+    )
+
+    @model_validator(mode="after")
+    def check_lengths(self):
+        n = len(self.distances_meters)
+        if len(self.speeds_kmh) != n or (self.hours is not None and len(self.hours) != n):
+            raise ValueError("distances_meters, speeds_kmh and hours must have the same length")
+        return self
+
+
 # --- Response Models ---
 
 class HealthResponse(BaseModel):
@@ -45,6 +68,16 @@ class BusPosition(BaseModel):
     speed: float
     passenger_count: int = 0
     last_update: str
+    # Position along the route (see route_snapping); null when the route has no stops
+    distance_along_m: Optional[float] = None
+    off_route_m: Optional[float] = None
+    next_stop_index: Optional[int] = None
+    next_stop: Optional[str] = None
+    next_stop_distance_m: Optional[float] = None
+    # Matched GTFS trip and seconds behind its schedule (negative when early); null without a feed or match
+    trip_id: Optional[str] = None
+    delay_s: Optional[float] = None
+    schedule_status: Optional[str] = None  # "early", "on_time" or "late"
 
 
 class ETAResponse(BaseModel):
@@ -53,7 +86,132 @@ class ETAResponse(BaseModel):
     source: str
 
 
+class ETABatchResponse(BaseModel):
+    seconds: List[float]
+    source: str
+
+
 class FleetStats(BaseModel):
     active_buses: int
     total_routes: int
     total_stops: int
+
+
+class StopETA(BaseModel):
+    stop_index: int
+    stop: str
+    distance_m: float
+    seconds: float
+
+
+class BusStopETAs(BaseModel):
+    vehicle_id: str
+    distance_along_m: float
+    speed: float
+    etas: List[StopETA]
+
+
+class ETAMatrixResponse(BaseModel):
+    """Predicted arrival of every active bus on a route at each stop still ahead of it."""
+    route_id: str
+    generated_at: str
+    source: str
+    stops: List[str]
+    buses: List[BusStopETAs]
+
+
+class StopArrival(BaseModel):
+    vehicle_id: str
+    route_id: str
+    arrival_time: str
+    seconds: float
+    distance_m: float
+
+
+class StopArrivalsResponse(BaseModel):
+    stop_id: int
+    stop: str
+    route_id: str
+    arrivals: List[StopArrival]
+
+
+class NearbyStop(BaseModel):
+    stop_id: int
+    stop: str
+    route_id: str
+    lat: float
+    lng: float
+    distance_m: float
+
+
+class RoutePath(BaseModel):
+    """Road path through a route's stops, as [lat, lng] points."""
+    route_id: str
+    source: str
+    coordinates: List[List[float]]
+
+
+class HeadwayAlert(BaseModel):
+    kind: str  # "bunching" or "gap"
+    route_id: str
+    follower: str
+    leader: str
+    headway_m: float
+    headway_s: float
+    expected_headway_m: float
+    since: str
+
+
+class BusHeadway(BaseModel):
+    vehicle_id: str
+    distance_along_m: float
+    leader: Optional[str] = None
+    headway_m: Optional[float] = None
+    headway_s: Optional[float] = None
+
+
+class HeadwayDistribution(BaseModel):
+    """Recent headways (seconds) between consecutive buses on the route."""
+    samples: int
+    mean_s: Optional[float] = None
+    p10_s: Optional[float] = None
+    p50_s: Optional[float] = None
+    p90_s: Optional[float] = None
+    cv: Optional[float] = None
+
+
+class RouteHeadways(BaseModel):
+    """Buses on a route from front to back, each with its headway to the bus ahead."""
+    route_id: str
+    expected_headway_m: Optional[float] = None
+    buses: List[BusHeadway]
+    distribution: HeadwayDistribution
+    alerts: List[HeadwayAlert]
+
+
+class BusAdherence(BaseModel):
+    vehicle_id: str
+    trip_id: str
+    delay_s: float
+    status: str  # "early", "on_time" or "late"
+
+
+class AdherenceSummary(BaseModel):
+    """Delays (seconds, negative when early) of the buses matched to a trip."""
+    matched: int
+    early: int
+    on_time: int
+    late: int
+    mean_delay_s: Optional[float] = None
+    p50_delay_s: Optional[float] = None
+    p90_delay_s: Optional[float] = None
+    max_delay_s: Optional[float] = None
+
+
+class RouteAdherence(BaseModel):
+    """Live buses on a route against today's GTFS timetable."""
+    route_id: str
+    service_date: str
+    buses: List[BusAdherence]
+    summary: AdherenceSummary
+    unmatched_trips: List[str]
@@ -0,0 +1,187 @@
+"""
+Road paths through a sequence of stops, resolved once and cached on disk.
+
+A path is looked up by a hash of the backend and the stop coordinates
+(rounded to ~10 cm). On a miss it is requested from the configured
+backend and stored as JSON, so the API and the simulator only make
+external calls the first time a route is seen. Backends:
+
+    osrm                          public OSRM demo server (OSRM_URL)
+    osrm:http://localhost:5000    any OSRM-compatible server, e.g. scripts/osrm_standin.py
+    great_circle                  built-in densifier, no network at all
+
+When the backend fails, the stops are joined by great-circle arcs instead.
+That fallback is not persisted, and the backend is retried after
+FAILURE_RETRY_SECONDS.
+"""
+
+import hashlib
+import json
+import logging
+import math
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+
+from backend.app.config import settings
+from ml_engine.geo import EARTH_RADIUS_M
+
+logger = logging.getLogger("smart_transit.paths")
+
+# Spacing of points added between stops by the great-circle densifier
+GREAT_CIRCLE_STEP_M = 50.0
+# Stop coordinates are rounded to this many decimals in the cache key
+KEY_DECIMALS = 6
+# A backend failure is remembered (in memory only) for this long before retrying
+FAILURE_RETRY_SECONDS = 300.0
+
+
+def densify_great_circle(coords, step_m: float = GREAT_CIRCLE_STEP_M) -> list[tuple[float, float]]:
+    """Join (lat, lng) points by great-circle arcs with a point every `step_m` meters."""
+    if len(coords) < 2:
+        return [tuple(c) for c in coords]
+    lat, lng = np.radians(np.asarray(coords, dtype=np.float64)).T
+    # Unit vectors on the sphere
+    xyz = np.stack([np.cos(lat) * np.cos(lng), np.cos(lat) * np.sin(lng), np.sin(lat)], axis=1)
+
+    pieces = [xyz[:1]]
+    for a, b in zip(xyz[:-1], xyz[1:]):
+        # atan2 stays accurate for nearly identical points, where acos does not
+        angle = math.atan2(float(np.linalg.norm(np.cross(a, b))), float(a @ b))
+        if angle * EARTH_RADIUS_M < 0.01:
+            # Repeated stop
+            continue
+        n = max(1, math.ceil(angle * EARTH_RADIUS_M / step_m))
+        f = np.arange(1, n + 1)[:, None] / n
+        pieces.append((np.sin((1 - f) * angle) * a + np.sin(f * angle) * b) / math.sin(angle))
+    points = np.concatenate(pieces)
+    out_lat = np.degrees(np.arcsin(np.clip(points[:, 2], -1.0, 1.0)))
+    out_lng = np.degrees(np.arctan2(points[:, 1], points[:, 0]))
+    return list(zip(out_lat.tolist(), out_lng.tolist()))
+
+
+class GreatCircleBackend:
+    name = "great_circle"
+
+    def __init__(self, step_m: float = GREAT_CIRCLE_STEP_M):
+        self.step_m = step_m
+
+    def route(self, coords) -> list[tuple[float, float]]:
+        return densify_great_circle(coords, self.step_m)
+
+
+class OSRMBackend:
+    """Driving route from an OSRM-compatible `/route/v1/driving` service."""
+
+    def __init__(self, base_url: str, timeout: float = 5.0):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.name = f"osrm:{self.base_url}"
+
+    def route(self, coords) -> list[tuple[float, float]]:
+        import requests
+
+        waypoints = ";".join(f"{lng:.{KEY_DECIMALS}f},{lat:.{KEY_DECIMALS}f}" for lat, lng in coords)
+        response = requests.get(
+            f"{self.base_url}/route/v1/driving/{waypoints}",
+            params={"overview": "full", "geometries": "geojson"},
+            timeout=self.timeout,
+        )
+        response.raise_for_status()
+        data = response.json()
+        if data.get("code", "Ok") != "Ok" or not data.get("routes"):
+            raise ValueError(f"OSRM returned no route ({data.get('code')})")
+        return [(lat, lng) for lng, lat in data["routes"][0]["geometry"]["coordinates"]]
+
+
+def make_backend(spec: str):
+    """Backend from a PATH_BACKEND value: "osrm", "osrm:<url>" or "great_circle"."""
+    if spec == "great_circle":
+        return GreatCircleBackend()
+    if spec == "osrm":
+        return OSRMBackend(settings.OSRM_URL)
+    if spec.startswith("osrm:"):
+        return OSRMBackend(spec[len("osrm:"):])
+    raise ValueError(f"Unknown path backend {spec!r} (expected osrm, osrm:<url> or great_circle)")
+
+
+class PathService:
+    """Resolves stop sequences to paths through a memory + disk cache in front of a backend."""
+
+    def __init__(self, backend, cache_dir: str | None = None):
+        self.backend = backend
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+        self._memory: dict[str, tuple[list, str]] = {}
+        # key -> monotonic time of the last backend failure
+        self._failures: dict[str, float] = {}
+        self._locks: dict[str, threading.Lock] = {}
+        self._locks_guard = threading.Lock()
+
+    def key(self, coords) -> str:
+        rounded = ";".join(f"{lat:.{KEY_DECIMALS}f},{lng:.{KEY_DECIMALS}f}" for lat, lng in coords)
+        return hashlib.sha1(f"{self.backend.name}|{rounded}".encode()).hexdigest()
+
+    def resolve(self, coords) -> tuple[list[tuple[float, float]], str]:
+        """
+        Path through `coords` ((lat, lng) stops in order). Blocking; call
+        through a thread from async code.
+
+        Returns:
+            (path as (lat, lng) points, name of the backend that produced it)
+        """
+        coords = [(float(lat), float(lng)) for lat, lng in coords]
+        if len(coords) < 2:
+            return coords, GreatCircleBackend.name
+        key = self.key(coords)
+        cached = self._memory.get(key)
+        if cached is not None:
+            return cached
+
+        # One backend call per path even when many clients ask for it at once
+        with self._locks_guard:
+            lock = self._locks.setdefault(key, threading.Lock())
+        with lock:
+            cached = self._memory.get(key) or self._read(key)
+            if cached is None:
+                failed_at = self._failures.get(key)
+                if failed_at is not None and time.monotonic() - failed_at < FAILURE_RETRY_SECONDS:
+                    return densify_great_circle(coords), GreatCircleBackend.name
+                try:
+                    cached = (self.backend.route(coords), self.backend.name)
+                except Exception as e:
+                    logger.warning("Path backend %s failed for %d stops: %s. Using great-circle arcs.",
+                                   self.backend.name, len(coords), e)
+                    self._failures[key] = time.monotonic()
+                    return densify_great_circle(coords), GreatCircleBackend.name
+                self._failures.pop(key, None)
+                self._write(key, coords, *cached)
+            self._memory[key] = cached
+            return cached
+
+    def _read(self, key: str) -> tuple[list, str] | None:
+        if self.cache_dir is None:
+            return None
+        try:
+            data = json.loads((self.cache_dir / f"{key}.json").read_text())
+        except (FileNotFoundError, ValueError):
+            return None
+        return [tuple(p) for p in data["path"]], data["source"]
+
+    def _write(self, key: str, coords, path, source: str) -> None:
+        if self.cache_dir is None:
+            return
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+            with os.fdopen(fd, "w") as f:
+                json.dump({"source": source, "stops": coords, "path": path}, f)
+            os.replace(tmp, self.cache_dir / f"{key}.json")
+        except OSError as e:
+            logger.warning("Could not cache path on disk: %s", e)
+
+
+path_service = PathService(make_backend(settings.PATH_BACKEND), settings.PATH_CACHE_DIR)
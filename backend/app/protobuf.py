@@ -0,0 +1,61 @@
+"""
+Minimal Protocol Buffers wire-format encoder.
+
+Only the handful of primitives needed to emit small, fixed schemas
+(GTFS-Realtime feeds, Mapbox Vector Tiles) without pulling in the
+protobuf runtime.
+"""
+
+import struct
+
+WIRE_VARINT = 0
+WIRE_FIXED64 = 1
+WIRE_LENGTH_DELIMITED = 2
+WIRE_FIXED32 = 5
+
+
+def encode_varint(value: int) -> bytes:
+    """Encode a non-negative integer as a base-128 varint."""
+    if value < 0:
+        # Negative int32/int64 values are sign-extended to 10 bytes
+        value += 1 << 64
+    out = bytearray()
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def zigzag(value: int) -> int:
+    """Map a signed integer onto an unsigned one (sint32/sint64 encoding)."""
+    return (value << 1) ^ (value >> 63)
+
+
+def field_key(field_number: int, wire_type: int) -> bytes:
+    return encode_varint((field_number << 3) | wire_type)
+
+
+def field_varint(field_number: int, value: int) -> bytes:
+    return field_key(field_number, WIRE_VARINT) + encode_varint(value)
+
+
+def field_bytes(field_number: int, value: bytes) -> bytes:
+    return field_key(field_number, WIRE_LENGTH_DELIMITED) + encode_varint(len(value)) + value
+
+
+def field_string(field_number: int, value: str) -> bytes:
+    return field_bytes(field_number, value.encode("utf-8"))
+
+
+def field_float(field_number: int, value: float) -> bytes:
+    return field_key(field_number, WIRE_FIXED32) + struct.pack("<f", value)
+
+
+def field_double(field_number: int, value: float) -> bytes:
+    return field_key(field_number, WIRE_FIXED64) + struct.pack("<d", value)
+
+
+def field_packed_varints(field_number: int, values) -> bytes:
+    """A packed repeated uint32/uint64 field."""
+    return field_bytes(field_number, b"".join(encode_varint(v) for v in values))
@@ -0,0 +1,280 @@
+"""
+Linear referencing of live buses against their route.
+
+Each route's polyline is precomputed once as NumPy arrays in a local metric
+projection: vertex coordinates, the cumulative distance along the line at
+every vertex, each stop's position along it and a bounding box per segment.
+A ping is snapped by projecting it onto candidate segments. With the
+vehicle's previous position as a hint, only the few segments just ahead of
+it are tried (one binary search plus constant work); without one, or when
+the bus is no longer near them, the candidates are the segments whose box
+contains the ping.
+"""
+
+import asyncio
+import logging
+from typing import NamedTuple
+
+import numpy as np
+
+from ml_engine.geo import EARTH_RADIUS_M
+
+logger = logging.getLogger("smart_transit.route_snapping")
+
+# Segments tried from the hinted one onwards (one behind allows for GPS jitter)
+SNAP_WINDOW = 8
+# A ping further than this from the hinted segments is searched for route-wide
+MAX_SNAP_M = 150.0
+# A bus within this distance of a stop is at it; the stop stays "next" until it leaves
+AT_STOP_M = 25.0
+
+ROUTE_STOPS_QUERY = """
+    SELECT stop_id, route_id, stop_name, latitude, longitude
+    FROM stops
+    ORDER BY route_id, stop_sequence, stop_id
+"""
+
+
+class SnapResult(NamedTuple):
+    distance_along_m: float
+    off_route_m: float
+    next_stop_index: int | None
+    next_stop: str | None
+    next_stop_distance_m: float | None
+
+
+class RouteGeometry:
+    """One route's polyline and stops as flat arrays in meters."""
+
+    def __init__(self, route_id: str, lat, lng, stop_lat, stop_lng, stop_names: list, stop_ids: list | None = None):
+        self.route_id = route_id
+        self.stop_names = list(stop_names)
+        self.stop_ids = list(stop_ids) if stop_ids is not None else list(range(len(self.stop_names)))
+
+        lat = np.asarray(lat, dtype=np.float64)
+        self._scale_y = np.radians(1.0) * EARTH_RADIUS_M
+        self._scale_x = self._scale_y * np.cos(np.radians(lat.mean()))
+        self.x, self.y = self._to_xy(lat, lng)
+
+        dx, dy = np.diff(self.x), np.diff(self.y)
+        self._dx, self._dy = dx, dy
+        self._length_sq = np.maximum(dx * dx + dy * dy, 1e-9)
+        # Distance along the route at every vertex
+        self.offsets = np.concatenate(([0.0], np.cumsum(np.hypot(dx, dy))))
+        # (min x, min y, max x, max y) per segment, grown by the snapping radius
+        x0, x1, y0, y1 = self.x[:-1], self.x[1:], self.y[:-1], self.y[1:]
+        self.bbox = np.stack([
+            np.minimum(x0, x1) - MAX_SNAP_M, np.minimum(y0, y1) - MAX_SNAP_M,
+            np.maximum(x0, x1) + MAX_SNAP_M, np.maximum(y0, y1) + MAX_SNAP_M,
+        ], axis=1)
+
+        stop_along, _, _ = self.project(stop_lat, stop_lng)
+        # Stops are visited in order even where the line doubles back near one
+        self.stop_offsets = np.maximum.accumulate(stop_along)
+        self.stop_x, self.stop_y = self._to_xy(stop_lat, stop_lng)
+
+    @classmethod
+    def from_stops(cls, route_id: str, stop_lat, stop_lng, stop_names: list, stop_ids: list | None = None) -> "RouteGeometry":
+        """Straight legs between consecutive stops (routes have no stored shape yet)."""
+        return cls(route_id, stop_lat, stop_lng, stop_lat, stop_lng, stop_names, stop_ids)
+
+    @property
+    def length_m(self) -> float:
+        return float(self.offsets[-1])
+
+    @property
+    def nbytes(self) -> int:
+        return sum(a.nbytes for a in (self.x, self.y, self._dx, self._dy, self._length_sq,
+                                      self.offsets, self.bbox, self.stop_offsets, self.stop_x, self.stop_y))
+
+    def match_stops(self, lat, lng, max_distance_m: float) -> np.ndarray:
+        """
+        Index of the route's stop at each point of an ordered stop sequence, -1 where none.
+
+        Each point takes the nearest stop within `max_distance_m` after the
+        previous match, so a loop's repeated terminal resolves in order and
+        a sequence running the other way round the route does not match.
+        """
+        px, py = self._to_xy(np.atleast_1d(lat), np.atleast_1d(lng))
+        d2 = (px[:, None] - self.stop_x) ** 2 + (py[:, None] - self.stop_y) ** 2
+        d2[d2 > max_distance_m ** 2] = np.inf
+        out = np.full(px.shape[0], -1, dtype=np.int64)
+        after = 0
+        for i in range(px.shape[0]):
+            if after < d2.shape[1] and np.isfinite(d2[i, after:]).any():
+                out[i] = after + int(np.argmin(d2[i, after:]))
+                after = out[i] + 1
+        return out
+
+    def _to_xy(self, lat, lng):
+        return (np.asarray(lng, dtype=np.float64) * self._scale_x,
+                np.asarray(lat, dtype=np.float64) * self._scale_y)
+
+    def _project_onto(self, px, py, segment):
+        """Clamped projection of points onto (broadcastable) segment indices."""
+        ax, ay = px - self.x[segment], py - self.y[segment]
+        dx, dy = self._dx[segment], self._dy[segment]
+        t = np.clip((ax * dx + ay * dy) / self._length_sq[segment], 0.0, 1.0)
+        return t, (ax - t * dx) ** 2 + (ay - t * dy) ** 2
+
+    def project(self, lat, lng, hint=None):
+        """
+        Snap points to the route.
+
+        Args:
+            hint: Optional previous distance along the route per point (NaN
+                where unknown); only segments from there onwards are tried.
+
+        Returns:
+            (distance along the route, distance off it) in meters, and the segment index
+        """
+        px, py = self._to_xy(np.atleast_1d(lat), np.atleast_1d(lng))
+        n, n_segments = px.shape[0], self._dx.shape[0]
+        segment = np.full(n, -1, dtype=np.int64)
+        t_best = np.zeros(n)
+        d2_best = np.zeros(n)
+
+        if hint is not None:
+            hint = np.atleast_1d(np.asarray(hint, dtype=np.float64))
+            hinted = np.flatnonzero(np.isfinite(hint))
+            base = np.searchsorted(self.offsets, hint[hinted], side="right") - 1
+            candidates = np.clip(base[:, None] + np.arange(-1, SNAP_WINDOW), 0, n_segments - 1)
+            t, d2 = self._project_onto(px[hinted, None], py[hinted, None], candidates)
+            best = np.argmin(d2, axis=1)
+            rows = np.arange(hinted.shape[0])
+            near = d2[rows, best] <= MAX_SNAP_M ** 2
+            hinted, rows, best = hinted[near], rows[near], best[near]
+            segment[hinted] = candidates[rows, best]
+            t_best[hinted], d2_best[hinted] = t[rows, best], d2[rows, best]
+
+        rest = np.flatnonzero(segment < 0)
+        if rest.shape[0]:
+            bx, by = px[rest, None], py[rest, None]
+            inside = (bx >= self.bbox[:, 0]) & (by >= self.bbox[:, 1]) & (bx <= self.bbox[:, 2]) & (by <= self.bbox[:, 3])
+            # Off-route points have no box around them: every segment is a candidate
+            inside[~inside.any(axis=1)] = True
+            row, seg = np.nonzero(inside)
+            t, d2 = self._project_onto(px[rest[row]], py[rest[row]], seg)
+            # Nearest candidate per point: sort by (point, distance), keep the first of each point
+            order = np.lexsort((d2, row))
+            first = order[np.concatenate(([True], row[order][1:] != row[order][:-1]))]
+            segment[rest] = seg[first]
+            t_best[rest], d2_best[rest] = t[first], d2[first]
+
+        along = self.offsets[segment] + t_best * (self.offsets[segment + 1] - self.offsets[segment])
+        return along, np.sqrt(d2_best), segment
+
+    def next_stops(self, along):
+        """Index of the next stop (len(stops) past the last one) and the distance to it."""
+        index = np.searchsorted(self.stop_offsets, np.asarray(along) - AT_STOP_M, side="right")
+        ahead = index < self.stop_offsets.shape[0]
+        distance = np.where(ahead, self.stop_offsets[np.minimum(index, len(self.stop_names) - 1)] - along, np.nan)
+        return index, np.maximum(distance, 0.0)
+
+
+class RouteSnapper:
+    """
+    Route geometries for the whole network plus each vehicle's last snap.
+
+    Geometries are (re)built from the stops table on first use and after
+    `invalidate()` (called when routes are edited).
+    """
+
+    def __init__(self):
+        self.routes: dict[str, RouteGeometry] = {}
+        # stop_id -> (route_id, index of the stop on its route)
+        self.stops: dict[int, tuple[str, int]] = {}
+        # vehicle_id -> (route_id, lat, lng, SnapResult) of the last snap, used as the next hint
+        self._vehicles: dict[str, tuple] = {}
+        self._stale = True
+        self._lock = asyncio.Lock()
+
+    def invalidate(self) -> None:
+        self._stale = True
+
+    async def ensure_loaded(self, pool) -> None:
+        if not self._stale or pool is None:
+            return
+        async with self._lock:
+            if self._stale:
+                async with pool.acquire() as conn:
+                    rows = await conn.fetch(ROUTE_STOPS_QUERY)
+                self.load(rows)
+
+    def load(self, rows) -> None:
+        """Build geometries from (stop_id, route_id, stop_name, latitude, longitude) rows in stop order."""
+        stops: dict = {}
+        for row in rows:
+            stops.setdefault(row["route_id"], []).append(
+                (row["stop_id"], row["stop_name"], row["latitude"], row["longitude"])
+            )
+
+        routes = {}
+        for route_id, route_stops in stops.items():
+            if len(route_stops) < 2:
+                continue
+            ids, names, lats, lngs = zip(*route_stops)
+            routes[route_id] = RouteGeometry.from_stops(route_id, np.array(lats), np.array(lngs), names, ids)
+
+        self.routes = routes
+        self.stops = {
+            stop_id: (route_id, index)
+            for route_id, geometry in routes.items() for index, stop_id in enumerate(geometry.stop_ids)
+        }
+        self._vehicles.clear()
+        self._stale = False
+        logger.info("Route snapping: %d routes, %d KB of geometry", len(routes),
+                    sum(g.nbytes for g in routes.values()) // 1024)
+
+    def snap(self, vehicle_id: str, route_id: str, lat: float, lng: float) -> SnapResult | None:
+        return self.snap_many([vehicle_id], [route_id], [lat], [lng])[0]
+
+    def snap_many(self, vehicle_ids, route_ids, lats, lngs) -> list[SnapResult | None]:
+        """
+        Snap many vehicles at once, one vectorized projection per route.
+
+        Vehicles that have not moved since their last snap reuse it. Returns
+        None for vehicles whose route has no geometry.
+        """
+        results: list = [None] * len(vehicle_ids)
+        by_route: dict = {}
+        for i, (vehicle_id, route_id, lat, lng) in enumerate(zip(vehicle_ids, route_ids, lats, lngs)):
+            previous = self._vehicles.get(vehicle_id)
+            if previous is not None and previous[:3] == (route_id, lat, lng):
+                results[i] = previous[3]
+            elif route_id in self.routes:
+                hint = previous[3].distance_along_m if previous is not None and previous[0] == route_id else np.nan
+                by_route.setdefault(route_id, []).append((i, lat, lng, hint))
+
+        for route_id, pending in by_route.items():
+            geometry = self.routes[route_id]
+            index, lat, lng, hint = (np.array(column) for column in zip(*pending))
+            along, off_route, _ = geometry.project(lat, lng, hint)
+            stop_index, stop_distance = geometry.next_stops(along)
+            for k, i in enumerate(index.tolist()):
+                stop = int(stop_index[k])
+                has_next = stop < len(geometry.stop_names)
+                result = SnapResult(
+                    distance_along_m=round(float(along[k]), 1),
+                    off_route_m=round(float(off_route[k]), 1),
+                    next_stop_index=stop if has_next else None,
+                    next_stop=geometry.stop_names[stop] if has_next else None,
+                    next_stop_distance_m=round(float(stop_distance[k]), 1) if has_next else None,
+                )
+                self._vehicles[vehicle_ids[i]] = (route_id, lats[i], lngs[i], result)
+                results[i] = result
+        return results
+
+    def annotate(self, buses: list[dict]) -> list[dict]:
+        """Add SnapResult fields to live bus dicts (vehicle_id, route_id, lat, lng) in place."""
+        snaps = self.snap_many(
+            [b["vehicle_id"] for b in buses], [b["route_id"] for b in buses],
+            [b["lat"] for b in buses], [b["lng"] for b in buses],
+        )
+        for bus, snap in zip(buses, snaps):
+            if snap is not None:
+                bus.update(snap._asdict())
+        return buses
+
+
+route_snapper = RouteSnapper()
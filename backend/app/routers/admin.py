@@ -8,6 +8,10 @@ from pydantic import BaseModel, Field
 from typing import List
 from backend.app.auth import verify_token
 from backend.app.db.pool import get_pool
+from backend.app.route_snapping import route_snapper
+from backend.app.spatial_index import stop_index
+from backend.app.stop_boards import stop_boards
+from backend.app.vector_tiles import network_tiles
 
 logger = logging.getLogger("smart_transit.admin")
 router = APIRouter(prefix="/admin", tags=["Admin"])
@@ -55,6 +59,10 @@ async def create_route(route: RouteInput, _token: dict = Depends(verify_token)):
                     "INSERT INTO stops (route_id, stop_name, latitude, longitude, stop_sequence) VALUES ($1, $2, $3, $4, $5)",
                     route.route_id, stop.stop_name, stop.latitude, stop.longitude, idx,
                 )
+    route_snapper.invalidate()
+    stop_index.invalidate()
+    network_tiles.invalidate()
+    stop_boards.invalidate_route(route.route_id)
     return {"status": "created", "route_id": route.route_id}
 
 
@@ -63,6 +71,10 @@ async def delete_route(route_id: str, _token: dict = Depends(verify_token)):
     pool = _require_db()
     async with pool.acquire() as conn:
         result = await conn.execute("DELETE FROM routes WHERE route_id = $1", route_id)
+    route_snapper.invalidate()
+    stop_index.invalidate()
+    network_tiles.invalidate()
+    stop_boards.invalidate_route(route_id)
     return {"status": "deleted", "route_id": route_id}
 
 
@@ -98,6 +110,11 @@ async def ingest_gtfs_demo(_token: dict = Depends(verify_token)):
                     )
                 written += 1
 
+    route_snapper.invalidate()
+    stop_index.invalidate()
+    network_tiles.invalidate()
+    for route in routes:
+        stop_boards.invalidate_route(route["route_id"])
     logger.info("GTFS demo ingestion complete: %d routes written", written)
     return {"status": "success", "routes_ingested": written, "source": "demo"}
 
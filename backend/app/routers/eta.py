@@ -4,15 +4,37 @@ ML-powered ETA prediction endpoint.
 
 import logging
 from datetime import datetime
+from typing import Optional
+from zoneinfo import ZoneInfo
 
+import numpy as np
 from fastapi import APIRouter, HTTPException, Query
 
-from backend.app.models import ETAResponse
+from backend.app.config import settings
+from backend.app.metrics import MODEL_REGISTRY_LOOKUPS, MODEL_REGISTRY_RESIDENT_BYTES, MODEL_REGISTRY_RESIDENT_MODELS
+from backend.app.models import ETABatchRequest, ETABatchResponse, ETAResponse
 
 logger = logging.getLogger("smart_transit.eta")
 router = APIRouter(tags=["ML Prediction"])
 
 
+async def _predict_one(app, predictor, distance_meters: float, speed_kmh: float, hour_of_day: int) -> tuple[float, str]:
+    """Single prediction through the micro-batcher when one is running."""
+    # Convert speed from km/h to m/s for the predictor
+    current_speed_m_s = speed_kmh / 3.6
+
+    batcher = getattr(app.state, "eta_batcher", None)
+    if batcher is not None:
+        return await batcher.predict(distance_meters, current_speed_m_s, hour_of_day, predictor)
+
+    prediction_minutes = predictor.predict(
+        distance_meters=distance_meters,
+        current_speed=current_speed_m_s,
+        hour_of_day=hour_of_day,
+    )
+    return prediction_minutes, "ML_model" if predictor.ready else "rule_based_fallback"
+
+
 @router.get("/eta", response_model=ETAResponse)
 async def get_eta_prediction(
     distance_meters: float = Query(
@@ -21,9 +43,17 @@ async def get_eta_prediction(
     current_speed_kmh: float = Query(
         ..., ge=0, description="Vehicle speed in km/h"
     ),
+    route_id: Optional[str] = Query(
+        None, max_length=50, description="Route of the vehicle, to use its dedicated model if one exists"
+    ),
+    segment_index: Optional[int] = Query(
+        None, ge=0, description="Stop-to-stop segment the vehicle is on (0 = first to second stop), with route_id"
+    ),
 ):
     """
     Predicts ETA using the loaded ML model or a rule-based fallback.
+    With `route_id`, the route's own model is used when the registry has one;
+    adding `segment_index` blends in the segment's historical speed.
     """
     from backend.app.main import app
 
@@ -32,17 +62,46 @@ async def get_eta_prediction(
         raise HTTPException(status_code=503, detail="ETA predictor not initialized.")
 
     try:
-        # Convert speed from km/h to m/s for the predictor
-        current_speed_m_s = current_speed_kmh / 3.6
-        hour_of_day = datetime.now().hour
-
-        prediction_minutes = predictor.predict(
-            distance_meters=distance_meters,
-            current_speed=current_speed_m_s,
-            hour_of_day=hour_of_day,
-        )
+        # The clock the model's hour feature was trained on
+        now = datetime.now(ZoneInfo(settings.TRANSIT_TIMEZONE))
+        hour_of_day = now.hour
+        cache = getattr(app.state, "eta_cache", None)
 
-        source = "ML_model" if predictor.ready else "rule_based_fallback"
+        if route_id and segment_index is not None:
+            current_speed_kmh = predictor.blend_segment_speed(
+                current_speed_kmh, route_id, segment_index,
+                hour_of_week=now.weekday() * 24 + hour_of_day,
+                weight=settings.SEGMENT_SPEED_WEIGHT,
+            )
+
+        route_model = None
+        registry = getattr(app.state, "model_registry", None)
+        if registry is not None and route_id:
+            route_predictor, outcome = await registry.aresolve(route_id, hour_of_day)
+            MODEL_REGISTRY_LOOKUPS.labels(result=outcome).inc()
+            MODEL_REGISTRY_RESIDENT_MODELS.set(registry.resident_models)
+            MODEL_REGISTRY_RESIDENT_BYTES.set(registry.resident_bytes)
+            if route_predictor is not predictor:
+                # The file signature changes when the registry reloads the route's model
+                predictor = route_predictor
+                route_model = (route_predictor.model_path, route_predictor.model_signature)
+
+        if cache is not None and predictor.ready:
+            # Near-duplicate queries share the answer for their grid point
+            key = cache.key(distance_meters, current_speed_kmh, hour_of_day, route_model)
+            cached = cache.get(key, app.state.eta_predictor.model_version)
+            if cached is not None:
+                prediction_minutes, source = cached
+            else:
+                q_distance, q_speed_kmh, _ = cache.representative(key)
+                prediction_minutes, source = await _predict_one(app, predictor, q_distance, q_speed_kmh, hour_of_day)
+                # Fallback answers are cheap and often transient (pool saturation) — don't pin them
+                if source == "ML_model":
+                    cache.put(key, app.state.eta_predictor.model_version, prediction_minutes, source)
+        else:
+            prediction_minutes, source = await _predict_one(
+                app, predictor, distance_meters, current_speed_kmh, hour_of_day
+            )
 
         return ETAResponse(
             prediction=f"{prediction_minutes:.2f} mins",
@@ -53,3 +112,32 @@ async def get_eta_prediction(
     except Exception as e:
         logger.error("ML prediction error: %s", e)
         raise HTTPException(status_code=500, detail=f"Prediction failed: {e}")
+
+
+@router.post("/eta/batch", response_model=ETABatchResponse)
+async def get_eta_batch_prediction(batch: ETABatchRequest):
+    """
+    Predicts ETAs for many (distance, speed, hour) rows in one vectorized
+    model call. Results are returned in request order.
+    """
+    from backend.app.main import app
+
+    predictor = getattr(app.state, "eta_predictor", None)
+    if predictor is None:
+        raise HTTPException(status_code=503, detail="ETA predictor not initialized.")
+
+    try:
+        speeds_m_s = np.asarray(batch.speeds_kmh, dtype=np.float64) / 3.6
+        hours = batch.hours if batch.hours is not None else datetime.now(ZoneInfo(settings.TRANSIT_TIMEZONE)).hour
+
+        prediction_minutes, source = await predictor.apredict_batch(
+            distances_meters=batch.distances_meters,
+            current_speeds=speeds_m_s,
+            hours_of_day=hours,
+        )
+
+        return ETABatchResponse(seconds=(prediction_minutes * 60).tolist(), source=source)
+
+    except Exception as e:
+        logger.error("Batch ML prediction error: %s", e)
+        raise HTTPException(status_code=500, detail=f"Prediction failed: {e}")
@@ -0,0 +1,105 @@
+"""
+GTFS-Realtime feed endpoints for downstream trip planners.
+"""
+
+import hashlib
+import logging
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+
+from fastapi import APIRouter, Header, HTTPException, Response
+
+from backend.app.config import settings
+from backend.app.db.pool import get_pool
+from backend.app.gtfs_realtime import encode_vehicle_positions
+from backend.app.live_cache import get_active_fleet, tick_cache
+
+logger = logging.getLogger("smart_transit.gtfs_rt")
+router = APIRouter(prefix="/gtfs-rt", tags=["GTFS-Realtime"])
+
+PROTOBUF_MEDIA_TYPE = "application/x-protobuf"
+
+# ETag of the last feed built and when that content first appeared
+_feed_version: dict = {"etag": None, "modified": None}
+
+
+def _require_db():
+    pool = get_pool()
+    if pool is None:
+        raise HTTPException(status_code=503, detail="Database unavailable. Ensure Docker is running.")
+    return pool
+
+
+def _not_modified_since(if_modified_since: str | None, last_modified: datetime) -> bool:
+    """True when the client's copy is at least as new as `last_modified`."""
+    if not if_modified_since:
+        return False
+    try:
+        since = parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+    if since.tzinfo is None:
+        since = since.replace(tzinfo=timezone.utc)
+    # HTTP dates have one-second resolution
+    return int(last_modified.timestamp()) <= int(since.timestamp())
+
+
+def _version(payload: bytes) -> tuple[str, datetime]:
+    """
+    ETag and Last-Modified of an encoded feed.
+
+    Both follow the content: Last-Modified is set to the current second
+    only when the payload changes, so a bus ageing out of the feed is a
+    modification too. It never runs ahead of the Date header; changes
+    within the same second are told apart by the ETag alone.
+    """
+    etag = f'"{hashlib.sha1(payload).hexdigest()[:16]}"'
+    if etag != _feed_version["etag"]:
+        _feed_version.update(etag=etag, modified=datetime.now(timezone.utc).replace(microsecond=0))
+    return etag, _feed_version["modified"]
+
+
+async def _build_vehicle_positions() -> tuple[bytes, str, datetime]:
+    fleet = await get_active_fleet()
+    buses = fleet.value
+    # Header timestamp: the newest ping the feed reflects
+    feed_time = max((b["last_update"] for b in buses), default=fleet.built_at)
+    payload = encode_vehicle_positions(buses, feed_time)
+    return (payload, *_version(payload))
+
+
+@router.get(
+    "/vehicle-positions",
+    response_class=Response,
+    responses={200: {"content": {PROTOBUF_MEDIA_TYPE: {}}}, 304: {"description": "Not Modified"}},
+)
+async def get_vehicle_positions(
+    if_none_match: str | None = Header(default=None),
+    if_modified_since: str | None = Header(default=None),
+):
+    """
+    Live fleet as a GTFS-Realtime VehiclePositions FeedMessage.
+    The encoded feed is built at most once per tick and shared by all consumers.
+    """
+    _require_db()
+
+    try:
+        cached = await tick_cache.get("gtfs_rt:vehicle_positions", _build_vehicle_positions)
+    except Exception as e:
+        logger.error("GTFS-RT feed build error: %s", e)
+        raise HTTPException(status_code=500, detail=str(e))
+
+    payload, etag, last_modified = cached.value
+    headers = {
+        "ETag": etag,
+        "Last-Modified": format_datetime(last_modified, usegmt=True),
+        "Cache-Control": f"public, max-age={max(1, int(settings.LIVE_TICK_SECONDS))}",
+    }
+    # If-None-Match takes precedence over If-Modified-Since (RFC 9110)
+    if if_none_match is not None:
+        not_modified = etag in {tag.strip() for tag in if_none_match.split(",")}
+    else:
+        not_modified = _not_modified_since(if_modified_since, last_modified)
+    if not_modified:
+        return Response(status_code=304, headers=headers)
+    return Response(content=payload, media_type=PROTOBUF_MEDIA_TYPE, headers=headers)
@@ -18,7 +18,7 @@ def health_check():
     db_status = "connected" if pool is not None else "disconnected"
 
     predictor = getattr(app.state, "eta_predictor", None)
-    ml_status = "loaded" if (predictor and predictor.ready) else "fallback"
+    ml_status = predictor.status if predictor else "fallback"
 
     return HealthResponse(
         status="online",
@@ -2,9 +2,23 @@
 Static route and stop data endpoints.
 """
 
+import asyncio
 import logging
-from fastapi import APIRouter, HTTPException
+from typing import List, Optional
+
+import numpy as np
+from fastapi import APIRouter, HTTPException, Response
+
 from backend.app.db.pool import get_pool
+from backend.app.headways import headway_monitor
+from backend.app.live_cache import get_active_fleet, tick_cache
+from backend.app.models import (
+    BusStopETAs, ETAMatrixResponse, HeadwayAlert, RouteAdherence, RouteHeadways, RoutePath, StopETA,
+)
+from backend.app.path_service import path_service
+from backend.app.route_snapping import route_snapper
+from backend.app.schedule_adherence import schedule_adherence
+from backend.app.stop_boards import predict_downstream
 
 logger = logging.getLogger("smart_transit.routes")
 router = APIRouter(tags=["Routes"])
@@ -53,3 +67,146 @@ async def get_static_routes():
     except Exception as e:
         logger.error("Route fetch error: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
+
+
+async def _build_eta_matrix(route_id: str) -> bytes:
+    """
+    ETAs from every active bus on the route to each downstream stop, as JSON.
+
+    Distances are differences of positions along the route; all of them go
+    through the model in one batched call.
+    """
+    from backend.app.main import app
+
+    geometry = route_snapper.routes[route_id]
+    fleet = await get_active_fleet()
+    buses = [b for b in fleet.value if b["route_id"] == route_id]
+    snaps = route_snapper.snap_many(
+        [b["vehicle_id"] for b in buses], [route_id] * len(buses), [b["lat"] for b in buses], [b["lng"] for b in buses],
+    )
+
+    n_stops = len(geometry.stop_names)
+    bus_index, stop_index, distances, seconds, source = await predict_downstream(
+        app, route_id, geometry,
+        along=[s.distance_along_m for s in snaps],
+        first_stop=[n_stops if s.next_stop_index is None else s.next_stop_index for s in snaps],
+        speeds_kmh=[b["speed"] for b in buses],
+    )
+
+    bounds = np.searchsorted(bus_index, np.arange(len(buses) + 1))
+    stop_index, distances, seconds = stop_index.tolist(), distances.round(1).tolist(), seconds.round(1).tolist()
+    response = ETAMatrixResponse(
+        route_id=route_id,
+        generated_at=fleet.built_at.isoformat(),
+        source=source,
+        stops=geometry.stop_names,
+        buses=[
+            BusStopETAs(
+                vehicle_id=bus["vehicle_id"],
+                distance_along_m=snap.distance_along_m,
+                speed=bus["speed"],
+                etas=[
+                    StopETA(stop_index=k, stop=geometry.stop_names[k], distance_m=d, seconds=s)
+                    for k, d, s in zip(stop_index[lo:hi], distances[lo:hi], seconds[lo:hi])
+                ],
+            )
+            for bus, snap, lo, hi in zip(buses, snaps, bounds[:-1], bounds[1:])
+        ],
+    )
+    return response.model_dump_json().encode()
+
+
+@router.get(
+    "/routes/{route_id}/eta-matrix",
+    response_class=Response,
+    responses={200: {"model": ETAMatrixResponse}, 404: {"description": "Unknown route"}},
+)
+async def get_route_eta_matrix(route_id: str):
+    """
+    Predicted arrival of every active bus on the route at every stop ahead of it.
+    Computed once per tick in a single vectorized pass and shared by all readers.
+    """
+    from backend.app.main import app
+
+    pool = _require_db()
+    if getattr(app.state, "eta_predictor", None) is None:
+        raise HTTPException(status_code=503, detail="ETA predictor not initialized.")
+
+    try:
+        await route_snapper.ensure_loaded(pool)
+    except Exception as e:
+        logger.error("Route geometry load error: %s", e)
+        raise HTTPException(status_code=500, detail=str(e))
+    if route_id not in route_snapper.routes:
+        raise HTTPException(status_code=404, detail=f"Route '{route_id}' not found or has fewer than two stops.")
+
+    try:
+        cached = await tick_cache.get(f"eta_matrix:{route_id}", lambda: _build_eta_matrix(route_id))
+    except Exception as e:
+        logger.error("ETA matrix error for %s: %s", route_id, e)
+        raise HTTPException(status_code=500, detail=f"Prediction failed: {e}")
+    return Response(content=cached.value, media_type="application/json")
+
+
+@router.get("/routes/{route_id}/path", response_model=RoutePath)
+async def get_route_path(route_id: str):
+    """
+    Road path through the route's stops in order.
+    Resolved through the path service once and then served from its cache,
+    so map clients never call the routing backend themselves.
+    """
+    pool = _require_db()
+
+    try:
+        async with pool.acquire() as conn:
+            rows = await conn.fetch(
+                "SELECT latitude, longitude FROM stops WHERE route_id = $1 ORDER BY stop_sequence, stop_id",
+                route_id,
+            )
+    except Exception as e:
+        logger.error("Route path stops error for %s: %s", route_id, e)
+        raise HTTPException(status_code=500, detail=str(e))
+    if len(rows) < 2:
+        raise HTTPException(status_code=404, detail=f"Route '{route_id}' not found or has fewer than two stops.")
+
+    coords = [(float(r["latitude"]), float(r["longitude"])) for r in rows]
+    path, source = await asyncio.to_thread(path_service.resolve, coords)
+    return RoutePath(route_id=route_id, source=source, coordinates=[[lat, lng] for lat, lng in path])
+
+
+@router.get("/routes/{route_id}/headways", response_model=RouteHeadways)
+async def get_route_headways(route_id: str):
+    """
+    Live spacing of the route's buses, the distribution of recent headways
+    and any bunching or gap alerts. Kept up to date incrementally as buses ping.
+    """
+    report = headway_monitor.route_headways(route_id)
+    if report is None:
+        raise HTTPException(status_code=404, detail=f"No active buses on route '{route_id}'.")
+    return report
+
+
+@router.get("/headways/alerts", response_model=List[HeadwayAlert])
+async def get_headway_alerts(route_id: Optional[str] = None):
+    """Active bunching and gap alerts, across all routes or for one."""
+    return headway_monitor.alerts(route_id)
+
+
+@router.get("/routes/{route_id}/adherence", response_model=RouteAdherence)
+async def get_route_adherence(route_id: str):
+    """
+    Delay of each live bus on the route against the trip it was matched to
+    in today's GTFS timetable, a summary of those delays and the scheduled
+    trips that no bus is running.
+    """
+    pool = _require_db()
+    try:
+        await schedule_adherence.ensure_loaded(pool)
+    except Exception as e:
+        logger.error("Error loading GTFS schedule: %s", e)
+        raise HTTPException(status_code=500, detail=str(e))
+
+    report = schedule_adherence.route_adherence(route_id)
+    if report is None:
+        raise HTTPException(status_code=404, detail=f"No scheduled trips for route '{route_id}' today.")
+    return report
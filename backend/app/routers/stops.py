@@ -0,0 +1,73 @@
+"""
+Stop-centric endpoints: arrival boards for station displays and the commuter view.
+"""
+
+import logging
+from typing import List
+
+from fastapi import APIRouter, HTTPException, Query
+
+from backend.app.db.pool import get_pool
+from backend.app.models import NearbyStop, StopArrivalsResponse
+from backend.app.route_snapping import route_snapper
+from backend.app.spatial_index import stop_index
+from backend.app.stop_boards import stop_boards
+
+logger = logging.getLogger("smart_transit.stops")
+router = APIRouter(tags=["Stops"])
+
+
+def _require_db():
+    pool = get_pool()
+    if pool is None:
+        raise HTTPException(status_code=503, detail="Database unavailable. Ensure Docker is running.")
+    return pool
+
+
+# Declared before the /stops/{stop_id} routes
+@router.get("/stops/nearby", response_model=List[NearbyStop])
+async def get_nearby_stops(
+    lat: float = Query(..., ge=-90, le=90, description="Latitude"),
+    lng: float = Query(..., ge=-180, le=180, description="Longitude"),
+    radius: float = Query(400, gt=0, le=5000, description="Search radius in meters"),
+    limit: int = Query(20, ge=1, le=200, description="Maximum number of stops"),
+):
+    """
+    Stops within `radius` meters of a point, nearest first.
+    Answered from an in-memory grid index; only nearby cells are measured.
+    """
+    pool = _require_db()
+    try:
+        await stop_index.ensure_loaded(pool)
+    except Exception as e:
+        logger.error("Stop index load error: %s", e)
+        raise HTTPException(status_code=500, detail=str(e))
+    return stop_index.nearby(lat, lng, radius, limit)
+
+
+@router.get("/stops/{stop_id}/arrivals", response_model=StopArrivalsResponse)
+async def get_stop_arrivals(
+    stop_id: int,
+    limit: int = Query(5, ge=1, le=50, description="Number of arrivals to return"),
+):
+    """
+    Next buses due at a stop, soonest first.
+    Served from the in-memory board that every bus ping keeps current.
+    """
+    pool = _require_db()
+    try:
+        await route_snapper.ensure_loaded(pool)
+    except Exception as e:
+        logger.error("Route geometry load error: %s", e)
+        raise HTTPException(status_code=500, detail=str(e))
+
+    stop = route_snapper.stops.get(stop_id)
+    if stop is None:
+        raise HTTPException(status_code=404, detail=f"Stop {stop_id} not found.")
+    route_id, index = stop
+    return StopArrivalsResponse(
+        stop_id=stop_id,
+        stop=route_snapper.routes[route_id].stop_names[index],
+        route_id=route_id,
+        arrivals=stop_boards.arrivals(stop_id, limit),
+    )
@@ -0,0 +1,48 @@
+"""
+Vector tile endpoint for map clients.
+"""
+
+import logging
+
+from fastapi import APIRouter, Header, HTTPException, Response
+
+from backend.app.db.pool import get_pool
+from backend.app.vector_tiles import MAX_ZOOM, MVT_MEDIA_TYPE, network_tiles
+
+logger = logging.getLogger("smart_transit.tiles")
+router = APIRouter(tags=["Routes"])
+
+
+def _require_db():
+    pool = get_pool()
+    if pool is None:
+        raise HTTPException(status_code=503, detail="Database unavailable. Ensure Docker is running.")
+    return pool
+
+
+@router.get(
+    "/tiles/{z}/{x}/{y}.mvt",
+    response_class=Response,
+    responses={200: {"content": {MVT_MEDIA_TYPE: {}}}, 304: {"description": "Not Modified"}},
+)
+async def get_tile(z: int, x: int, y: int, if_none_match: str | None = Header(default=None)):
+    """
+    Route lines ("routes" layer) and stops ("stops" layer, zoom 13 and up)
+    as a Mapbox Vector Tile. Lines are simplified for the tile's zoom level.
+    """
+    pool = _require_db()
+    if not 0 <= z <= MAX_ZOOM or not (0 <= x < 1 << z and 0 <= y < 1 << z):
+        raise HTTPException(status_code=404, detail="Tile out of range")
+
+    try:
+        await network_tiles.ensure_loaded(pool)
+        data, version = await network_tiles.tile(z, x, y)
+    except Exception as e:
+        logger.error("Tile %d/%d/%d error: %s", z, x, y, e)
+        raise HTTPException(status_code=500, detail=str(e))
+
+    # The network version changes with every admin or GTFS write
+    headers = {"ETag": f'"{version}"', "Cache-Control": "public, max-age=300"}
+    if if_none_match == headers["ETag"]:
+        return Response(status_code=304, headers=headers)
+    return Response(content=data, media_type=MVT_MEDIA_TYPE, headers=headers)
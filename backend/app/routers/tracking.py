@@ -4,14 +4,21 @@ GPS tracking endpoints — receive pings and serve live positions.
 
 import logging
 from datetime import datetime, timezone
-from typing import List
+from typing import List, Optional
 
-from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
 
 from backend.app.auth import verify_api_key
 from backend.app.models import GPSPing, BusPosition, TelemetryPing
 from backend.app.db.pool import get_pool
+from backend.app.headways import headway_monitor
+from backend.app.live_cache import get_live_buses as live_bus_positions
 from backend.app.rate_limit import limiter
+from backend.app.route_snapping import route_snapper
+from backend.app.schedule_adherence import schedule_adherence
+from backend.app.spatial_index import parse_bbox, vehicle_grid
+from backend.app.stop_boards import update_from_ping
+from backend.app.stop_events import stop_event_detector
 
 logger = logging.getLogger("smart_transit.tracking")
 router = APIRouter(tags=["Tracking"])
@@ -77,11 +84,45 @@ async def receive_location_ping(
                 ping.passenger_count,
                 ts,
             )
-        return {"status": "success", "vehicle": ping.vehicle_id}
     except Exception as e:
         logger.error("Error saving GPS ping for %s: %s", ping.vehicle_id, e)
         raise HTTPException(status_code=500, detail=str(e))
 
+    try:
+        from backend.app.main import app
+
+        vehicle_grid.update({
+            "vehicle_id": ping.vehicle_id,
+            "route_id": ping.route_id,
+            "lat": ping.lat,
+            "lng": ping.lng,
+            "speed": ping.speed,
+            "passenger_count": ping.passenger_count,
+            "last_update": ts,
+        })
+        # Keeps the vehicle's position along its route current, as the hint for its next ping
+        await route_snapper.ensure_loaded(pool)
+        snap = route_snapper.snap(ping.vehicle_id, ping.route_id, ping.lat, ping.lng)
+        geometry = route_snapper.routes.get(ping.route_id)
+        stop_event_detector.observe(ping.vehicle_id, ping.route_id, geometry, snap, ts)
+        if snap is not None:
+            alerts = headway_monitor.update(ping.vehicle_id, ping.route_id, snap.distance_along_m, ping.speed, geometry.length_m)
+            await schedule_adherence.ensure_loaded(pool)
+            schedule_adherence.observe(ping.vehicle_id, ping.route_id, snap.distance_along_m, ts)
+        else:
+            alerts = headway_monitor.remove(ping.vehicle_id)
+            schedule_adherence.release(ping.vehicle_id)
+        if alerts:
+            from backend.app.routers.websocket import broadcast
+            for alert in alerts:
+                await broadcast(alert)
+        if getattr(app.state, "eta_predictor", None) is not None:
+            await update_from_ping(app, ping.vehicle_id, ping.route_id, snap, ping.speed, ts)
+    except Exception as e:
+        # The ping is stored; derived live views catch up on the next one
+        logger.warning("Could not update live views for %s: %s", ping.vehicle_id, e)
+    return {"status": "success", "vehicle": ping.vehicle_id}
+
 
 @router.post("/location/telemetry")
 async def receive_telemetry_ping(
@@ -102,8 +143,8 @@ async def receive_telemetry_ping(
             await conn.execute(query, ping.passenger_count, ts, ping.vehicle_id)
         
         # Also broadcast via websocket
-        from backend.app.routers.websocket import broadcast_location
-        await broadcast_location({
+        from backend.app.routers.websocket import broadcast
+        await broadcast({
             "vehicle_id": ping.vehicle_id,
             "passenger_count": ping.passenger_count,
             "type": "telemetry"
@@ -116,36 +157,25 @@ async def receive_telemetry_ping(
 
 
 @router.get("/buses/live", response_model=List[BusPosition])
-async def get_live_buses():
+async def get_live_buses(
+    bbox: Optional[str] = Query(
+        None, description="Only buses inside min_lng,min_lat,max_lng,max_lat (e.g. the map viewport)"
+    ),
+):
     """
     Returns the latest known position for every active bus.
     Filters to only buses seen in the last 5 minutes for performance.
+    Each bus is snapped to its route for its distance along it and next stop,
+    and matched to its scheduled trip for its delay when a GTFS feed is configured.
     """
-    pool = _require_db()
-
-    query = """
-        SELECT vehicle_id, route_id, latitude, longitude, speed, passenger_count, last_update
-        FROM vehicle_latest_positions
-        WHERE last_update > NOW() - INTERVAL '5 minutes'
-        ORDER BY vehicle_id
-    """
+    _require_db()
+    try:
+        box = parse_bbox(bbox) if bbox is not None else None
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
 
     try:
-        async with pool.acquire() as conn:
-            rows = await conn.fetch(query)
-
-        return [
-            BusPosition(
-                vehicle_id=row["vehicle_id"],
-                route_id=row["route_id"],
-                lat=row["latitude"],
-                lng=row["longitude"],
-                speed=row["speed"],
-                passenger_count=row["passenger_count"],
-                last_update=row["last_update"].isoformat(),
-            )
-            for row in rows
-        ]
+        return [BusPosition(**bus) for bus in await live_bus_positions(box)]
     except Exception as e:
         logger.error("Error fetching live buses: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
@@ -1,5 +1,5 @@
 """
-WebSocket endpoint for real-time bus position streaming.
+WebSocket endpoints for real-time bus positions and stop arrival boards.
 """
 
 import asyncio
@@ -8,52 +8,113 @@ import logging
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect
 
 from backend.app.db.pool import get_pool
+from backend.app.live_cache import get_live_buses
+from backend.app.spatial_index import parse_bbox
+from backend.app.stop_boards import Subscription, stop_boards
 
 logger = logging.getLogger("smart_transit.websocket")
 router = APIRouter(tags=["Tracking"])
 
 connected_clients: set[WebSocket] = set()
+# A client that takes longer than this to accept a broadcast is dropped
+BROADCAST_TIMEOUT_SECONDS = 2.0
+
+
+async def broadcast(message: dict) -> None:
+    """Send an event (telemetry, headway alerts) to every /ws/buses client at once."""
+
+    async def send(websocket: WebSocket) -> None:
+        try:
+            await asyncio.wait_for(websocket.send_json(message), BROADCAST_TIMEOUT_SECONDS)
+        except Exception:
+            connected_clients.discard(websocket)
+
+    await asyncio.gather(*(send(ws) for ws in list(connected_clients)))
 
 
 @router.websocket("/ws/buses")
 async def bus_positions_ws(websocket: WebSocket):
-    """Push active bus positions to connected clients every second."""
+    """
+    Push active bus positions to connected clients every second, plus
+    telemetry and headway alert events as they happen.
+
+    Clients may send {"type": "viewport", "bbox": [min_lng, min_lat, max_lng, max_lat]}
+    to receive only the buses inside it (a null bbox returns to the whole
+    fleet); the next update is sent at once for the new viewport.
+    """
     await websocket.accept()
     connected_clients.add(websocket)
     logger.info("WebSocket client connected. Total: %d", len(connected_clients))
 
-    query = """
-        SELECT vehicle_id, route_id, latitude, longitude, speed, last_update
-        FROM vehicle_latest_positions
-        WHERE last_update > NOW() - INTERVAL '5 minutes'
-        ORDER BY vehicle_id
-    """
+    viewport = {"bbox": None}
+    changed = asyncio.Event()
 
-    try:
+    async def receive():
         while True:
-            buses = []
-            pool = get_pool()
-            if pool is not None:
-                async with pool.acquire() as conn:
-                    rows = await conn.fetch(query)
-                    buses = [
-                        {
-                            "vehicle_id": row["vehicle_id"],
-                            "route_id": row["route_id"],
-                            "lat": float(row["latitude"]),
-                            "lng": float(row["longitude"]),
-                            "speed": float(row["speed"]),
-                            "last_update": row["last_update"].isoformat(),
-                        }
-                        for row in rows
-                    ]
+            message = await websocket.receive_json()
+            if not isinstance(message, dict) or message.get("type") != "viewport":
+                continue
+            try:
+                bbox = message.get("bbox")
+                viewport["bbox"] = parse_bbox(bbox) if bbox is not None else None
+            except ValueError as exc:
+                await websocket.send_json({"type": "error", "detail": str(exc)})
+                continue
+            changed.set()
 
+    receiver = asyncio.create_task(receive())
+    try:
+        while not receiver.done():
+            changed.clear()
+            buses = await get_live_buses(viewport["bbox"]) if get_pool() is not None else []
             await websocket.send_json({"type": "bus_update", "buses": buses})
-            await asyncio.sleep(1)
+            # Sleep for a second, waking early for a new viewport or a disconnect
+            waiter = asyncio.create_task(changed.wait())
+            await asyncio.wait([receiver, waiter], timeout=1, return_when=asyncio.FIRST_COMPLETED)
+            waiter.cancel()
+        receiver.result()
     except WebSocketDisconnect:
         pass
     except Exception as exc:
         logger.error("WebSocket streaming error: %s", exc)
     finally:
+        receiver.cancel()
         connected_clients.discard(websocket)
         logger.info("WebSocket client disconnected. Total: %d", len(connected_clients))
+
+
+@router.websocket("/ws/stops")
+async def stop_boards_ws(websocket: WebSocket):
+    """
+    Push arrival boards for chosen stops whenever they change.
+
+    Clients send {"action": "subscribe" | "unsubscribe", "stop_ids": [...]};
+    each subscribed stop's current board is sent at once, then again on every change.
+    """
+    await websocket.accept()
+    subscription = Subscription()
+
+    async def forward():
+        while True:
+            await websocket.send_json(await subscription.queue.get())
+
+    sender = asyncio.create_task(forward())
+    try:
+        while True:
+            message = await websocket.receive_json()
+            try:
+                stop_ids = [int(stop_id) for stop_id in message.get("stop_ids", [])]
+            except (AttributeError, TypeError, ValueError):
+                await websocket.send_json({"type": "error", "detail": "stop_ids must be a list of integers"})
+                continue
+            if message.get("action", "subscribe") == "unsubscribe":
+                stop_boards.unsubscribe(subscription, stop_ids)
+            else:
+                stop_boards.subscribe(subscription, stop_ids)
+    except WebSocketDisconnect:
+        pass
+    except Exception as exc:
+        logger.error("Stop board WebSocket error: %s", exc)
+    finally:
+        sender.cancel()
+        stop_boards.unsubscribe(subscription)
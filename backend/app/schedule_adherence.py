@@ -0,0 +1,478 @@
+"""
+Schedule adherence of live buses against the GTFS timetable.
+
+The trips running on today's service (and yesterday's, for trips past
+midnight) are read from the feed at GTFS_FEED_PATH into flat arrays per
+trip: stop coordinates from stops.txt, scheduled arrival and departure in
+seconds from the start of the service day. Each trip is then placed on
+its route by matching its stops, in order, to the ingested stops by
+position, which gives every scheduled stop a distance along the route
+geometry. Trips that do not run the ingested pattern in its direction
+(the opposite direction, or stops that are not on it) are left out;
+short-turn and express trips are placed on the stops they serve.
+
+A snapped ping (distance along the route, timestamp) becomes a delay with
+one binary search in its trip: the scheduled time at that position is the
+dwell window of the stop it is at, or interpolated by distance between
+the departure from the stop behind it and the arrival at the stop ahead.
+Vehicles keep the trip they were matched to while the delay stays
+plausible; otherwise the route's trips scheduled around that time are
+tried and the one with the smallest delay wins, preferring trips no other
+bus holds.
+"""
+
+import asyncio
+import bisect
+import csv
+import io
+import logging
+import time
+import zipfile
+from datetime import date, datetime, time as dtime, timedelta, timezone
+from pathlib import Path
+from typing import NamedTuple
+from zoneinfo import ZoneInfo
+
+import numpy as np
+
+from backend.app.config import settings
+from backend.app.route_snapping import AT_STOP_M, route_snapper
+
+logger = logging.getLogger("smart_transit.schedule_adherence")
+
+# A trip can be matched this long before its first departure...
+EARLY_SLACK_S = 600
+# ...and a bus further behind schedule than this is not on that trip
+MAX_DELAY_S = 1800
+# Delays within [-ON_TIME_EARLY_S, ON_TIME_LATE_S] count as on time
+ON_TIME_EARLY_S = 60
+ON_TIME_LATE_S = 300
+# Vehicles silent for longer than this release their trip
+STALE_SECONDS = 300.0
+# After the feed fails to load it is retried no sooner than this
+FEED_RETRY_SECONDS = 300.0
+# A feed stop this close to an ingested stop of the route is that stop
+STOP_MATCH_M = 25.0
+
+WEEKDAYS = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+
+
+def parse_gtfs_time(value: str) -> int:
+    """Seconds from the start of the service day of an H:MM:SS time (hours may exceed 24)."""
+    h, m, s = value.strip().split(":")
+    return int(h) * 3600 + int(m) * 60 + int(s)
+
+
+def service_day_start(service_date: date, tz) -> datetime:
+    """GTFS times count from noon minus 12 h local time, which differs from midnight on DST days."""
+    return datetime.combine(service_date, dtime(12), tzinfo=tz).astimezone(timezone.utc) - timedelta(hours=12)
+
+
+def _rows(path: Path, name: str):
+    if path.is_dir():
+        with open(path / name, newline="", encoding="utf-8-sig") as f:
+            yield from csv.DictReader(f)
+    else:
+        with zipfile.ZipFile(path) as zf, zf.open(name) as raw:
+            yield from csv.DictReader(io.TextIOWrapper(raw, encoding="utf-8-sig", newline=""))
+
+
+def feed_tables(path) -> dict:
+    """Lazily read tables of a GTFS zip or directory, by file name; absent files are left out."""
+    path = Path(path)
+    if path.is_dir():
+        names = {p.name for p in path.iterdir()}
+    else:
+        with zipfile.ZipFile(path) as zf:
+            names = set(zf.namelist())
+    wanted = ("agency.txt", "calendar.txt", "calendar_dates.txt", "stops.txt", "trips.txt", "stop_times.txt")
+    return {name: _rows(path, name) for name in wanted if name in names}
+
+
+def active_services(calendar: list[dict], calendar_dates: list[dict], day: date) -> set[str] | None:
+    """service_ids running on `day`; None when the feed has no calendar (every service runs)."""
+    if not calendar and not calendar_dates:
+        return None
+    stamp = day.strftime("%Y%m%d")
+    weekday = WEEKDAYS[day.weekday()]
+    services = {
+        c["service_id"] for c in calendar
+        if c.get(weekday) == "1" and c.get("start_date", stamp) <= stamp <= c.get("end_date", stamp)
+    }
+    for d in calendar_dates:
+        if d["date"] == stamp:
+            if d["exception_type"] == "1":
+                services.add(d["service_id"])
+            elif d["exception_type"] == "2":
+                services.discard(d["service_id"])
+    return services
+
+
+class Trip(NamedTuple):
+    trip_id: str
+    route_id: str
+    stop_lat: np.ndarray   # float64, in stop_sequence order
+    stop_lng: np.ndarray   # float64
+    arrival: np.ndarray    # int32 seconds from the start of the service day
+    departure: np.ndarray  # int32
+
+
+class Timetable:
+    """Trips running on one service day, grouped by route."""
+
+    def __init__(self, service_date: date, tz, trips: list[Trip]):
+        self.service_date = service_date
+        self.tz = tz
+        self.start = service_day_start(service_date, tz)
+        self.trips: dict[str, list[Trip]] = {}
+        for trip in trips:
+            self.trips.setdefault(trip.route_id, []).append(trip)
+
+    def seconds(self, ts: datetime) -> float:
+        if ts.tzinfo is None:
+            ts = ts.replace(tzinfo=timezone.utc)
+        return (ts - self.start).total_seconds()
+
+    @property
+    def nbytes(self) -> int:
+        return sum(t.stop_lat.nbytes + t.stop_lng.nbytes + t.arrival.nbytes + t.departure.nbytes
+                   for trips in self.trips.values() for t in trips)
+
+
+def build_timetable(tables: dict, service_date: date | None = None) -> Timetable:
+    """
+    Timetable of the trips running on `service_date` (today in the agency's
+    timezone by default) from GTFS tables given as iterables of row dicts.
+    Trips of the previous service day are included, shifted onto this one,
+    while they can still be running.
+    """
+    agency = list(tables.get("agency.txt", ()))
+    tz = ZoneInfo(agency[0]["agency_timezone"]) if agency and agency[0].get("agency_timezone") else timezone.utc
+    if service_date is None:
+        service_date = datetime.now(tz).date()
+    yesterday = service_date - timedelta(days=1)
+    calendar = list(tables.get("calendar.txt", ()))
+    calendar_dates = list(tables.get("calendar_dates.txt", ()))
+    today_services = active_services(calendar, calendar_dates, service_date)
+    yesterday_services = active_services(calendar, calendar_dates, yesterday)
+    # Yesterday's clock, in seconds from the start of today's service day
+    yesterday_shift = int((service_day_start(yesterday, tz) - service_day_start(service_date, tz)).total_seconds())
+
+    # trip_id -> (route_id, [shifts of the service days it runs on])
+    runs: dict[str, tuple[str, list[int]]] = {}
+    for t in tables["trips.txt"]:
+        shifts = []
+        if today_services is None or t["service_id"] in today_services:
+            shifts.append(0)
+        if yesterday_services is None or t["service_id"] in yesterday_services:
+            shifts.append(yesterday_shift)
+        if shifts:
+            runs[t["trip_id"]] = (t["route_id"], shifts)
+
+    stop_times: dict[str, list[tuple[int, int, int, str]]] = {}
+    for st in tables["stop_times.txt"]:
+        trip_id = st["trip_id"]
+        if trip_id not in runs:
+            continue
+        arrival, departure = st.get("arrival_time", "").strip(), st.get("departure_time", "").strip()
+        if not arrival and not departure:
+            # Not a timepoint; the times on either side are interpolated across it
+            continue
+        arrival_s = parse_gtfs_time(arrival or departure)
+        departure_s = parse_gtfs_time(departure or arrival)
+        stop_times.setdefault(trip_id, []).append(
+            (int(st["stop_sequence"]), arrival_s, departure_s, st["stop_id"])
+        )
+
+    used = {row[3] for rows in stop_times.values() for row in rows}
+    coords = {
+        s["stop_id"]: (float(s["stop_lat"]), float(s["stop_lon"]))
+        for s in tables.get("stops.txt", ()) if s["stop_id"] in used
+    }
+
+    trips = []
+    for trip_id, rows in stop_times.items():
+        if len(rows) < 2 or any(row[3] not in coords for row in rows):
+            continue
+        route_id, shifts = runs[trip_id]
+        rows.sort(key=lambda row: row[0])
+        arrival, departure = np.array([row[1:3] for row in rows], dtype=np.int32).T
+        stop_lat, stop_lng = np.array([coords[row[3]] for row in rows], dtype=np.float64).T
+        for shift in shifts:
+            if shift and arrival[-1] + shift + MAX_DELAY_S < 0:
+                # Finished before today's service day began
+                continue
+            trips.append(Trip(trip_id, route_id, stop_lat, stop_lng, arrival + shift, departure + shift))
+    return Timetable(service_date, tz, trips)
+
+
+def load_feed(path, service_date: date | None = None) -> Timetable:
+    """Timetable from a GTFS zip file or directory. Blocking; call through a thread from async code."""
+    return build_timetable(feed_tables(path), service_date)
+
+
+class _RouteSchedule:
+    """One route's trips placed on its geometry, sorted by first departure."""
+
+    def __init__(self, trips: list[tuple[Trip, np.ndarray]]):
+        trips.sort(key=lambda item: int(item[0].departure[0]))
+        self.trip_ids = [trip.trip_id for trip, _ in trips]
+        self.along = [along for _, along in trips]
+        self.arrival = [trip.arrival for trip, _ in trips]
+        self.departure = [trip.departure for trip, _ in trips]
+        self.starts = [int(trip.departure[0]) for trip, _ in trips]
+        # A trip running on consecutive service days appears once per day
+        self.index = {key: i for i, key in enumerate(zip(self.trip_ids, self.starts))}
+        self.ends = [int(trip.arrival[-1]) for trip, _ in trips]
+        self.longest = max((end - start for start, end in zip(self.starts, self.ends)), default=0)
+
+    def delay(self, i: int, along: float, now: float) -> float:
+        """Seconds behind schedule (negative when early) of trip i at `along` meters at time `now`."""
+        stops, arrival, departure = self.along[i], self.arrival[i], self.departure[i]
+        n = stops.shape[0]
+        k = int(np.searchsorted(stops, along))
+        for j in (k - 1, k):
+            if 0 <= j < n and abs(float(stops[j]) - along) <= AT_STOP_M:
+                # Dwelling: on time anywhere in the window, and at the first stop until it departs
+                earliest = -np.inf if j == 0 else float(arrival[j])
+                latest = float(departure[j])
+                return now - latest if now > latest else now - earliest if now < earliest else 0.0
+        if k == 0:
+            # Not yet at the first stop: only departing late counts
+            return max(now - float(departure[0]), 0.0)
+        if k == n:
+            return now - float(arrival[-1])
+        a, b = float(stops[k - 1]), float(stops[k])
+        f = (along - a) / (b - a) if b > a else 1.0
+        return now - (float(departure[k - 1]) + f * (float(arrival[k]) - float(departure[k - 1])))
+
+    def candidates(self, now: float) -> list[int]:
+        """Trips that can be running at `now`, latest first."""
+        i = bisect.bisect_right(self.starts, now + EARLY_SLACK_S) - 1
+        out = []
+        while i >= 0 and self.starts[i] >= now - self.longest - MAX_DELAY_S:
+            if now <= self.ends[i] + MAX_DELAY_S:
+                out.append(i)
+            i -= 1
+        return out
+
+
+class Adherence(NamedTuple):
+    route_id: str
+    trip_id: str
+    trip_start: int
+    delay_s: float
+    ts: datetime
+    along: float
+
+
+def status(delay_s: float) -> str:
+    if delay_s < -ON_TIME_EARLY_S:
+        return "early"
+    if delay_s > ON_TIME_LATE_S:
+        return "late"
+    return "on_time"
+
+
+class ScheduleAdherence:
+    """
+    Today's timetable placed on the route geometries, plus each vehicle's matched trip.
+
+    The feed is re-read after `invalidate()` and when the service day
+    changes; trips are re-placed whenever the route snapper rebuilds its
+    geometries (routes were edited). A feed that cannot be read is retried
+    every FEED_RETRY_SECONDS, and buses go without adherence meanwhile.
+    """
+
+    def __init__(self, feed_path: str = ""):
+        self.feed_path = feed_path
+        self.timetable: Timetable | None = None
+        self.routes: dict[str, _RouteSchedule] = {}
+        self._geometries = None
+        self._vehicles: dict[str, Adherence] = {}
+        # (trip_id, trip_start) -> vehicle_id holding it
+        self._holders: dict[tuple[str, int], str] = {}
+        self._stale = True
+        # monotonic time of the last failed feed read, None once it loads
+        self._failed_at: float | None = None
+        self._lock = asyncio.Lock()
+
+    def invalidate(self) -> None:
+        self._stale = True
+        self._failed_at = None
+
+    def _backing_off(self) -> bool:
+        return self._failed_at is not None and time.monotonic() - self._failed_at < FEED_RETRY_SECONDS
+
+    def _current(self) -> bool:
+        return (not self._stale and self._geometries is route_snapper.routes
+                and datetime.now(self.timetable.tz).date() == self.timetable.service_date)
+
+    async def ensure_loaded(self, pool) -> None:
+        if not self.feed_path or pool is None or self._current() or self._backing_off():
+            return
+        async with self._lock:
+            await route_snapper.ensure_loaded(pool)
+            if self._current() or self._backing_off():
+                return
+            timetable = self.timetable
+            if self._stale or timetable is None or datetime.now(timetable.tz).date() != timetable.service_date:
+                try:
+                    timetable = await asyncio.to_thread(load_feed, self.feed_path)
+                except Exception as e:
+                    if self._failed_at is None:
+                        logger.error("Cannot load GTFS feed %s, retrying every %.0f s: %s",
+                                     self.feed_path, FEED_RETRY_SECONDS, e)
+                    self._failed_at = time.monotonic()
+                    if self.timetable is not None and datetime.now(self.timetable.tz).date() != self.timetable.service_date:
+                        # Yesterday's trips would match buses against the wrong day
+                        self.routes = {}
+                        self._vehicles.clear()
+                        self._holders.clear()
+                    return
+            self.load(timetable, route_snapper.routes)
+
+    def load(self, timetable: Timetable, geometries: dict) -> None:
+        """
+        Place the timetable's trips on route geometries.
+
+        A trip is kept only if every one of its stops matches a stop of its
+        route, each further along than the last.
+        """
+        routes = {}
+        dropped = 0
+        for route_id, trips in timetable.trips.items():
+            geometry = geometries.get(route_id)
+            if geometry is None:
+                continue
+            placed = []
+            for trip in trips:
+                position = geometry.match_stops(trip.stop_lat, trip.stop_lng, STOP_MATCH_M)
+                if (position < 0).any():
+                    dropped += 1
+                    continue
+                placed.append((trip, geometry.stop_offsets[position]))
+            if placed:
+                routes[route_id] = _RouteSchedule(placed)
+
+        self.timetable = timetable
+        self.routes = routes
+        self._geometries = geometries
+        self._vehicles.clear()
+        self._holders.clear()
+        self._stale = False
+        self._failed_at = None
+        logger.info("Schedule adherence: %d trips on %d routes for %s (%d off their route's stops), %d KB",
+                    sum(len(r.trip_ids) for r in routes.values()), len(routes),
+                    timetable.service_date, dropped, timetable.nbytes // 1024)
+
+    def observe(self, vehicle_id: str, route_id: str, along: float, ts: datetime) -> Adherence | None:
+        """
+        Delay of a bus at `along` meters on its route at `ts`.
+
+        Returns:
+            The matched trip and delay, or None when no scheduled trip of the
+            route fits the bus.
+        """
+        if ts.tzinfo is None:
+            ts = ts.replace(tzinfo=timezone.utc)
+        previous = self._vehicles.get(vehicle_id)
+        if previous is not None and (previous.route_id, previous.ts, previous.along) == (route_id, ts, along):
+            return previous
+        schedule = self.routes.get(route_id)
+        if schedule is None or self.timetable is None:
+            self.release(vehicle_id)
+            return None
+        now = self.timetable.seconds(ts)
+
+        match = None
+        if previous is not None and previous.route_id == route_id and previous[1:3] in schedule.index:
+            i = schedule.index[previous[1:3]]
+            delay = schedule.delay(i, along, now)
+            if -EARLY_SLACK_S <= delay <= MAX_DELAY_S:
+                match = (i, delay)
+        if match is None:
+            best = None
+            for i in schedule.candidates(now):
+                delay = schedule.delay(i, along, now)
+                if not -EARLY_SLACK_S <= delay <= MAX_DELAY_S:
+                    continue
+                key = (schedule.trip_ids[i], schedule.starts[i])
+                cost = abs(delay) + (MAX_DELAY_S if self._held_by_other(key, vehicle_id, ts) else 0)
+                if best is None or cost < best[0]:
+                    best = (cost, i, delay)
+            if best is not None:
+                match = best[1:]
+
+        self.release(vehicle_id)
+        if match is None:
+            return None
+        i, delay = match
+        result = Adherence(route_id, schedule.trip_ids[i], schedule.starts[i], round(delay, 1), ts, along)
+        self._vehicles[vehicle_id] = result
+        self._holders[result[1:3]] = vehicle_id
+        return result
+
+    def _held_by_other(self, key: tuple[str, int], vehicle_id: str, ts: datetime) -> bool:
+        holder = self._holders.get(key)
+        if holder is None or holder == vehicle_id:
+            return False
+        held = self._vehicles.get(holder)
+        return held is not None and held[1:3] == key and (ts - held.ts).total_seconds() <= STALE_SECONDS
+
+    def release(self, vehicle_id: str) -> None:
+        previous = self._vehicles.pop(vehicle_id, None)
+        if previous is not None and self._holders.get(previous[1:3]) == vehicle_id:
+            del self._holders[previous[1:3]]
+
+    def annotate(self, buses: list[dict]) -> list[dict]:
+        """Add trip_id, delay_s and schedule_status to snapped live bus dicts (with datetime last_update) in place."""
+        for bus in buses:
+            if bus.get("distance_along_m") is None:
+                continue
+            result = self.observe(bus["vehicle_id"], bus["route_id"], bus["distance_along_m"], bus["last_update"])
+            if result is not None:
+                bus.update(trip_id=result.trip_id, delay_s=result.delay_s, schedule_status=status(result.delay_s))
+        return buses
+
+    # --- Reads ---
+
+    def route_adherence(self, route_id: str, now: datetime | None = None) -> dict | None:
+        """Delay of each bus matched to a trip of the route, and their summary."""
+        schedule = self.routes.get(route_id)
+        if schedule is None:
+            return None
+        now = now or datetime.now(timezone.utc)
+        buses = sorted(
+            (
+                {"vehicle_id": vehicle_id, "trip_id": a.trip_id, "delay_s": a.delay_s, "status": status(a.delay_s)}
+                for vehicle_id, a in self._vehicles.items()
+                if a.route_id == route_id and (now - a.ts).total_seconds() <= STALE_SECONDS
+            ),
+            key=lambda b: b["vehicle_id"],
+        )
+        held = {a[1:3] for a in self._vehicles.values()
+                if a.route_id == route_id and (now - a.ts).total_seconds() <= STALE_SECONDS}
+        seconds = self.timetable.seconds(now)
+        running = [(trip_id, start) for trip_id, start, end in zip(schedule.trip_ids, schedule.starts, schedule.ends)
+                   if start <= seconds <= end]
+
+        summary = {"matched": len(buses), "early": 0, "on_time": 0, "late": 0}
+        for b in buses:
+            summary[b["status"]] += 1
+        if buses:
+            delays = np.array([b["delay_s"] for b in buses])
+            p50, p90 = np.percentile(delays, [50, 90])
+            summary.update(mean_delay_s=round(float(delays.mean()), 1), p50_delay_s=round(float(p50), 1),
+                           p90_delay_s=round(float(p90), 1), max_delay_s=round(float(delays.max()), 1))
+        return {
+            "route_id": route_id,
+            "service_date": self.timetable.service_date.isoformat(),
+            "buses": buses,
+            "summary": summary,
+            # Trips the timetable has on the road now that no bus was matched to
+            "unmatched_trips": [trip_id for trip_id, start in running if (trip_id, start) not in held],
+        }
+
+
+schedule_adherence = ScheduleAdherence(settings.GTFS_FEED_PATH)
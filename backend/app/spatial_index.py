@@ -0,0 +1,255 @@
+"""
+Uniform-grid spatial indexes for stops and live vehicles.
+
+Stops are bucketed into square cells of a fixed size in meters and stored
+sorted by cell, so each cell is one contiguous slice (a CSR layout: sorted
+cell keys plus start offsets). A query looks up only the cells overlapping
+the search circle's bounding box and refines those candidates with exact
+haversine distances.
+
+Vehicles move, so their grid is a dict of cells holding sets of vehicle ids
+instead: a ping that crosses a cell edge moves one id between two sets.
+"""
+
+import asyncio
+import logging
+import math
+import time
+
+import numpy as np
+
+from ml_engine.geo import EARTH_RADIUS_M, haversine_m
+
+logger = logging.getLogger("smart_transit.spatial_index")
+
+# Cell edge; about the typical search radius keeps candidates to a few cells
+DEFAULT_CELL_M = 250.0
+_METERS_PER_DEGREE = np.radians(1.0) * EARTH_RADIUS_M
+# Row/column offsets keeping cell coordinates non-negative inside the packed key
+_KEY_OFFSET = 1 << 30
+
+STOPS_QUERY = """
+    SELECT stop_id, route_id, stop_name, latitude, longitude
+    FROM stops
+    ORDER BY stop_id
+"""
+
+
+class GridIndex:
+    """Immutable grid over (lat, lng) points; items are returned by position in the input."""
+
+    def __init__(self, lat, lng, cell_m: float = DEFAULT_CELL_M, ref_lat: float | None = None):
+        lat = np.asarray(lat, dtype=np.float64)
+        lng = np.asarray(lng, dtype=np.float64)
+        ref_lat = float(np.mean(lat)) if ref_lat is None and lat.shape[0] else (ref_lat or 0.0)
+        self.cell_m = cell_m
+        self._cell_lat = cell_m / _METERS_PER_DEGREE
+        self._cell_lng = cell_m / (_METERS_PER_DEGREE * max(np.cos(np.radians(ref_lat)), 1e-6))
+
+        keys = self._keys(self._row(lat), self._col(lng))
+        self.order = np.argsort(keys, kind="stable")
+        self.lat, self.lng = lat[self.order], lng[self.order]
+        sorted_keys = keys[self.order]
+        self.cell_keys, self.cell_starts = np.unique(sorted_keys, return_index=True)
+        self.cell_ends = np.append(self.cell_starts[1:], sorted_keys.shape[0])
+
+    def __len__(self) -> int:
+        return self.lat.shape[0]
+
+    def _row(self, lat):
+        return np.floor(np.asarray(lat) / self._cell_lat).astype(np.int64)
+
+    def _col(self, lng):
+        return np.floor(np.asarray(lng) / self._cell_lng).astype(np.int64)
+
+    @staticmethod
+    def _keys(row, col):
+        return ((row + _KEY_OFFSET) << 31) + (col + _KEY_OFFSET)
+
+    def candidates(self, lat: float, lng: float, radius_m: float) -> np.ndarray:
+        """Sorted-order positions of every point in cells touching the circle's bounding box."""
+        dlat = radius_m / _METERS_PER_DEGREE
+        dlng = radius_m / (_METERS_PER_DEGREE * max(np.cos(np.radians(lat)), 1e-6))
+        rows = np.arange(self._row(lat - dlat), self._row(lat + dlat) + 1)
+        cols = np.arange(self._col(lng - dlng), self._col(lng + dlng) + 1)
+        wanted = self._keys(rows[:, None], cols[None, :]).ravel()
+
+        found = np.searchsorted(self.cell_keys, wanted)
+        in_range = found < self.cell_keys.shape[0]
+        found, wanted = found[in_range], wanted[in_range]
+        found = found[self.cell_keys[found] == wanted]
+        starts, ends = self.cell_starts[found], self.cell_ends[found]
+        # Concatenated ranges [start, end) without a Python loop
+        lengths = ends - starts
+        return np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+
+    def within(self, lat: float, lng: float, radius_m: float, limit: int | None = None):
+        """
+        Points within `radius_m` of (lat, lng), nearest first.
+
+        Returns:
+            (indices into the input arrays, distances in meters)
+        """
+        positions = self.candidates(lat, lng, radius_m)
+        distance = haversine_m(lat, lng, self.lat[positions], self.lng[positions])
+        inside = distance <= radius_m
+        positions, distance = positions[inside], distance[inside]
+        if limit is not None and limit < positions.shape[0]:
+            nearest = np.argpartition(distance, limit - 1)[:limit]
+            positions, distance = positions[nearest], distance[nearest]
+        ranked = np.argsort(distance, kind="stable")
+        return self.order[positions[ranked]], distance[ranked]
+
+
+class StopIndex:
+    """
+    Grid index over every stop in the network.
+
+    Built from the stops table on startup or first use, and rebuilt after
+    `invalidate()` (called on admin and GTFS writes).
+    """
+
+    def __init__(self, cell_m: float = DEFAULT_CELL_M):
+        self.cell_m = cell_m
+        self.grid = GridIndex([], [], cell_m)
+        self.stops: list[dict] = []
+        self._stale = True
+        self._lock = asyncio.Lock()
+
+    def invalidate(self) -> None:
+        self._stale = True
+
+    async def ensure_loaded(self, pool) -> None:
+        if not self._stale or pool is None:
+            return
+        async with self._lock:
+            if self._stale:
+                async with pool.acquire() as conn:
+                    rows = await conn.fetch(STOPS_QUERY)
+                self.load(rows)
+
+    def load(self, rows) -> None:
+        stops = [
+            {"stop_id": r["stop_id"], "route_id": r["route_id"], "stop": r["stop_name"],
+             "lat": float(r["latitude"]), "lng": float(r["longitude"])}
+            for r in rows
+        ]
+        self.grid = GridIndex([s["lat"] for s in stops], [s["lng"] for s in stops], self.cell_m)
+        self.stops = stops
+        self._stale = False
+        logger.info("Stop index: %d stops in %d grid cells", len(stops), self.grid.cell_keys.shape[0])
+
+    def nearby(self, lat: float, lng: float, radius_m: float, limit: int) -> list[dict]:
+        indices, distances = self.grid.within(lat, lng, radius_m, limit)
+        return [
+            {**self.stops[i], "distance_m": round(float(d), 1)}
+            for i, d in zip(indices.tolist(), distances.tolist())
+        ]
+
+
+stop_index = StopIndex()
+
+
+# Vehicle cell edge in degrees (~1 km); a zoomed-in map view spans a few cells
+VEHICLE_CELL_DEG = 0.01
+# Vehicles silent for longer than this are left out of queries (matches the active fleet window)
+VEHICLE_STALE_SECONDS = 300.0
+
+
+def parse_bbox(value) -> tuple[float, float, float, float]:
+    """
+    Parse "min_lng,min_lat,max_lng,max_lat" (a string or a 4-item list).
+
+    Returns:
+        (min_lat, min_lng, max_lat, max_lng)
+
+    Raises:
+        ValueError: if the box is malformed or out of range.
+    """
+    parts = value.split(",") if isinstance(value, str) else value
+    try:
+        min_lng, min_lat, max_lng, max_lat = (float(p) for p in parts)
+    except (TypeError, ValueError):
+        raise ValueError("bbox must be min_lng,min_lat,max_lng,max_lat") from None
+    if not (-90 <= min_lat <= max_lat <= 90 and -180 <= min_lng <= max_lng <= 180):
+        raise ValueError("bbox must be min_lng,min_lat,max_lng,max_lat within valid coordinates")
+    return min_lat, min_lng, max_lat, max_lng
+
+
+class VehicleGrid:
+    """
+    Live vehicle positions bucketed by grid cell, updated in O(1) per ping.
+
+    Each vehicle keeps the last bus dict it was given (vehicle_id, route_id,
+    lat, lng, ...), which bounding-box queries return.
+    """
+
+    def __init__(self, cell_deg: float = VEHICLE_CELL_DEG):
+        self.cell_deg = cell_deg
+        # (row, col) -> vehicle ids in the cell
+        self._cells: dict[tuple[int, int], set[str]] = {}
+        # vehicle_id -> (cell, bus dict, last update monotonic)
+        self._vehicles: dict[str, tuple] = {}
+
+    def __len__(self) -> int:
+        return len(self._vehicles)
+
+    def _cell(self, lat: float, lng: float) -> tuple[int, int]:
+        return math.floor(lat / self.cell_deg), math.floor(lng / self.cell_deg)
+
+    def update(self, bus: dict) -> None:
+        """Record a vehicle's latest position, moving it between cells if it crossed an edge."""
+        vehicle_id = bus["vehicle_id"]
+        cell = self._cell(bus["lat"], bus["lng"])
+        previous = self._vehicles.get(vehicle_id)
+        if previous is None or previous[0] != cell:
+            if previous is not None:
+                self._discard(previous[0], vehicle_id)
+            self._cells.setdefault(cell, set()).add(vehicle_id)
+        self._vehicles[vehicle_id] = (cell, bus, time.monotonic())
+
+    def remove(self, vehicle_id: str) -> None:
+        previous = self._vehicles.pop(vehicle_id, None)
+        if previous is not None:
+            self._discard(previous[0], vehicle_id)
+
+    def _discard(self, cell: tuple[int, int], vehicle_id: str) -> None:
+        members = self._cells[cell]
+        members.discard(vehicle_id)
+        if not members:
+            del self._cells[cell]
+
+    def sync(self, buses: list[dict]) -> None:
+        """Make the grid match a full fleet snapshot, dropping vehicles absent from it."""
+        present = set()
+        for bus in buses:
+            self.update(bus)
+            present.add(bus["vehicle_id"])
+        for vehicle_id in self._vehicles.keys() - present:
+            self.remove(vehicle_id)
+
+    def within_bbox(self, min_lat: float, min_lng: float, max_lat: float, max_lng: float) -> list[dict]:
+        """Buses inside the box, ordered by vehicle_id."""
+        row0, col0 = self._cell(min_lat, min_lng)
+        row1, col1 = self._cell(max_lat, max_lng)
+        if (row1 - row0 + 1) * (col1 - col0 + 1) <= len(self._cells):
+            # Small box: visit each cell it covers
+            cells = (self._cells.get((row, col)) for row in range(row0, row1 + 1) for col in range(col0, col1 + 1))
+        else:
+            # Box larger than the occupied area: visit each occupied cell once
+            cells = (members for (row, col), members in self._cells.items()
+                     if row0 <= row <= row1 and col0 <= col <= col1)
+
+        now = time.monotonic()
+        found = []
+        for members in cells:
+            for vehicle_id in members or ():
+                _, bus, updated = self._vehicles[vehicle_id]
+                if (now - updated <= VEHICLE_STALE_SECONDS
+                        and min_lat <= bus["lat"] <= max_lat and min_lng <= bus["lng"] <= max_lng):
+                    found.append(bus)
+        found.sort(key=lambda bus: bus["vehicle_id"])
+        return found
+
+
+vehicle_grid = VehicleGrid()
@@ -0,0 +1,200 @@
+"""
+Materialized arrival boards: the next buses due at every stop.
+
+Each stop keeps its predicted arrivals as a list sorted by arrival time.
+When a bus pings, only the stops downstream of it on its route are
+touched: its old entries are taken out and the new predictions inserted
+with bisect, so reading "the next k arrivals" is a slice. Subscribers
+(the /ws/stops WebSocket) register for specific stops and are sent a
+stop's board only when that stop changed.
+"""
+
+import asyncio
+import bisect
+import logging
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from zoneinfo import ZoneInfo
+
+import numpy as np
+
+from backend.app.config import settings
+
+logger = logging.getLogger("smart_transit.stop_boards")
+
+# Vehicles silent for longer than this drop off every board (matches the active fleet window)
+STALE_SECONDS = 300.0
+# Arrivals pushed to subscribers per changed stop
+PUSH_ARRIVALS = 5
+# Messages buffered per subscriber; the oldest are dropped beyond this
+SUBSCRIBER_QUEUE_SIZE = 256
+
+
+async def predict_downstream(app, route_id: str, geometry, along, first_stop, speeds_kmh):
+    """
+    ETAs from buses on one route to every stop from their next stop onwards.
+
+    One batched model call covers all (bus, stop) pairs, through the route's
+    own model when the registry has one.
+
+    Returns:
+        (bus index, stop index, distance in meters, seconds, source) with one
+        entry per pair, grouped by bus.
+    """
+    along = np.asarray(along, dtype=np.float64)
+    n_stops = len(geometry.stop_names)
+    bus_index, stop_index = np.nonzero(np.arange(n_stops) >= np.asarray(first_stop)[:, None])
+    distances = np.maximum(geometry.stop_offsets[stop_index] - along[bus_index], 0.0)
+    speeds_m_s = np.asarray(speeds_kmh, dtype=np.float64)[bus_index] / 3.6
+
+    hour = datetime.now(ZoneInfo(settings.TRANSIT_TIMEZONE)).hour
+    predictor = app.state.eta_predictor
+    registry = getattr(app.state, "model_registry", None)
+    if registry is not None:
+        predictor, _ = await registry.aresolve(route_id, hour)
+    if distances.shape[0]:
+        minutes, source = await predictor.apredict_batch(distances, speeds_m_s, hour)
+    else:
+        minutes, source = np.empty(0), "ML_model" if predictor.ready else "rule_based_fallback"
+    # A bus at the stop has arrived
+    seconds = np.where(distances > 0, minutes * 60, 0.0)
+    return bus_index, stop_index, distances, seconds, source
+
+
+@dataclass(eq=False)
+class Subscription:
+    stops: set = field(default_factory=set)
+    queue: asyncio.Queue = field(default_factory=lambda: asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE))
+
+    def push(self, message: dict) -> None:
+        if self.queue.full():
+            # A slow reader loses its oldest updates, never blocks the ping path
+            self.queue.get_nowait()
+        self.queue.put_nowait(message)
+
+
+class StopBoards:
+    """Per-stop sorted arrival lists, updated incrementally per vehicle."""
+
+    def __init__(self):
+        # stop_id -> sorted [(arrival epoch, vehicle_id)]
+        self._boards: dict[int, list] = {}
+        # vehicle_id -> (route_id, last update monotonic, {stop_id: (arrival epoch, distance_m)})
+        self._vehicles: dict[str, tuple] = {}
+        self._subscribers: dict[int, set] = {}
+
+    def update_vehicle(self, vehicle_id: str, route_id: str, stop_ids, arrivals, distances) -> None:
+        """Replace a vehicle's predictions with arrivals (epoch seconds) at `stop_ids`."""
+        previous = self._vehicles.get(vehicle_id)
+        old = previous[2] if previous is not None else {}
+        new = {stop_id: (float(at), float(d)) for stop_id, at, d in zip(stop_ids, arrivals, distances)}
+
+        for stop_id, (at, _) in old.items():
+            self._remove(stop_id, at, vehicle_id)
+        for stop_id, (at, _) in new.items():
+            bisect.insort(self._boards.setdefault(stop_id, []), (at, vehicle_id))
+        self._vehicles[vehicle_id] = (route_id, time.monotonic(), new)
+        self._notify(old.keys() | new.keys())
+
+    def remove_vehicle(self, vehicle_id: str) -> None:
+        previous = self._vehicles.pop(vehicle_id, None)
+        if previous is None:
+            return
+        for stop_id, (at, _) in previous[2].items():
+            self._remove(stop_id, at, vehicle_id)
+        self._notify(previous[2].keys())
+
+    def invalidate_route(self, route_id: str) -> None:
+        """Drop every prediction on a route whose stops were edited or deleted."""
+        for vehicle_id in [v for v, entry in self._vehicles.items() if entry[0] == route_id]:
+            self.remove_vehicle(vehicle_id)
+
+    def _remove(self, stop_id: int, at: float, vehicle_id: str) -> None:
+        board = self._boards.get(stop_id)
+        if board is None:
+            return
+        i = bisect.bisect_left(board, (at, vehicle_id))
+        if i < len(board) and board[i] == (at, vehicle_id):
+            del board[i]
+        if not board:
+            del self._boards[stop_id]
+
+    def arrivals(self, stop_id: int, limit: int = 5) -> list[dict]:
+        """The next `limit` arrivals at a stop, soonest first."""
+        result = []
+        now, wall = time.monotonic(), time.time()
+        for at, vehicle_id in self._boards.get(stop_id, ()):
+            route_id, updated, stops = self._vehicles[vehicle_id]
+            if now - updated > STALE_SECONDS:
+                # Taken off every board by the next prune_stale()
+                continue
+            result.append({
+                "vehicle_id": vehicle_id,
+                "route_id": route_id,
+                "arrival_time": datetime.fromtimestamp(at, timezone.utc).isoformat(),
+                "seconds": round(max(at - wall, 0.0), 1),
+                "distance_m": stops[stop_id][1],
+            })
+            if len(result) == limit:
+                break
+        return result
+
+    def prune_stale(self) -> int:
+        """Drop vehicles silent for STALE_SECONDS from every board, notifying subscribers; returns how many."""
+        now = time.monotonic()
+        stale = [v for v, (_, updated, _) in self._vehicles.items() if now - updated > STALE_SECONDS]
+        for vehicle_id in stale:
+            self.remove_vehicle(vehicle_id)
+        return len(stale)
+
+    # --- Subscriptions ---
+
+    def subscribe(self, subscription: Subscription, stop_ids) -> None:
+        """Add stops to a subscription and send their current boards."""
+        for stop_id in stop_ids:
+            subscription.stops.add(stop_id)
+            self._subscribers.setdefault(stop_id, set()).add(subscription)
+            subscription.push(self._message(stop_id))
+
+    def unsubscribe(self, subscription: Subscription, stop_ids=None) -> None:
+        for stop_id in list(subscription.stops if stop_ids is None else stop_ids):
+            subscription.stops.discard(stop_id)
+            subscribers = self._subscribers.get(stop_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[stop_id]
+
+    def _message(self, stop_id: int) -> dict:
+        return {"type": "stop_board", "stop_id": stop_id, "arrivals": self.arrivals(stop_id, PUSH_ARRIVALS)}
+
+    def _notify(self, stop_ids) -> None:
+        for stop_id in stop_ids:
+            subscribers = self._subscribers.get(stop_id)
+            if subscribers:
+                message = self._message(stop_id)
+                for subscription in subscribers:
+                    subscription.push(message)
+
+
+stop_boards = StopBoards()
+
+
+async def update_from_ping(app, vehicle_id: str, route_id: str, snap, speed_kmh: float, ts: datetime) -> None:
+    """Refresh a vehicle's predictions at the stops still ahead of it after a ping."""
+    from backend.app.route_snapping import route_snapper
+
+    geometry = route_snapper.routes.get(route_id)
+    if geometry is None or snap is None or snap.next_stop_index is None:
+        stop_boards.remove_vehicle(vehicle_id)
+        return
+    _, stop_index, distances, seconds, _ = await predict_downstream(
+        app, route_id, geometry, [snap.distance_along_m], [snap.next_stop_index], [speed_kmh],
+    )
+    stop_boards.update_vehicle(
+        vehicle_id, route_id,
+        [geometry.stop_ids[k] for k in stop_index.tolist()],
+        ts.timestamp() + seconds,
+        distances.round(1),
+    )
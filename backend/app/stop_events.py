@@ -0,0 +1,195 @@
+"""
+Streaming detection of buses arriving at and departing from stops.
+
+Every location ping, already snapped to its route, is checked against the
+stops of that route: a bus is "at" a stop while its distance along the
+route is within `radius_m` of the stop's and it is no further than that
+off the line. Per vehicle only the stop it is at (if any), when it arrived
+and when it was last seen there are kept. When it leaves, changes route
+or goes silent, one compact `stop_events` row (vehicle, route, stop,
+arrive, depart) is queued; `StopEventFlusher` writes the queue to the
+database in bulk every few seconds.
+
+Arrive and depart are the first and last pings inside the radius, so a
+bus passing straight through has arrive == depart.
+"""
+
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import NamedTuple
+
+import numpy as np
+
+from backend.app.config import settings
+
+logger = logging.getLogger("smart_transit.stop_events")
+
+STOP_RADIUS_M = 30.0
+# A vehicle silent for this long has left the stop it was at, as of its last ping
+STALE_SECONDS = 300.0
+# Events kept while the database is unreachable; the oldest are dropped beyond this
+MAX_PENDING_EVENTS = 100_000
+STOP_EVENT_COLUMNS = ["vehicle_id", "route_id", "stop_id", "arrive", "depart"]
+
+
+class StopEvent(NamedTuple):
+    vehicle_id: str
+    route_id: str
+    stop_id: int
+    arrive: datetime
+    depart: datetime
+
+
+class _Visit(NamedTuple):
+    route_id: str
+    stop_id: int | None
+    arrive: datetime | None
+    last_seen: datetime
+
+
+class StopEventDetector:
+    """Per-vehicle stop visit state plus the queue of completed visits."""
+
+    def __init__(self, radius_m: float = STOP_RADIUS_M):
+        self.radius_m = radius_m
+        self._vehicles: dict[str, _Visit] = {}
+        self.pending: list[StopEvent] = []
+        self.dropped = 0
+
+    def stop_at(self, geometry, snap) -> int | None:
+        """stop_id of the stop the snapped position is at, if any."""
+        if geometry is None or snap is None or snap.off_route_m > self.radius_m:
+            return None
+        offsets = geometry.stop_offsets
+        i = int(np.searchsorted(offsets, snap.distance_along_m))
+        # The stops just before and after the position along the route
+        best = None
+        for k in (i - 1, i):
+            if 0 <= k < offsets.shape[0]:
+                gap = abs(float(offsets[k]) - snap.distance_along_m)
+                if gap <= self.radius_m and (best is None or gap < best[0]):
+                    best = (gap, k)
+        return geometry.stop_ids[best[1]] if best is not None else None
+
+    def observe(self, vehicle_id: str, route_id: str, geometry, snap, ts: datetime) -> StopEvent | None:
+        """
+        Feed one snapped ping.
+
+        Returns:
+            The visit it completed, if any (also queued for flushing).
+        """
+        if ts.tzinfo is None:
+            ts = ts.replace(tzinfo=timezone.utc)
+        previous = self._vehicles.get(vehicle_id)
+        if previous is not None and ts < previous.last_seen:
+            # Out-of-order ping; the visit has already moved on
+            return None
+
+        stop_id = self.stop_at(geometry, snap)
+        closed = None
+        if previous is not None and previous.stop_id is not None:
+            stale = ts - previous.last_seen > timedelta(seconds=STALE_SECONDS)
+            if previous.route_id == route_id and previous.stop_id == stop_id and not stale:
+                self._vehicles[vehicle_id] = previous._replace(last_seen=ts)
+                return None
+            closed = self._close(vehicle_id, previous)
+
+        if stop_id is None:
+            self._vehicles[vehicle_id] = _Visit(route_id, None, None, ts)
+        else:
+            self._vehicles[vehicle_id] = _Visit(route_id, stop_id, ts, ts)
+        return closed
+
+    def _close(self, vehicle_id: str, visit: _Visit) -> StopEvent:
+        event = StopEvent(vehicle_id, visit.route_id, visit.stop_id, visit.arrive, visit.last_seen)
+        self.pending.append(event)
+        overflow = len(self.pending) - MAX_PENDING_EVENTS
+        if overflow > 0:
+            del self.pending[:overflow]
+            self.dropped += overflow
+        return event
+
+    def close_stale(self, now: datetime | None = None) -> int:
+        """Complete the visits of vehicles that went silent and forget them."""
+        cutoff = (now or datetime.now(timezone.utc)) - timedelta(seconds=STALE_SECONDS)
+        stale = [v for v, visit in self._vehicles.items() if visit.last_seen < cutoff]
+        for vehicle_id in stale:
+            visit = self._vehicles.pop(vehicle_id)
+            if visit.stop_id is not None:
+                self._close(vehicle_id, visit)
+        return len(stale)
+
+    async def flush(self, pool) -> int:
+        """
+        Write queued events with one COPY.
+
+        On failure the events go back on the queue for the next attempt.
+
+        Returns:
+            Number of rows written.
+        """
+        events, self.pending = self.pending, []
+        if not events:
+            return 0
+        try:
+            async with pool.acquire() as conn:
+                await conn.copy_records_to_table("stop_events", records=events, columns=STOP_EVENT_COLUMNS)
+        except Exception:
+            self.pending = (events + self.pending)[-MAX_PENDING_EVENTS:]
+            raise
+        return len(events)
+
+
+stop_event_detector = StopEventDetector(settings.STOP_EVENT_RADIUS_M)
+
+
+class StopEventFlusher:
+    """
+    Periodically completes stale visits and flushes queued stop events.
+
+    Silent buses are taken off the stop arrival `boards`, if given, on the
+    same tick.
+    """
+
+    def __init__(self, detector: StopEventDetector, pool, flush_seconds: float = 5.0, boards=None):
+        self.detector = detector
+        self.pool = pool
+        self.flush_seconds = flush_seconds
+        self.boards = boards
+        self._task: asyncio.Task | None = None
+
+    async def flush(self) -> int:
+        self.detector.close_stale()
+        if self.boards is not None:
+            self.boards.prune_stale()
+        written = await self.detector.flush(self.pool)
+        if written:
+            logger.debug("Stop events: %d rows written", written)
+        return written
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_seconds)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error("Stop event flush failed (%d queued): %s", len(self.detector.pending), e)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def close(self) -> None:
+        """Stop the loop and write whatever is queued."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        try:
+            await self.detector.flush(self.pool)
+        except Exception as e:
+            logger.error("Final stop event flush failed: %s", e)
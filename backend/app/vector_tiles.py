@@ -0,0 +1,389 @@
+"""
+Mapbox Vector Tiles (MVT 2.1) of the route network.
+
+Route lines and stops are projected to Web Mercator once per network
+load. Lines are simplified with Douglas-Peucker to a tolerance of about
+one screen pixel at each zoom level, computed once per zoom and reused by
+every tile of that zoom. Encoded tiles are kept in an in-memory LRU and
+written to a disk cache under a directory named after a hash of the
+network, so a restart reuses them and an admin or GTFS write (which
+changes the hash) never serves stale ones.
+
+Tiles are encoded with the wire helpers in `backend.app.protobuf`.
+"""
+
+import asyncio
+import hashlib
+import logging
+import math
+import os
+import re
+import shutil
+import tempfile
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+
+from backend.app.config import settings
+from backend.app.protobuf import (
+    encode_varint,
+    field_bytes,
+    field_double,
+    field_key,
+    field_packed_varints,
+    field_string,
+    field_varint,
+    zigzag,
+    WIRE_VARINT,
+)
+
+logger = logging.getLogger("smart_transit.vector_tiles")
+
+MVT_MEDIA_TYPE = "application/vnd.mapbox-vector-tile"
+MAX_ZOOM = 20
+TILE_EXTENT = 4096
+# Geometry kept beyond each tile edge (extent units) so lines join up and symbols are not cut
+TILE_BUFFER = 64
+# Douglas-Peucker tolerance in pixels of a 256 px tile
+SIMPLIFY_PIXELS = 1.0
+# Stops are left out of tiles below this zoom
+STOPS_MIN_ZOOM = 13
+# Bump when the tile contents change so disk caches written by older code are ignored
+TILE_FORMAT = 1
+MAX_LATITUDE = 85.05112878
+# Written into each version directory of the disk cache; only marked,
+# hash-named directories are ever pruned
+CACHE_MARKER = "_SMART_TRANSIT_TILES"
+_VERSION_NAME = re.compile(r"[0-9a-f]{16}")
+
+NETWORK_QUERY = """
+    SELECT s.stop_id, s.route_id, r.route_name, s.stop_name, s.latitude, s.longitude
+    FROM stops s
+    JOIN routes r ON r.route_id = s.route_id
+    ORDER BY s.route_id, s.stop_sequence, s.stop_id
+"""
+
+# Field numbers from vector_tile.proto
+_TILE_LAYERS = 3
+_LAYER_VERSION = 15
+_LAYER_NAME = 1
+_LAYER_FEATURES = 2
+_LAYER_KEYS = 3
+_LAYER_VALUES = 4
+_LAYER_EXTENT = 5
+_FEATURE_ID = 1
+_FEATURE_TAGS = 2
+_FEATURE_TYPE = 3
+_FEATURE_GEOMETRY = 4
+_VALUE_STRING = 1
+_VALUE_DOUBLE = 3
+_VALUE_SINT = 6
+_VALUE_BOOL = 7
+GEOM_POINT = 1
+GEOM_LINESTRING = 2
+_CMD_MOVE_TO = 1
+_CMD_LINE_TO = 2
+
+
+# --- Geometry ---
+
+def mercator(lat, lng):
+    """Web Mercator world coordinates in [0, 1] (y grows southwards)."""
+    lat = np.radians(np.clip(np.asarray(lat, dtype=np.float64), -MAX_LATITUDE, MAX_LATITUDE))
+    x = (np.asarray(lng, dtype=np.float64) + 180.0) / 360.0
+    y = (1.0 - np.log(np.tan(lat) + 1.0 / np.cos(lat)) / math.pi) / 2.0
+    return x, y
+
+
+def douglas_peucker(x, y, tolerance: float) -> np.ndarray:
+    """
+    Points of a polyline kept by Douglas-Peucker simplification.
+
+    Distances are measured to the chord as a segment (not an infinite line),
+    so a route that doubles back keeps its turning point.
+
+    Returns:
+        Boolean mask over the input points; the endpoints are always kept.
+    """
+    x, y = np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64)
+    n = x.shape[0]
+    keep = np.zeros(n, dtype=bool)
+    if n == 0:
+        return keep
+    keep[0] = keep[-1] = True
+    stack = [(0, n - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        dx, dy = x[end] - x[start], y[end] - y[start]
+        px, py = x[start + 1:end] - x[start], y[start + 1:end] - y[start]
+        t = np.clip((px * dx + py * dy) / max(dx * dx + dy * dy, 1e-30), 0.0, 1.0)
+        distance = np.hypot(px - t * dx, py - t * dy)
+        i = int(np.argmax(distance))
+        if distance[i] > tolerance:
+            mid = start + 1 + i
+            keep[mid] = True
+            stack.append((start, mid))
+            stack.append((mid, end))
+    return keep
+
+
+def _clip_parts(x, y, bounds) -> list[tuple[np.ndarray, np.ndarray]]:
+    """Runs of consecutive segments whose bounding box overlaps `bounds` (min x, min y, max x, max y)."""
+    x0, x1, y0, y1 = x[:-1], x[1:], y[:-1], y[1:]
+    touches = (
+        (np.maximum(x0, x1) >= bounds[0]) & (np.minimum(x0, x1) <= bounds[2])
+        & (np.maximum(y0, y1) >= bounds[1]) & (np.minimum(y0, y1) <= bounds[3])
+    )
+    # Start and end of every run of touching segments
+    edges = np.diff(np.concatenate(([0], touches.astype(np.int8), [0])))
+    starts, ends = np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+    return [(x[s:e + 1], y[s:e + 1]) for s, e in zip(starts.tolist(), ends.tolist())]
+
+
+# --- Encoding ---
+
+def _command(command: int, count: int) -> int:
+    return (command & 0x7) | (count << 3)
+
+
+def encode_line_geometry(parts) -> list[int]:
+    """Geometry commands for a (multi) linestring given as integer tile coordinate arrays."""
+    out: list[int] = []
+    cx = cy = 0
+    for px, py in parts:
+        out.append(_command(_CMD_MOVE_TO, 1))
+        out += (zigzag(int(px[0]) - cx), zigzag(int(py[0]) - cy))
+        out.append(_command(_CMD_LINE_TO, len(px) - 1))
+        dx, dy = np.diff(px), np.diff(py)
+        out += [zigzag(v) for pair in zip(dx.tolist(), dy.tolist()) for v in pair]
+        cx, cy = int(px[-1]), int(py[-1])
+    return out
+
+
+def _encode_value(value) -> bytes:
+    if isinstance(value, bool):
+        return field_varint(_VALUE_BOOL, int(value))
+    if isinstance(value, int):
+        return field_key(_VALUE_SINT, WIRE_VARINT) + encode_varint(zigzag(value))
+    if isinstance(value, float):
+        return field_double(_VALUE_DOUBLE, value)
+    return field_string(_VALUE_STRING, str(value))
+
+
+def encode_layer(name: str, features: list[tuple]) -> bytes:
+    """
+    Encode one layer.
+
+    Args:
+        features: (id or None, geometry type, geometry commands, properties dict).
+    """
+    keys: dict = {}
+    values: dict = {}
+    encoded = []
+    for feature_id, geom_type, geometry, properties in features:
+        tags = []
+        for key, value in properties.items():
+            tags.append(keys.setdefault(key, len(keys)))
+            tags.append(values.setdefault((type(value), value), len(values)))
+        body = (
+            (field_varint(_FEATURE_ID, feature_id) if feature_id is not None else b"")
+            + field_packed_varints(_FEATURE_TAGS, tags)
+            + field_varint(_FEATURE_TYPE, geom_type)
+            + field_packed_varints(_FEATURE_GEOMETRY, geometry)
+        )
+        encoded.append(field_bytes(_LAYER_FEATURES, body))
+    layer = (
+        field_varint(_LAYER_VERSION, 2)
+        + field_string(_LAYER_NAME, name)
+        + b"".join(encoded)
+        + b"".join(field_string(_LAYER_KEYS, key) for key in keys)
+        + b"".join(field_bytes(_LAYER_VALUES, _encode_value(value)) for _, value in values)
+        + field_varint(_LAYER_EXTENT, TILE_EXTENT)
+    )
+    return field_bytes(_TILE_LAYERS, layer)
+
+
+# --- Network ---
+
+class RouteNetwork:
+    """Route lines and stops in world coordinates, with per-zoom simplified lines."""
+
+    def __init__(self, rows):
+        routes: dict = {}
+        for row in rows:
+            routes.setdefault(row["route_id"], (row["route_name"], []))[1].append(row)
+
+        self.lines = []  # (route_id, route_name, x, y, bbox)
+        for route_id, (route_name, stops) in routes.items():
+            if len(stops) < 2:
+                continue
+            x, y = mercator([s["latitude"] for s in stops], [s["longitude"] for s in stops])
+            self.lines.append((route_id, route_name, x, y, (x.min(), y.min(), x.max(), y.max())))
+
+        self.stop_rows = [
+            {"stop_id": r["stop_id"], "route_id": r["route_id"], "stop_name": r["stop_name"]} for r in rows
+        ]
+        self.stop_x, self.stop_y = mercator(
+            [r["latitude"] for r in rows], [r["longitude"] for r in rows],
+        )
+
+        digest = hashlib.sha1(str(TILE_FORMAT).encode())
+        for r in rows:
+            digest.update(repr((r["stop_id"], r["route_id"], r["route_name"], r["stop_name"],
+                                float(r["latitude"]), float(r["longitude"]))).encode())
+        self.version = digest.hexdigest()[:16]
+        self._simplified: dict[int, list] = {}
+
+    def simplified(self, z: int) -> list[tuple[np.ndarray, np.ndarray]]:
+        """Every route line simplified for zoom `z`, computed on first use."""
+        lines = self._simplified.get(z)
+        if lines is None:
+            tolerance = SIMPLIFY_PIXELS / (256.0 * (1 << z))
+            lines = []
+            for _, _, x, y, _ in self.lines:
+                keep = douglas_peucker(x, y, tolerance)
+                lines.append((x[keep], y[keep]))
+            self._simplified[z] = lines
+        return lines
+
+    def render(self, z: int, tx: int, ty: int) -> bytes:
+        """Encode tile (z, x, y); empty tiles encode to no bytes."""
+        scale = float(1 << z)
+        buffer = TILE_BUFFER / TILE_EXTENT / scale
+        bounds = (tx / scale - buffer, ty / scale - buffer, (tx + 1) / scale + buffer, (ty + 1) / scale + buffer)
+
+        def to_tile(x, y):
+            return (np.round((x * scale - tx) * TILE_EXTENT).astype(np.int64),
+                    np.round((y * scale - ty) * TILE_EXTENT).astype(np.int64))
+
+        route_features = []
+        for (route_id, route_name, _, _, bbox), (x, y) in zip(self.lines, self.simplified(z)):
+            if bbox[2] < bounds[0] or bbox[0] > bounds[2] or bbox[3] < bounds[1] or bbox[1] > bounds[3]:
+                continue
+            parts = []
+            for px, py in _clip_parts(x, y, bounds):
+                px, py = to_tile(px, py)
+                # Vertices that round onto the same tile coordinate add nothing
+                moved = np.concatenate(([True], (np.diff(px) != 0) | (np.diff(py) != 0)))
+                px, py = px[moved], py[moved]
+                if px.shape[0] >= 2:
+                    parts.append((px, py))
+            if parts:
+                route_features.append((None, GEOM_LINESTRING, encode_line_geometry(parts),
+                                       {"route_id": route_id, "route_name": route_name}))
+
+        tile = encode_layer("routes", route_features) if route_features else b""
+        if z >= STOPS_MIN_ZOOM:
+            inside = np.flatnonzero(
+                (self.stop_x >= bounds[0]) & (self.stop_x <= bounds[2])
+                & (self.stop_y >= bounds[1]) & (self.stop_y <= bounds[3])
+            )
+            if inside.shape[0]:
+                sx, sy = to_tile(self.stop_x[inside], self.stop_y[inside])
+                stop_features = [
+                    (stop["stop_id"], GEOM_POINT, [_command(_CMD_MOVE_TO, 1), zigzag(int(x)), zigzag(int(y))],
+                     {"stop_name": stop["stop_name"], "route_id": stop["route_id"]})
+                    for stop, x, y in zip((self.stop_rows[i] for i in inside.tolist()), sx.tolist(), sy.tolist())
+                ]
+                tile += encode_layer("stops", stop_features)
+        return tile
+
+
+class NetworkTiles:
+    """
+    Tile server state: the loaded network plus memory and disk tile caches.
+
+    The network is (re)loaded from the DB on first use and after
+    `invalidate()` (called on admin and GTFS writes).
+    """
+
+    def __init__(self, cache_dir: str | None = settings.TILE_CACHE_DIR,
+                 max_entries: int = settings.TILE_CACHE_MAX_ENTRIES):
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+        self.max_entries = max(1, max_entries)
+        self.network: RouteNetwork | None = None
+        self._memory: OrderedDict[tuple, bytes] = OrderedDict()
+        self._stale = True
+        self._lock = asyncio.Lock()
+
+    def invalidate(self) -> None:
+        self._stale = True
+
+    async def ensure_loaded(self, pool) -> None:
+        if not self._stale or pool is None:
+            return
+        async with self._lock:
+            if self._stale:
+                async with pool.acquire() as conn:
+                    rows = await conn.fetch(NETWORK_QUERY)
+                self.load(rows)
+                if self.cache_dir is not None:
+                    await asyncio.to_thread(self._prune_disk)
+
+    def load(self, rows) -> None:
+        network = RouteNetwork(rows)
+        if self.network is None or network.version != self.network.version:
+            self._memory.clear()
+        self.network = network
+        self._stale = False
+        logger.info("Vector tiles: %d routes, %d stops (network %s)",
+                    len(network.lines), len(network.stop_rows), network.version)
+
+    def _prune_disk(self) -> None:
+        """
+        Delete tiles cached for previous versions of the network.
+
+        Only version directories this class wrote (hash-named and marked)
+        are removed, so TILE_CACHE_DIR may be shared with other data.
+        """
+        if not self.cache_dir.is_dir():
+            return
+        for entry in self.cache_dir.iterdir():
+            if (entry.is_dir() and entry.name != self.network.version
+                    and _VERSION_NAME.fullmatch(entry.name) and (entry / CACHE_MARKER).is_file()):
+                shutil.rmtree(entry, ignore_errors=True)
+
+    async def tile(self, z: int, x: int, y: int) -> tuple[bytes, str]:
+        """Encoded tile and the network version it was built from."""
+        network = self.network
+        key = (network.version, z, x, y)
+        data = self._memory.get(key)
+        if data is not None:
+            self._memory.move_to_end(key)
+            return data, network.version
+
+        data = await asyncio.to_thread(self._read_or_render, network, z, x, y)
+        self._memory[key] = data
+        if len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+        return data, network.version
+
+    def _read_or_render(self, network: RouteNetwork, z: int, x: int, y: int) -> bytes:
+        if self.cache_dir is None:
+            return network.render(z, x, y)
+        path = self.cache_dir / network.version / str(z) / str(x) / f"{y}.mvt"
+        try:
+            return path.read_bytes()
+        except FileNotFoundError:
+            pass
+
+        data = network.render(z, x, y)
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            marker = self.cache_dir / network.version / CACHE_MARKER
+            if not marker.exists():
+                marker.touch()
+            # Written next to its final name and renamed, so readers never see a partial tile
+            fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except OSError as e:
+            logger.warning("Could not cache tile %d/%d/%d on disk: %s", z, x, y, e)
+        return data
+
+
+network_tiles = NetworkTiles()
@@ -2,6 +2,9 @@
 const API_BASE_URL = window.location.origin;
 const BUS_ICON_URL = "assets/bus-icon.svg";
 const POLL_INTERVAL_MS = 2000;
+// Zoomed in at least this far, only buses in (a margin around) the visible map are fetched
+const VIEWPORT_MIN_ZOOM = 14;
+const VIEWPORT_PADDING = 0.2;
 
 const TILE_LAYERS = {
     dark: 'https://{s}.basemaps.cartocdn.com/dark_all/{z}/{x}/{y}{r}.png',
@@ -108,6 +111,20 @@ function stopPolling() {
     }
 }
 
+// Viewport as "min_lng,min_lat,max_lng,max_lat", or null for the whole fleet
+// (zoomed out, or the fleet view, which lists every bus)
+function viewportBbox() {
+    if (!map || map.getZoom() < VIEWPORT_MIN_ZOOM || !authorityView.classList.contains('hidden')) return null;
+    const b = map.getBounds().pad(VIEWPORT_PADDING);
+    return [b.getWest(), b.getSouth(), b.getEast(), b.getNorth()].map(v => v.toFixed(5)).join(',');
+}
+
+function sendViewport() {
+    if (!ws || ws.readyState !== WebSocket.OPEN) return;
+    const bbox = viewportBbox();
+    ws.send(JSON.stringify({ type: 'viewport', bbox: bbox ? bbox.split(',').map(Number) : null }));
+}
+
 function connectWebSocket() {
     if (ws && ws.readyState === WebSocket.OPEN) return;
 
@@ -116,6 +133,7 @@ function connectWebSocket() {
     ws.onopen = () => {
         updateConnectionBadge(true);
         stopPolling();
+        sendViewport();
         if (wsReconnectTimer) {
             clearTimeout(wsReconnectTimer);
             wsReconnectTimer = null;
@@ -154,6 +172,7 @@ function initMap() {
     map = L.map('map', { zoomControl: false, attributionControl: false }).setView([31.6339, 74.8723], 13);
     const isDark = document.documentElement.classList.contains('dark');
     setMapTheme(isDark ? 'dark' : 'light');
+    map.on('moveend', sendViewport);
     main();
 }
 
@@ -248,7 +267,7 @@ function processRouteDataForUI() {
             // Show all polylines on map so user can see & click them
             routePolylines[routeId].addTo(map);
             
-            fetchRouteShape(routeData.stops).then(latLngs => {
+            fetchRouteShape(routeId).then(latLngs => {
                 if (latLngs && routePolylines[routeId]) routePolylines[routeId].setLatLngs(latLngs);
             });
         }
@@ -301,15 +320,13 @@ function addStopLabelsToMap() {
     });
 }
 
-async function fetchRouteShape(stops) {
-    if (!stops || stops.length < 2) return null;
-    const coordinates = stops.map(s => `${s.lng},${s.lat}`).join(';');
+async function fetchRouteShape(routeId) {
     try {
-        const url = `https://router.project-osrm.org/route/v1/driving/${coordinates}?overview=full&geometries=geojson`;
-        const res = await fetch(url);
+        // Resolved and cached by the server's path service
+        const res = await fetch(`${API_BASE_URL}/routes/${encodeURIComponent(routeId)}/path`);
         if (res.ok) {
             const data = await res.json();
-            if (data.routes?.[0]) return data.routes[0].geometry.coordinates.map(c => [c[1], c[0]]);
+            if (data.coordinates?.length > 1) return data.coordinates;
         }
     } catch (e) {}
     return null;
@@ -317,7 +334,8 @@ async function fetchRouteShape(stops) {
 
 async function fetchLiveBusData() {
     try {
-        const res = await fetch(`${API_BASE_URL}/buses/live`);
+        const bbox = viewportBbox();
+        const res = await fetch(`${API_BASE_URL}/buses/live${bbox ? `?bbox=${bbox}` : ''}`);
         if (!res.ok) return;
         const liveBuses = await res.json();
         handleLiveBusUpdate(liveBuses);
@@ -335,7 +353,11 @@ function handleLiveBusUpdate(liveBuses) {
     const formattedBuses = [];
 
     liveBuses.forEach(bus => {
-        const busData = { id: bus.vehicle_id, routeId: bus.route_id, lat: bus.lat, lng: bus.lng, speed: bus.speed, passenger_count: bus.passenger_count };
+        const busData = {
+            id: bus.vehicle_id, routeId: bus.route_id, lat: bus.lat, lng: bus.lng, speed: bus.speed, passenger_count: bus.passenger_count,
+            distanceAlong: bus.distance_along_m ?? null, nextStop: bus.next_stop ?? null,
+            nextStopIndex: bus.next_stop_index ?? null, nextStopDistance: bus.next_stop_distance_m ?? null,
+        };
         liveBusDataCache[busData.id] = busData;
         updateBusMarker(busData);
         activeBusIds.add(busData.id);
@@ -364,9 +386,12 @@ function selectBus(busData) {
     updateBusDetailCard(busData);
 }
 
-async function fetchMLEta(distanceMeters, speedKmh) {
+async function fetchMLEta(distanceMeters, speedKmh, routeId, segmentIndex) {
     try {
-        const res = await fetch(`${API_BASE_URL}/eta?distance_meters=${distanceMeters}&current_speed_kmh=${Math.max(speedKmh, 5)}`);
+        let url = `${API_BASE_URL}/eta?distance_meters=${distanceMeters}&current_speed_kmh=${Math.max(speedKmh, 5)}`;
+        if (routeId) url += `&route_id=${encodeURIComponent(routeId)}`;
+        if (routeId && segmentIndex >= 0) url += `&segment_index=${segmentIndex}`;
+        const res = await fetch(url);
         if (res.ok) {
             const data = await res.json();
             return data.prediction;
@@ -378,40 +403,28 @@ async function fetchMLEta(distanceMeters, speedKmh) {
 function updateBusDetailCard(busData) {
     if (!busData) return;
     
-    // Calculate ETA (client-side fallback)
-    const route = allRoutesData[busData.routeId];
+    // Next stop comes from the server, which tracks the bus along its route
     let etaText = "-- min";
     let nextStopName = "Calculating...";
 
-    if (route) {
-        let minDist = Infinity;
-        let nearest = null;
-        const busLatLng = L.latLng(busData.lat, busData.lng);
-
-        route.stops.forEach(stop => {
-            const stopLatLng = L.latLng(stop.lat, stop.lng);
-            const dist = busLatLng.distanceTo(stopLatLng);
-            if (dist < minDist) {
-                minDist = dist;
-                nearest = stop;
-            }
-        });
-
-        if (nearest) {
-            nextStopName = nearest.name;
-            const speed = Math.max(busData.speed, 30);
-            const seconds = minDist / (speed * 1000 / 3600);
-            etaText = minDist < 50 ? "Arrived" : `${Math.ceil(seconds / 60)} min`;
-
-            // Try ML ETA in background (non-blocking)
-            if (minDist >= 50) {
-                fetchMLEta(minDist, busData.speed).then(mlEta => {
-                    if (mlEta && selectedBusId === busData.id) {
-                        busDetailEta.textContent = mlEta;
-                    }
-                });
-            }
+    if (busData.nextStop) {
+        const dist = busData.nextStopDistance;
+        nextStopName = busData.nextStop;
+        // Client-side estimate until the ML ETA arrives
+        const speed = Math.max(busData.speed, 30);
+        const seconds = dist / (speed * 1000 / 3600);
+        etaText = dist < 50 ? "Arrived" : `${Math.ceil(seconds / 60)} min`;
+
+        // Try ML ETA in background (non-blocking)
+        if (dist >= 50) {
+            fetchMLEta(dist, busData.speed, busData.routeId, busData.nextStopIndex - 1).then(mlEta => {
+                if (mlEta && selectedBusId === busData.id) {
+                    busDetailEta.textContent = mlEta;
+                }
+            });
         }
+    } else if (busData.nextStopIndex === null && busData.distanceAlong !== null) {
+        nextStopName = "End of route";
     }
 
     busDetailId.textContent = busData.id;
@@ -706,6 +719,7 @@ window.switchView = function(viewName) {
     [finderBtn, commuterBtn, authorityBtn].forEach(b => b.classList.remove('active'));
     document.getElementById(`${viewName}-view`).classList.remove('hidden');
     document.getElementById(`${viewName}-view-btn`).classList.add('active');
+    sendViewport();
 };
 
 userLocBtn.addEventListener('click', () => {
@@ -0,0 +1,327 @@
+"""
+ETA backtest — how wrong /eta would have been, replayed over `vehicle_logs`.
+
+Every ping becomes a query to ETAPredictor for each stop still ahead on the
+vehicle's route, exactly as /eta is called (remaining distance, speed in
+m/s, hour). The answer is compared with the time the same vehicle was
+actually seen passing that stop later in its trajectory. Errors are
+aggregated by route, hour of day and horizon (the true time to arrival).
+
+Logs are streamed one day at a time and split into vehicle-day runs, which
+are replayed with vectorized NumPy in a pool of worker processes, each
+holding its own copy of the model.
+
+Usage:
+    python -m ml_engine.backtest --days 30
+    python -m ml_engine.backtest --since 2025-01-01 --until 2025-02-01 --output backtest.csv
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from ml_engine.geo import along_route_m, stop_offsets_m
+from ml_engine.predictor import ETAPredictor
+from ml_engine.vehicle_logs import _TRIP_GAP_M, iter_log_windows, load_route_stops
+
+logger = logging.getLogger("smart_transit.ml")
+
+HOURS = 24
+# Lower edges of the horizon buckets in minutes; the last bucket is open-ended
+HORIZON_EDGES_MIN = (0, 2, 5, 10, 15, 20, 30, 45)
+HORIZON_LABELS = [f"{a}-{b}" for a, b in zip(HORIZON_EDGES_MIN, HORIZON_EDGES_MIN[1:])] + [f"{HORIZON_EDGES_MIN[-1]}+"]
+# Absolute errors are also histogrammed so percentiles survive merging
+ABS_ERROR_BIN_MIN = 0.5
+ABS_ERROR_BINS = 60  # the last bin collects everything from 29.5 minutes up
+# Per-cell sums ahead of the histogram: count, error, |error|, error^2
+_SUMS = 4
+
+
+@dataclass
+class BacktestConfig:
+    # A silence longer than this ends a trip
+    max_gap_s: float = 120.0
+    # Moving back along the route by more than this starts a new trip (next run of the route)
+    reset_m: float = 300.0
+    # Pings further than this from the route are ignored
+    max_off_route_m: float = 150.0
+    # Predictions further ahead than this are not scored; also how far past a day we read
+    max_horizon_s: float = 3600.0
+    # A vehicle this close to a stop is at it, not predicting it
+    at_stop_m: float = 5.0
+
+
+def replay_run(t, lat, lng, speed_kmh, hour, stop_lat, stop_lng, predictor, config: BacktestConfig,
+               start: float = -np.inf, end: float = np.inf):
+    """
+    Replay one vehicle's pings on one route.
+
+    Pings in [start, end) each predict arrival at every stop ahead of them;
+    later pings only serve as evidence of when stops were actually reached.
+    A stop's arrival time is interpolated between the pings either side of it.
+
+    Returns:
+        (hour, actual minutes, predicted minutes) arrays, one entry per
+        (ping, downstream stop) pair that was actually reached in time.
+    """
+    offsets = stop_offsets_m(stop_lat, stop_lng)
+    position, off_route = along_route_m(lat, lng, stop_lat, stop_lng, offsets)
+    keep = off_route <= config.max_off_route_m
+    t, position, speed_kmh, hour = t[keep], position[keep], speed_kmh[keep], hour[keep]
+    n = t.shape[0]
+    empty = np.empty(0)
+    if n < 2:
+        return empty, empty, empty
+
+    # Trip ids; progress never moves backwards within a trip (GPS jitter) and
+    # jumps by _TRIP_GAP_M between trips so one sorted search covers them all
+    new_trip = (np.diff(t) > config.max_gap_s) | (np.diff(position) < -config.reset_m)
+    trip = np.concatenate(([0], np.cumsum(new_trip)))
+    progress = np.maximum.accumulate(position + trip * _TRIP_GAP_M)
+
+    origins = np.flatnonzero((t >= start) & (t < end))
+    current = progress[origins] - trip[origins] * _TRIP_GAP_M
+    first_stop = np.searchsorted(offsets, current + config.at_stop_m, side="right")
+    counts = offsets.shape[0] - first_stop
+
+    # One row per (origin ping, stop ahead of it)
+    pair = np.repeat(np.arange(origins.shape[0]), counts)
+    stop = first_stop[pair] + np.arange(pair.shape[0]) - np.repeat(np.cumsum(counts) - counts, counts)
+    origin = origins[pair]
+    target = trip[origin] * _TRIP_GAP_M + offsets[stop]
+
+    # First ping at or past the stop, in the same trip
+    after = np.searchsorted(progress, target, side="left")
+    reached = after < n
+    after = np.minimum(after, n - 1)
+    reached &= trip[after] == trip[origin]
+    before = after - 1
+    with np.errstate(invalid="ignore", divide="ignore"):
+        fraction = (target - progress[before]) / (progress[after] - progress[before])
+    arrival = t[before] + fraction * (t[after] - t[before])
+    actual_s = arrival - t[origin]
+    reached &= actual_s <= config.max_horizon_s
+
+    origin, stop, actual_s = origin[reached], stop[reached], actual_s[reached]
+    distance = offsets[stop] - current[pair[reached]]
+    # Same inputs as /eta: remaining meters, speed in m/s, hour of day
+    predicted_min = predictor.predict_batch(distance, speed_kmh[origin] / 3.6, hour[origin])
+    return hour[origin], actual_s / 60.0, np.asarray(predicted_min, dtype=np.float64)
+
+
+class BacktestStats:
+    """
+    Prediction errors summed per (route, hour, horizon bucket).
+
+    Cells hold sums and an absolute-error histogram, so stats from any
+    number of runs merge by addition.
+    """
+
+    def __init__(self):
+        self.cells: dict = {}  # route_id -> (HOURS, horizons, _SUMS + ABS_ERROR_BINS)
+
+    def add(self, route_id: str, hour, actual_min, predicted_min) -> None:
+        if len(actual_min) == 0:
+            return
+        error = predicted_min - actual_min
+        horizon = np.searchsorted(HORIZON_EDGES_MIN[1:], actual_min, side="right")
+        cell = hour.astype(np.int64) % HOURS * len(HORIZON_LABELS) + horizon
+        n_cells = HOURS * len(HORIZON_LABELS)
+
+        sums = np.stack([
+            np.bincount(cell, minlength=n_cells),
+            np.bincount(cell, weights=error, minlength=n_cells),
+            np.bincount(cell, weights=np.abs(error), minlength=n_cells),
+            np.bincount(cell, weights=error * error, minlength=n_cells),
+        ], axis=-1)
+        error_bin = np.minimum(np.abs(error) // ABS_ERROR_BIN_MIN, ABS_ERROR_BINS - 1).astype(np.int64)
+        hist = np.bincount(cell * ABS_ERROR_BINS + error_bin, minlength=n_cells * ABS_ERROR_BINS)
+
+        block = np.concatenate([sums, hist.reshape(n_cells, ABS_ERROR_BINS)], axis=-1)
+        self._merge_cells(route_id, block.reshape(HOURS, len(HORIZON_LABELS), -1))
+
+    def merge(self, other: "BacktestStats") -> None:
+        for route_id, block in other.cells.items():
+            self._merge_cells(route_id, block)
+
+    def _merge_cells(self, route_id, block) -> None:
+        if route_id in self.cells:
+            self.cells[route_id] += block
+        else:
+            self.cells[route_id] = block.astype(np.float64)
+
+    @property
+    def predictions(self) -> int:
+        return int(sum(block[..., 0].sum() for block in self.cells.values()))
+
+    def table(self, by=("route_id", "hour", "horizon")):
+        """
+        Error summary as a DataFrame grouped by any of route_id, hour and horizon.
+
+        Errors are predicted minus actual minutes: positive means the bus
+        arrived earlier than predicted.
+        """
+        import pandas as pd
+
+        if not self.cells:
+            return pd.DataFrame(columns=[*by, "n", "bias_min", "mae_min", "rmse_min", "p50_abs_min", "p90_abs_min"])
+
+        routes = sorted(self.cells)
+        cube = np.stack([self.cells[r] for r in routes])  # (routes, hours, horizons, columns)
+        axes = {"route_id": (0, routes), "hour": (1, list(range(HOURS))), "horizon": (2, HORIZON_LABELS)}
+        summed = cube.sum(axis=tuple(axes[name][0] for name in axes if name not in by), keepdims=True)
+
+        index = pd.MultiIndex.from_product([axes[name][1] if name in by else [None] for name in axes], names=list(axes))
+        flat = summed.reshape(-1, summed.shape[-1])
+        count = flat[:, 0]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            frame = pd.DataFrame({
+                "n": count.astype(np.int64),
+                "bias_min": flat[:, 1] / count,
+                "mae_min": flat[:, 2] / count,
+                "rmse_min": np.sqrt(flat[:, 3] / count),
+                "p50_abs_min": _histogram_quantile(flat[:, _SUMS:], 0.5),
+                "p90_abs_min": _histogram_quantile(flat[:, _SUMS:], 0.9),
+            }, index=index)
+        frame = frame.reset_index()[[*[name for name in axes if name in by], *frame.columns]]
+        return frame[frame["n"] > 0].round(3).reset_index(drop=True)
+
+
+def _histogram_quantile(hist: np.ndarray, q: float) -> np.ndarray:
+    """Upper bin edge (minutes) where each row's cumulative share reaches q."""
+    cumulative = np.cumsum(hist, axis=-1)
+    rank = cumulative[:, -1:] * q
+    return (np.minimum((cumulative < rank).sum(axis=-1), ABS_ERROR_BINS - 1) + 1) * ABS_ERROR_BIN_MIN
+
+
+# --- Worker processes ---
+
+_worker: dict = {}
+
+
+def _init_worker(model_path: str, route_stops: dict, config: BacktestConfig) -> None:
+    _worker.update(predictor=ETAPredictor(model_path=model_path), route_stops=route_stops, config=config)
+
+
+def _replay_task(runs) -> BacktestStats:
+    """Worker: replay a list of (route_id, t, lat, lng, speed, hour, start, end) runs."""
+    stats = BacktestStats()
+    for route_id, t, lat, lng, speed, hour, start, end in runs:
+        stop_lat, stop_lng = _worker["route_stops"][route_id]
+        hours, actual, predicted = replay_run(
+            t, lat, lng, speed, hour, stop_lat, stop_lng, _worker["predictor"], _worker["config"], start, end,
+        )
+        stats.add(route_id, hours, actual, predicted)
+    return stats
+
+
+def split_runs(window, route_ids: list, route_stops: dict) -> list[tuple]:
+    """Cut a LogWindow into per-(vehicle, route) runs on routes with at least two stops."""
+    change = np.flatnonzero((np.diff(window.vehicle) != 0) | (np.diff(window.route) != 0)) + 1
+    runs = []
+    for lo, hi in zip(np.concatenate(([0], change)), np.concatenate((change, [window.t.shape[0]]))):
+        route_id = route_ids[window.route[lo]]
+        stops = route_stops.get(route_id)
+        if stops is None or len(stops[0]) < 2 or window.t[lo] >= window.end:
+            continue
+        rows = slice(lo, hi)
+        runs.append((route_id, window.t[rows], window.lat[rows], window.lng[rows],
+                     window.speed[rows], window.hour[rows], window.start, window.end))
+    return runs
+
+
+async def run_backtest(conn, since: datetime, until: datetime, model_path: str,
+                       config: BacktestConfig | None = None, workers: int | None = None,
+                       runs_per_task: int = 16, tz: str = "UTC") -> BacktestStats:
+    """
+    Replay `vehicle_logs` in [since, until) one day at a time on a process pool.
+
+    At most a couple of tasks per worker are in flight, so memory is bounded
+    by the day being read, not the whole range. Hours are local to `tz`, as
+    in training and serving.
+    """
+    config = config or BacktestConfig()
+    workers = workers or os.cpu_count() or 1
+    route_stops = await load_route_stops(conn)
+    loop = asyncio.get_running_loop()
+    stats = BacktestStats()
+    codes: dict = {}
+    route_ids: list = []
+    pending: set = set()
+
+    def collect(done):
+        for future in done:
+            stats.merge(future.result())
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(model_path, route_stops, config)) as pool:
+        async for window in iter_log_windows(
+            conn, since, until, window=timedelta(days=1), lookahead=timedelta(seconds=config.max_horizon_s), codes=codes,
+            tz=tz,
+        ):
+            route_ids.extend([None] * (len(codes) - len(route_ids)))
+            for route_id, code in codes.items():
+                route_ids[code] = route_id
+            runs = split_runs(window, route_ids, route_stops)
+            for i in range(0, len(runs), runs_per_task):
+                pending.add(loop.run_in_executor(pool, _replay_task, runs[i:i + runs_per_task]))
+                if len(pending) >= 2 * workers:
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    collect(done)
+            logger.info("Backtest %s: %d pings in %d vehicle runs queued",
+                        datetime.fromtimestamp(window.start).date(), window.t.shape[0], len(runs))
+        if pending:
+            done, _ = await asyncio.wait(pending)
+            collect(done)
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backtest ETA predictions against recorded vehicle_logs")
+    parser.add_argument("--since", type=datetime.fromisoformat, help="Start of the log range")
+    parser.add_argument("--until", type=datetime.fromisoformat, help="End of the log range")
+    parser.add_argument("--days", type=float, default=7.0, help="Range length when --since is omitted")
+    parser.add_argument("--model", help="Model to replay (default: ML_MODEL_PATH)")
+    parser.add_argument("--workers", type=int, help="Replay processes (default: one per CPU)")
+    parser.add_argument("--max-horizon-min", type=float, default=60.0, help="Longest prediction scored")
+    parser.add_argument("--output", help="Write the full route x hour x horizon table to this CSV")
+    args = parser.parse_args()
+
+    import asyncpg
+    from backend.app.config import settings
+
+    until = args.until or datetime.now().astimezone().replace(hour=0, minute=0, second=0, microsecond=0)
+    since = args.since or until - timedelta(days=args.days)
+    config = BacktestConfig(max_horizon_s=args.max_horizon_min * 60)
+
+    async def run():
+        conn = await asyncpg.connect(settings.DATABASE_URL)
+        try:
+            return await run_backtest(conn, since, until, args.model or settings.ML_MODEL_PATH, config, args.workers,
+                                      tz=settings.TRANSIT_TIMEZONE)
+        finally:
+            await conn.close()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s | %(levelname)-7s | %(message)s")
+    stats = asyncio.run(run())
+    if not stats.predictions:
+        print("\n❌ No predictions could be scored in that range.")
+        return
+
+    print(f"\n✅ Scored {stats.predictions} predictions from {since:%Y-%m-%d} to {until:%Y-%m-%d}\n")
+    print(stats.table(by=("horizon",)).to_string(index=False))
+    print()
+    print(stats.table(by=("route_id",)).to_string(index=False))
+    if args.output:
+        stats.table().to_csv(args.output, index=False)
+        print(f"\nFull table written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
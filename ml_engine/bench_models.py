@@ -0,0 +1,212 @@
+"""
+Model benchmark — accuracy and serving cost of candidate ETA models, side by side.
+
+Candidates are trained in parallel worker processes; each saves the artifact
+the API would serve. The artifacts are then loaded one at a time through
+ETAPredictor, so accuracy, load time and latency are measured on exactly
+what production runs, without the other fits competing for CPU. Every
+candidate gets a JSON model card next to its artifact.
+
+Usage:
+    python -m ml_engine.bench_models                            # synthetic data, all candidates
+    python -m ml_engine.bench_models --data transit_data.csv --candidates gbr hgb
+    python -m ml_engine.bench_models --output-dir bench_models/ --rows 200000
+"""
+
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from ml_engine.predictor import ETAPredictor
+
+DEFAULT_OUTPUT_DIR = Path(__file__).resolve().parent / "bench_models"
+BATCH_SIZE = 1024
+
+# name -> how the trained estimator is served
+CANDIDATES = {
+    "gbr": "compiled",    # GradientBoostingRegressor, flat-array .npz
+    "hgb": "pickle",      # HistGradientBoostingRegressor, joblib pickle
+    "linear": "pickle",   # LinearRegression baseline
+    "grid": "grid",       # GradientBoostingRegressor tabulated into a lookup grid
+}
+
+
+def _estimator(name: str):
+    from sklearn.ensemble import GradientBoostingRegressor, HistGradientBoostingRegressor
+    from sklearn.linear_model import LinearRegression
+
+    if name in ("gbr", "grid"):
+        # Same configuration as train_model.py
+        return GradientBoostingRegressor(n_estimators=100, learning_rate=0.1, max_depth=5, random_state=42)
+    if name == "hgb":
+        return HistGradientBoostingRegressor(max_iter=200, random_state=42)
+    if name == "linear":
+        return LinearRegression()
+    raise ValueError(f"Unknown candidate: {name!r}")
+
+
+def load_dataset(data_file: str | None, rows: int, seed: int) -> tuple[pd.DataFrame, pd.Series]:
+    """Features and target from a generator CSV, or freshly generated rows."""
+    from ml_engine.dataset_generator import generate_chunk
+    from ml_engine.train_model import prepare_features
+
+    if data_file:
+        data = pd.read_csv(data_file)
+    else:
+        data = generate_chunk(rows, np.random.default_rng(seed))
+    return prepare_features(data)
+
+
+def _train_candidate(name: str, X_train: pd.DataFrame, y_train: pd.Series, output_dir: str) -> dict:
+    """Worker: fit one candidate and write its serving artifact(s)."""
+    import joblib
+    from ml_engine.compiled_model import export_gradient_boosting
+
+    started = time.perf_counter()
+    model = _estimator(name)
+    model.fit(X_train, y_train)
+    fit_seconds = time.perf_counter() - started
+
+    serving = CANDIDATES[name]
+    if serving == "pickle":
+        artifact = os.path.join(output_dir, f"{name}.pkl")
+        joblib.dump(model, artifact)
+        files = [artifact]
+    else:
+        artifact = os.path.join(output_dir, f"{name}.npz")
+        export_gradient_boosting(model, artifact, ETAPredictor.FEATURE_COLUMNS)
+        files = [artifact]
+        if serving == "grid":
+            grid_path = os.path.join(output_dir, f"{name}_grid.npy")
+            # Budget is not enforced here: the card reports the grid's accuracy instead
+            ETAPredictor(model_path=artifact).enable_grid(grid_path, error_budget_min=float("inf"))
+            files += [grid_path, str(Path(grid_path).with_suffix(".json"))]
+
+    params = {k: v for k, v in model.get_params().items() if isinstance(v, (int, float, str, bool, type(None)))}
+    return {"artifact": artifact, "files": files, "fit_seconds": fit_seconds, "params": params}
+
+
+def _load(name: str, artifact: str) -> ETAPredictor:
+    predictor = ETAPredictor(model_path=artifact)
+    if CANDIDATES[name] == "grid":
+        predictor.enable_grid(artifact.replace(".npz", "_grid.npy"), error_budget_min=float("inf"))
+    return predictor
+
+
+def _percentiles(samples_s) -> dict:
+    p50, p99 = np.percentile(samples_s, [50, 99])
+    return {"p50": round(float(p50) * 1e6, 2), "p99": round(float(p99) * 1e6, 2)}
+
+
+def measure_serving(name: str, artifact: str, X_test: np.ndarray, y_test: np.ndarray,
+                    single_calls: int = 2000, batch_calls: int = 200, loads: int = 5) -> dict:
+    """Accuracy, load time and latency of the served artifact (times in microseconds)."""
+    load_times = []
+    for _ in range(loads):
+        started = time.perf_counter()
+        predictor = _load(name, artifact)
+        load_times.append(time.perf_counter() - started)
+    if not predictor.ready:
+        raise RuntimeError(f"{artifact} could not be loaded")
+
+    predicted = predictor.predict_array(X_test)
+    residual = y_test - predicted
+    mae = float(np.mean(np.abs(residual)))
+    r2 = float(1 - np.sum(residual ** 2) / np.sum((y_test - y_test.mean()) ** 2))
+
+    rows = X_test[np.arange(single_calls) % len(X_test)]
+    single = np.empty(single_calls)
+    for i, (distance, speed, hour) in enumerate(rows):
+        started = time.perf_counter()
+        predictor.predict(distance, speed, hour)
+        single[i] = time.perf_counter() - started
+
+    batch_rows = X_test[np.arange(BATCH_SIZE) % len(X_test)]
+    predictor.predict_array(batch_rows)  # warm-up
+    batched = np.empty(batch_calls)
+    for i in range(batch_calls):
+        started = time.perf_counter()
+        predictor.predict_array(batch_rows)
+        batched[i] = time.perf_counter() - started
+
+    return {
+        "metrics": {"mae_minutes": round(mae, 4), "r2": round(r2, 4)},
+        "latency_us": {
+            "single_row": _percentiles(single),
+            f"batch_{BATCH_SIZE}": _percentiles(batched),
+        },
+        "batch_rows_per_sec": round(BATCH_SIZE / float(np.median(batched))),
+        "load_ms": {"median": round(float(np.median(load_times)) * 1e3, 2), "max": round(max(load_times) * 1e3, 2)},
+    }
+
+
+def run_benchmark(candidates, data_file=None, rows=100_000, output_dir=DEFAULT_OUTPUT_DIR,
+                  workers=None, seed=42) -> list[dict]:
+    from sklearn.model_selection import train_test_split
+
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    X, y = load_dataset(data_file, rows, seed)
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=seed)
+    X_test_arr = X_test.to_numpy(dtype=np.float32)
+    y_test_arr = y_test.to_numpy(dtype=np.float64)
+
+    with ProcessPoolExecutor(max_workers=workers or min(len(candidates), os.cpu_count() or 1)) as pool:
+        futures = {name: pool.submit(_train_candidate, name, X_train, y_train, str(output_dir)) for name in candidates}
+        trained = {name: future.result() for name, future in futures.items()}
+
+    cards = []
+    for name in candidates:
+        info = trained[name]
+        card = {
+            "name": name,
+            "serving": CANDIDATES[name],
+            "artifact": os.path.basename(info["artifact"]),
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "data": {"source": data_file or "synthetic", "train_rows": len(X_train), "test_rows": len(X_test)},
+            "fit_seconds": round(info["fit_seconds"], 3),
+            "size_bytes": sum(os.path.getsize(f) for f in info["files"]),
+            **measure_serving(name, info["artifact"], X_test_arr, y_test_arr),
+            "params": info["params"],
+        }
+        card_path = Path(info["artifact"]).with_suffix(".card.json")
+        card_path.write_text(json.dumps(card, indent=2))
+        cards.append(card)
+    return cards
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark ETA model candidates: accuracy and serving cost")
+    parser.add_argument("--candidates", nargs="+", choices=list(CANDIDATES), default=list(CANDIDATES))
+    parser.add_argument("--data", help="Generator CSV (default: generate --rows synthetic rows)")
+    parser.add_argument("--rows", type=int, default=100_000, help="Synthetic rows when --data is omitted")
+    parser.add_argument("--output-dir", type=Path, default=DEFAULT_OUTPUT_DIR, help="Artifacts and model cards")
+    parser.add_argument("--workers", type=int, help="Training processes (default: one per candidate)")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    cards = run_benchmark(args.candidates, args.data, args.rows, args.output_dir, args.workers, args.seed)
+
+    header = f"{'model':<8} {'MAE min':>8} {'R2':>7} {'1-row p50/p99 us':>18} {f'{BATCH_SIZE}-row p50/p99 us':>22} {'size KB':>9} {'load ms':>8}"
+    print(header)
+    print("-" * len(header))
+    for card in cards:
+        single = card["latency_us"]["single_row"]
+        batch = card["latency_us"][f"batch_{BATCH_SIZE}"]
+        print(
+            f"{card['name']:<8} {card['metrics']['mae_minutes']:>8.3f} {card['metrics']['r2']:>7.3f} "
+            f"{single['p50']:>8.1f}/{single['p99']:<9.1f} {batch['p50']:>10.1f}/{batch['p99']:<11.1f} "
+            f"{card['size_bytes'] / 1024:>9.1f} {card['load_ms']['median']:>8.1f}"
+        )
+    print(f"\nModel cards written to {args.output_dir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""
+ETAPredictor microbenchmark — reports predictions/sec for each inference path.
+
+Usage:
+    python -m ml_engine.bench_predictor                       # uses ML_MODEL_PATH (the served model)
+    python -m ml_engine.bench_predictor --model path/to/model.pkl --seconds 3
+    python -m ml_engine.bench_predictor --output bench_output.txt   # append a JSON line
+
+When the model file does not exist a synthetic model with the same
+configuration as train_model.py is fitted first (and compiled when a `.npz`
+is asked for), so the numbers are comparable across machines without
+training data. The legacy one-DataFrame-per-prediction path is only
+measured for pickled models, which sklearn can load directly.
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from ml_engine.predictor import ETAPredictor
+
+BATCH_SIZES = (1, 64, 1024, 16384)
+
+
+def _synthetic_model_path(workdir: str, suffix: str = ".pkl") -> str:
+    from sklearn.ensemble import GradientBoostingRegressor
+
+    rng = np.random.default_rng(42)
+    n = 20000
+    X = pd.DataFrame({
+        "distance_meters": rng.uniform(100, 5000, n),
+        "speed": rng.uniform(5, 50, n),
+        "hour": rng.integers(0, 24, n),
+    })
+    y = X["distance_meters"] / (X["speed"] * 1000 / 60) + rng.normal(0, 0.5, n)
+    model = GradientBoostingRegressor(n_estimators=100, learning_rate=0.1, max_depth=5, random_state=42)
+    model.fit(X, y)
+    path = os.path.join(workdir, f"eta_model{suffix}")
+    if suffix == ".npz":
+        from ml_engine.compiled_model import export_gradient_boosting
+        export_gradient_boosting(model, path, ETAPredictor.FEATURE_COLUMNS)
+    else:
+        joblib.dump(model, path)
+    return path
+
+
+def _rate(fn, rows_per_call: int, seconds: float) -> float:
+    """Call `fn` repeatedly for `seconds` and return rows predicted per second."""
+    fn()  # warm-up
+    calls = 0
+    start = time.perf_counter()
+    while (elapsed := time.perf_counter() - start) < seconds:
+        fn()
+        calls += 1
+    return calls * rows_per_call / elapsed
+
+
+def run_benchmark(model_path: str, seconds: float) -> dict:
+    predictor = ETAPredictor(model_path=model_path)
+    if not predictor.ready:
+        raise SystemExit(f"Model at {model_path} could not be loaded.")
+
+    rng = np.random.default_rng(0)
+    results = {}
+
+    results["scalar_predict"] = _rate(lambda: predictor.predict(1500.0, 8.0, 8), 1, seconds)
+
+    # The pre-fast-path implementation: one named DataFrame per prediction (sklearn pickles only)
+    if not str(model_path).endswith(".npz"):
+        legacy_model = joblib.load(model_path)
+        legacy_row = [[1500.0, 8.0, 8]]
+        results["scalar_dataframe_legacy"] = _rate(
+            lambda: legacy_model.predict(pd.DataFrame(legacy_row, columns=ETAPredictor.FEATURE_COLUMNS)),
+            1,
+            seconds,
+        )
+
+    for size in BATCH_SIZES:
+        features = np.column_stack((
+            rng.uniform(100, 5000, size),
+            rng.uniform(1, 15, size),
+            rng.integers(0, 24, size),
+        )).astype(np.float32)
+        results[f"predict_array_{size}"] = _rate(lambda: predictor.predict_array(features), size, seconds)
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure ETAPredictor predictions/sec")
+    parser.add_argument("--model", type=Path, help="Model file to benchmark (default: ML_MODEL_PATH)")
+    parser.add_argument("--seconds", type=float, default=2.0, help="Time budget per measurement")
+    parser.add_argument("--output", type=Path, help="Append results as one JSON line to this file")
+    args = parser.parse_args()
+
+    if args.model is None:
+        from backend.app.config import settings
+        args.model = Path(settings.ML_MODEL_PATH)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        model_path = str(args.model) if args.model.exists() else _synthetic_model_path(workdir, args.model.suffix)
+        results = run_benchmark(model_path, args.seconds)
+
+    print(f"{'path':<28} {'predictions/sec':>16}")
+    print("-" * 45)
+    for name, rate in results.items():
+        print(f"{name:<28} {rate:>16,.0f}")
+
+    if args.output:
+        record = {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "model": str(args.model),
+            "predictions_per_sec": {k: round(v, 1) for k, v in results.items()},
+        }
+        with open(args.output, "a") as fh:
+            fh.write(json.dumps(record) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+"""
+Compiled tree ensemble — serves a GradientBoosting model from flat NumPy arrays.
+
+`export_gradient_boosting` flattens every tree of a fitted
+`GradientBoostingRegressor` into contiguous feature / threshold / child /
+value arrays saved as one `.npz`. `CompiledTreeEnsemble` walks all trees for
+a whole batch at once with vectorized NumPy, so serving needs neither
+sklearn nor joblib and reproduces sklearn's output exactly. The arrays are
+memory-mapped on load, so worker processes serving the same file share one
+copy in the page cache.
+
+Convert an existing pickle:
+    python -m ml_engine.compiled_model ml_engine/eta_model.pkl ml_engine/eta_model.npz
+"""
+
+import argparse
+import os
+import struct
+import zipfile
+
+import numpy as np
+
+FORMAT_VERSION = 1
+
+# Rows evaluated per chunk; bounds the (rows x trees) index matrix
+_CHUNK_ROWS = 32768
+
+
+def export_gradient_boosting(model, path, feature_names: list[str]) -> None:
+    """
+    Flatten a fitted GradientBoostingRegressor into a `.npz` file.
+
+    Leaves are encoded as nodes whose children point back at themselves, so
+    evaluation can run a fixed `max_depth` steps without masking. The file is
+    written beside `path` and renamed into place: a server may have the old
+    file memory-mapped, and truncating it in place would crash that server.
+    """
+    if getattr(model, "init_", None) == "zero":
+        baseline = 0.0
+    elif hasattr(model.init_, "constant_"):
+        baseline = float(np.ravel(model.init_.constant_)[0])
+    else:
+        raise ValueError("Only constant (default) or 'zero' init estimators can be compiled.")
+    if model.estimators_.shape[1] != 1:
+        raise ValueError("Only single-output regressors can be compiled.")
+
+    features, thresholds, lefts, rights, values, roots = [], [], [], [], [], []
+    offset = 0
+    max_depth = 0
+    for estimator in model.estimators_[:, 0]:
+        tree = estimator.tree_
+        n = tree.node_count
+        node_ids = np.arange(n)
+        is_leaf = tree.children_left == -1
+
+        features.append(np.where(is_leaf, 0, tree.feature))
+        thresholds.append(np.where(is_leaf, np.inf, tree.threshold))
+        lefts.append(np.where(is_leaf, node_ids, tree.children_left) + offset)
+        rights.append(np.where(is_leaf, node_ids, tree.children_right) + offset)
+        values.append(tree.value[:, 0, 0])
+        roots.append(offset)
+        max_depth = max(max_depth, tree.max_depth)
+        offset += n
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as fh:
+        np.savez(
+            fh,
+            format_version=np.int32(FORMAT_VERSION),
+            feature_names=np.array(feature_names),
+            # Index arrays are stored as int64 so they can be used for fancy indexing without a copy
+            feature=np.concatenate(features).astype(np.int64),
+            threshold=np.concatenate(thresholds).astype(np.float64),
+            left=np.concatenate(lefts).astype(np.int64),
+            right=np.concatenate(rights).astype(np.int64),
+            value=np.concatenate(values).astype(np.float64),
+            roots=np.array(roots, dtype=np.int64),
+            baseline=np.float64(baseline),
+            learning_rate=np.float64(model.learning_rate),
+            max_depth=np.int32(max_depth),
+        )
+    os.replace(tmp_path, path)
+
+
+# Fixed part of a ZIP local file header; name and extra-field lengths are its last two fields
+_ZIP_LOCAL_HEADER = struct.Struct("<4s5H3L2H")
+
+
+def _mmap_npz(path) -> dict:
+    """
+    Open the arrays of an uncompressed `.npz` as read-only memory maps.
+
+    `np.load` cannot memory-map archive members, but `np.savez` stores them
+    uncompressed, so each member's data sits at a fixed file offset. Scalars
+    and compressed members are read normally.
+    """
+    arrays = {}
+    with open(path, "rb") as fh, zipfile.ZipFile(fh) as archive:
+        for info in archive.infolist():
+            name = info.filename.removesuffix(".npy")
+            if info.compress_type != zipfile.ZIP_STORED:
+                with archive.open(info) as member:
+                    arrays[name] = np.lib.format.read_array(member, allow_pickle=False)
+                continue
+
+            fh.seek(info.header_offset)
+            header = _ZIP_LOCAL_HEADER.unpack(fh.read(_ZIP_LOCAL_HEADER.size))
+            fh.seek(info.header_offset + _ZIP_LOCAL_HEADER.size + header[-2] + header[-1])
+            version = np.lib.format.read_magic(fh)
+            if version == (1, 0):
+                shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(fh)
+            else:
+                shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(fh)
+            if dtype.hasobject:
+                raise ValueError(f"'{name}' holds Python objects and cannot be loaded safely")
+
+            if not shape:
+                arrays[name] = np.fromfile(fh, dtype=dtype, count=1).reshape(())
+            else:
+                arrays[name] = np.memmap(
+                    path, dtype=dtype, mode="r", offset=fh.tell(), shape=shape,
+                    order="F" if fortran_order else "C",
+                )
+    return arrays
+
+
+class CompiledTreeEnsemble:
+    """Vectorized evaluator for ensembles written by `export_gradient_boosting`."""
+
+    def __init__(self, arrays):
+        version = int(arrays["format_version"])
+        if version != FORMAT_VERSION:
+            raise ValueError(f"Unsupported compiled model format {version}")
+        self.feature_names_in_ = np.asarray(arrays["feature_names"]).astype(str)
+        self.n_features_in_ = len(self.feature_names_in_)
+        self.feature = np.asarray(arrays["feature"], dtype=np.intp)
+        self.threshold = np.asarray(arrays["threshold"], dtype=np.float64)
+        self.left = np.asarray(arrays["left"], dtype=np.intp)
+        self.right = np.asarray(arrays["right"], dtype=np.intp)
+        self.value = np.asarray(arrays["value"], dtype=np.float64)
+        self.roots = np.asarray(arrays["roots"], dtype=np.intp)
+        self.baseline = float(arrays["baseline"])
+        self.learning_rate = float(arrays["learning_rate"])
+        self.max_depth = int(arrays["max_depth"])
+
+    @classmethod
+    def load(cls, path, mmap: bool = True) -> "CompiledTreeEnsemble":
+        if mmap:
+            return cls(_mmap_npz(path))
+        with np.load(path, allow_pickle=False) as arrays:
+            return cls({name: arrays[name] for name in arrays.files})
+
+    @property
+    def nbytes(self) -> int:
+        return sum(a.nbytes for a in (self.feature, self.threshold, self.left, self.right, self.value, self.roots))
+
+    def predict(self, X) -> np.ndarray:
+        """
+        Predict for an (n, n_features) array.
+
+        Features are compared in float32, as sklearn does, and tree outputs
+        are accumulated in stage order so results match sklearn exactly.
+        """
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim != 2 or X.shape[1] != self.n_features_in_:
+            raise ValueError(f"Expected (n, {self.n_features_in_}) features, got {X.shape}")
+
+        out = np.empty(X.shape[0], dtype=np.float64)
+        for start in range(0, X.shape[0], _CHUNK_ROWS):
+            chunk = X[start:start + _CHUNK_ROWS]
+            out[start:start + len(chunk)] = self._predict_chunk(chunk)
+        return out
+
+    def _predict_chunk(self, X: np.ndarray) -> np.ndarray:
+        # One node index per (row, tree); every step moves all of them one level down
+        flat = X.ravel()
+        row_offsets = (np.arange(X.shape[0], dtype=np.intp) * X.shape[1])[:, None]
+        nodes = np.broadcast_to(self.roots, (X.shape[0], self.roots.shape[0])).copy()
+        for _ in range(self.max_depth):
+            x = flat[row_offsets + self.feature[nodes]]
+            nodes = np.where(x <= self.threshold[nodes], self.left[nodes], self.right[nodes])
+
+        leaf_values = self.value[nodes]
+        out = np.full(X.shape[0], self.baseline, dtype=np.float64)
+        for stage in range(leaf_values.shape[1]):
+            out += self.learning_rate * leaf_values[:, stage]
+        return out
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compile a pickled GradientBoostingRegressor to .npz")
+    parser.add_argument("model", help="Path to the joblib-pickled model")
+    parser.add_argument("output", help="Destination .npz path")
+    args = parser.parse_args()
+
+    import joblib
+    from ml_engine.predictor import ETAPredictor
+
+    model = joblib.load(args.model)
+    export_gradient_boosting(model, args.output, ETAPredictor.FEATURE_COLUMNS)
+    print(f"✅ Compiled {len(model.estimators_)} trees to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
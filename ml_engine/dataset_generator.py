@@ -1,108 +1,212 @@
-import pandas as pd
-import numpy as np
+import argparse
 import os
-from datetime import datetime, timedelta
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+# --- 1. Define Static Variables ---
+
+# Define a few synthetic routes and distances (in kilometers)
+ROUTES = {
+    'R-A1': {'avg_speed_kph': 30, 'base_travel_time_min': 5, 'distance_km': 2.5},
+    'R-B2': {'avg_speed_kph': 20, 'base_travel_time_min': 8, 'distance_km': 3.0},
+    'R-C3': {'avg_speed_kph': 45, 'base_travel_time_min': 3, 'distance_km': 2.2},
+}
+
+# Define potential stop pairs for each route (for realism)
+STOP_PAIRS = {
+    'R-A1': [('S-A1', 'S-A2'), ('S-A2', 'S-A3'), ('S-A3', 'S-A4')],
+    'R-B2': [('S-B1', 'S-B2'), ('S-B2', 'S-B3')],
+    'R-C3': [('S-C1', 'S-C2'), ('S-C2', 'S-C3'), ('S-C3', 'S-C4'), ('S-C4', 'S-C5')],
+}
+
+# Time period for the simulation (e.g., 6 months)
+START_DATE = np.datetime64('2025-01-01T00:00', 'm')
+SIMULATION_MINUTES = 60 * 24 * 180
+
+WEATHER = ['Clear', 'Rainy', 'Snowy']
+WEATHER_P = [0.7, 0.2, 0.1]
+WEATHER_MULT = np.array([1.0, 1.15, 1.30])
+RUSH_HOURS = [7, 8, 16, 17]
 
-def generate_smart_transit_data(num_records=20000, output_file='transit_data.csv'):
+# Lookup tables so every per-row quantity is a single fancy-indexing step
+ROUTE_IDS = list(ROUTES)
+_STOPS = sorted({stop for pairs in STOP_PAIRS.values() for pair in pairs for stop in pair})
+_PAIR_COUNT = np.array([len(STOP_PAIRS[r]) for r in ROUTE_IDS])
+_PAIR_OFFSET = np.concatenate(([0], np.cumsum(_PAIR_COUNT)[:-1]))
+_PAIR_START = np.array([_STOPS.index(a) for r in ROUTE_IDS for a, _ in STOP_PAIRS[r]])
+_PAIR_END = np.array([_STOPS.index(b) for r in ROUTE_IDS for _, b in STOP_PAIRS[r]])
+_SEGMENT_KM = np.array([ROUTES[r]['distance_km'] for r in ROUTE_IDS]) / _PAIR_COUNT
+_AVG_SPEED_KPH = np.array([ROUTES[r]['avg_speed_kph'] for r in ROUTE_IDS], dtype=np.float64)
+# 2025-01-01 was a Wednesday (Monday=0)
+_START_DAY_OF_WEEK = 2
+
+# Written into every Parquet dataset directory this module creates, so a rerun
+# only ever replaces its own output (readers skip files starting with '_')
+DATASET_MARKER = '_SMART_TRANSIT_DATASET'
+
+
+def generate_chunk(num_records, rng):
     """
-    Generates a synthetic dataset for a Smart Transit ETA prediction model.
+    Generates one chunk of synthetic trip records with vectorized NumPy.
 
     The model predicts 'travel_time_min' based on route, time, and traffic conditions.
     """
-    print(f"Generating {num_records} transit records...")
-
-    # --- 1. Define Static Variables ---
-    
-    # Define a few synthetic routes and distances (in kilometers)
-    routes = {
-        'R-A1': {'avg_speed_kph': 30, 'base_travel_time_min': 5, 'distance_km': 2.5},
-        'R-B2': {'avg_speed_kph': 20, 'base_travel_time_min': 8, 'distance_km': 3.0},
-        'R-C3': {'avg_speed_kph': 45, 'base_travel_time_min': 3, 'distance_km': 2.2},
-    }
-    route_ids = list(routes.keys())
-    
-    # Define potential stop pairs for each route (for realism)
-    stop_pairs = {
-        'R-A1': [('S-A1', 'S-A2'), ('S-A2', 'S-A3'), ('S-A3', 'S-A4')],
-        'R-B2': [('S-B1', 'S-B2'), ('S-B2', 'S-B3')],
-        'R-C3': [('S-C1', 'S-C2'), ('S-C2', 'S-C3'), ('S-C3', 'S-C4'), ('S-C4', 'S-C5')],
-    }
-
-    # Time period for the simulation (e.g., 6 months)
-    start_date = datetime(2025, 1, 1)
-    
     # --- 2. Generate Features ---
-    
-    data = {
-        'route_id': np.random.choice(route_ids, num_records),
-        'stop_start': np.empty(num_records, dtype=object),
-        'stop_end': np.empty(num_records, dtype=object),
-        'timestamp': [start_date + timedelta(minutes=np.random.randint(0, 60 * 24 * 180)) 
-                      for _ in range(num_records)],
-    }
-    
-    # Assign specific stop pairs based on the chosen route
-    for route_id in route_ids:
-        indices = np.where(data['route_id'] == route_id)[0]
-        if len(indices) > 0:
-            pair_choices = np.random.choice(len(stop_pairs[route_id]), len(indices))
-            for i, idx in enumerate(indices):
-                start, end = stop_pairs[route_id][pair_choices[i]]
-                data['stop_start'][idx] = start
-                data['stop_end'][idx] = end
-    
-    df = pd.DataFrame(data)
+    route_idx = rng.integers(0, len(ROUTE_IDS), num_records)
+    pair_idx = _PAIR_OFFSET[route_idx] + (rng.random(num_records) * _PAIR_COUNT[route_idx]).astype(np.int64)
+    minutes = rng.integers(0, SIMULATION_MINUTES, num_records)
+    weather_idx = rng.choice(len(WEATHER), num_records, p=WEATHER_P)
 
     # Extract Time/Date Features
-    df['day_of_week'] = df['timestamp'].dt.dayofweek    # 0=Monday, 6=Sunday
-    df['hour_of_day'] = df['timestamp'].dt.hour         # 0-23
-    df['is_weekend'] = df['day_of_week'].isin([5, 6]).astype(int)
-    
-    # Assign Traffic/Weather Conditions
-    df['weather'] = np.random.choice(['Clear', 'Rainy', 'Snowy'], num_records, p=[0.7, 0.2, 0.1])
-    
+    day_of_week = (_START_DAY_OF_WEEK + minutes // (60 * 24)) % 7   # 0=Monday, 6=Sunday
+    hour_of_day = (minutes % (60 * 24)) // 60                       # 0-23
+    is_weekend = (day_of_week >= 5).astype(np.int64)
+
     # --- 3. Calculate Target (Travel Time) ---
+    distance_km = _SEGMENT_KM[route_idx]
+
+    # 3.1. Base Time (Time = Distance / Avg_Speed), in minutes
+    base_time_min = distance_km / _AVG_SPEED_KPH[route_idx] * 60
+
+    # 3.2. Traffic/Time-of-Day Multipliers: rush hour (7-9 AM and 4-6 PM),
+    # weekends (slightly lower traffic, overriding rush hour) and weather
+    traffic_mult = np.where(np.isin(hour_of_day, RUSH_HOURS), 1.4, 1.0)
+    traffic_mult[is_weekend == 1] = 0.95
+    traffic_mult *= WEATHER_MULT[weather_idx]
+
+    # Final Travel Time (Target Variable) plus random noise (to simulate unexpected events)
+    travel_time_min = base_time_min * traffic_mult + rng.normal(loc=0, scale=0.5, size=num_records)
+
+    return pd.DataFrame({
+        'route_id': pd.Categorical.from_codes(route_idx, ROUTE_IDS),
+        'stop_start': pd.Categorical.from_codes(_PAIR_START[pair_idx], _STOPS),
+        'stop_end': pd.Categorical.from_codes(_PAIR_END[pair_idx], _STOPS),
+        'timestamp': START_DATE + minutes.astype('timedelta64[m]'),
+        'day_of_week': day_of_week,
+        'hour_of_day': hour_of_day,
+        'is_weekend': is_weekend,
+        'weather': pd.Categorical.from_codes(weather_idx, WEATHER),
+        'distance_km': distance_km,
+        'travel_time_min': travel_time_min,
+    })
+
 
-    df['distance_km'] = df['route_id'].apply(lambda r: routes[r]['distance_km'] / len(stop_pairs[r]))
-    
-    # 3.1. Calculate Base Time (Time = Distance / Avg_Speed)
-    def calculate_base_time(row):
-        route_config = routes[row['route_id']]
-        # Time in hours = Distance (km) / Speed (km/h)
-        time_h = row['distance_km'] / route_config['avg_speed_kph']
-        return time_h * 60 # Convert to minutes
-
-    df['base_time_min'] = df.apply(calculate_base_time, axis=1)
-
-    # 3.2. Apply Traffic/Time-of-Day Multipliers
-    
-    # Rush Hour Multiplier (7-9 AM and 4-6 PM)
-    df['traffic_mult'] = 1.0
-    df.loc[df['hour_of_day'].isin([7, 8, 16, 17]), 'traffic_mult'] = 1.4 
-    
-    # Weekend Multiplier (Slightly lower traffic)
-    df.loc[df['is_weekend'] == 1, 'traffic_mult'] = 0.95 
-
-    # Weather Multiplier
-    df.loc[df['weather'] == 'Rainy', 'traffic_mult'] *= 1.15
-    df.loc[df['weather'] == 'Snowy', 'traffic_mult'] *= 1.30
-    
-    # Final Travel Time (Target Variable)
-    df['travel_time_min'] = df['base_time_min'] * df['traffic_mult']
-    
-    # Add Random Noise (to simulate unexpected events)
-    noise = np.random.normal(loc=0, scale=0.5, size=num_records)
-    df['travel_time_min'] += noise
-    
-    # Remove intermediate columns before saving
-    df.drop(columns=['traffic_mult', 'base_time_min'], inplace=True)
-    
-    # --- 4. Save and Summarize ---
-    df.to_csv(output_file, index=False)
+def _write_chunk(index, num_records, seed_seq, output, fmt):
+    """Generates chunk `index` and writes it; returns target summary stats."""
+    df = generate_chunk(num_records, np.random.default_rng(seed_seq))
+    if fmt == 'csv':
+        # One part file per chunk; the parent concatenates them in order
+        df.to_csv(f"{output}.part{index:05d}", index=False, header=(index == 0))
+    else:
+        df.to_parquet(
+            output, partition_cols=['route_id'], index=False,
+            basename_template=f"part-{index:05d}-{{i}}.parquet",
+        )
+    target = df['travel_time_min'].to_numpy()
+    return len(target), target.sum(), np.square(target).sum(), target.min(), target.max(), df.head() if index == 0 else None
+
+
+def _prepare_dataset_dir(path):
+    """Empties a Parquet dataset directory from a previous run, or creates it.
+
+    Refuses to touch an existing path that the generator did not create.
+    """
+    if os.path.isdir(path) and os.listdir(path):
+        if not os.path.exists(os.path.join(path, DATASET_MARKER)):
+            raise FileExistsError(
+                f"{path} exists and is not a dataset written by this generator; choose another --output"
+            )
+        shutil.rmtree(path)
+    elif os.path.exists(path) and not os.path.isdir(path):
+        raise FileExistsError(f"{path} exists and is not a directory; choose another --output")
+    os.makedirs(path, exist_ok=True)
+    open(os.path.join(path, DATASET_MARKER), 'w').close()
+
+
+def generate_smart_transit_data(num_records=20000, output_file='transit_data.csv', chunk_size=1_000_000,
+                                seed=None, fmt=None, workers=1):
+    """
+    Generates a synthetic dataset for a Smart Transit ETA prediction model.
+
+    Rows are produced in chunks of `chunk_size`, so memory stays bounded at
+    any `num_records`. Every chunk draws from its own stream spawned from
+    `seed`, which makes the output identical for any number of `workers`.
+
+    Args:
+        fmt: 'csv' (one file) or 'parquet' (a dataset directory partitioned
+            by route_id; needs pyarrow). Inferred from a .csv or .parquet
+            `output_file`, and required for any other path.
+        workers: Processes generating chunks in parallel.
+    """
+    if num_records <= 0:
+        raise ValueError(f"num_records must be positive, got {num_records}")
+    if chunk_size <= 0:
+        raise ValueError(f"chunk_size must be positive, got {chunk_size}")
+    if fmt is None:
+        suffix = os.path.splitext(str(output_file))[1].lower()
+        if suffix not in ('.csv', '.parquet'):
+            raise ValueError(f"Cannot infer the format of {output_file}; pass fmt='csv' or fmt='parquet'")
+        fmt = suffix[1:]
+    if fmt == 'parquet':
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise RuntimeError("Writing Parquet requires pyarrow (pip install pyarrow).")
+        _prepare_dataset_dir(str(output_file))
+
+    sizes = [min(chunk_size, num_records - start) for start in range(0, num_records, chunk_size)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    print(f"Generating {num_records} transit records in {len(sizes)} chunk(s) with {workers} worker(s)...")
+
+    args = [(i, n, s, str(output_file), fmt) for i, (n, s) in enumerate(zip(sizes, seeds))]
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            stats = list(pool.map(_write_chunk, *zip(*args)))
+    else:
+        stats = [_write_chunk(*a) for a in args]
+
+    if fmt == 'csv':
+        with open(output_file, 'wb') as out:
+            for i in range(len(sizes)):
+                part = f"{output_file}.part{i:05d}"
+                with open(part, 'rb') as fh:
+                    shutil.copyfileobj(fh, out)
+                os.remove(part)
+
+    # --- 4. Summarize ---
+    count = sum(s[0] for s in stats)
+    mean = sum(s[1] for s in stats) / count
+    std = np.sqrt(max(sum(s[2] for s in stats) / count - mean ** 2, 0.0))
     print(f"\n✅ Data generation complete. Saved to: {os.path.abspath(output_file)}")
     print("\nFirst 5 rows:")
-    print(df.head())
-    print(f"\nTarget Variable Summary ('travel_time_min'):\n{df['travel_time_min'].describe()}")
-    
+    print(stats[0][5])
+    print(f"\nTarget Variable Summary ('travel_time_min'): count={count} mean={mean:.3f} std={std:.3f} "
+          f"min={min(s[3] for s in stats):.3f} max={max(s[4] for s in stats):.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic transit trip records")
+    parser.add_argument("--records", type=int, default=50000)
+    parser.add_argument("--output", default="transit_data.csv",
+                        help="A .csv file, or a directory for a Parquet dataset")
+    parser.add_argument("--format", choices=["csv", "parquet"],
+                        help="Required unless --output ends in .csv or .parquet")
+    parser.add_argument("--chunk-size", type=int, default=1_000_000)
+    parser.add_argument("--seed", type=int, help="Seed for reproducible output")
+    parser.add_argument("--workers", type=int, default=1, help="Processes generating chunks in parallel")
+    args = parser.parse_args()
+    if args.records <= 0:
+        parser.error("--records must be positive")
+    if args.format is None and os.path.splitext(args.output)[1].lower() not in ('.csv', '.parquet'):
+        parser.error("--format is required when --output does not end in .csv or .parquet")
+    generate_smart_transit_data(
+        num_records=args.records, output_file=args.output, chunk_size=args.chunk_size,
+        seed=args.seed, fmt=args.format, workers=args.workers,
+    )
+
+
 if __name__ == "__main__":
-    generate_smart_transit_data(num_records=50000)
\ No newline at end of file
+    main()
@@ -0,0 +1,152 @@
+"""
+ETA lookup grid — the whole model tabulated over (hour, distance, speed).
+
+The model has only three inputs, so it can be evaluated once over a dense
+grid and served by trilinear interpolation: constant time per prediction,
+cheap enough for every bus x every stop on every tick. The table is saved
+as `.npy` and memory-mapped on load; a JSON sidecar records the grid bounds
+and a fingerprint of the model it was built from.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+from pathlib import Path
+from typing import Callable
+
+import numpy as np
+
+logger = logging.getLogger("smart_transit.ml")
+
+HOURS = 24
+
+
+def model_fingerprint(model_path) -> str:
+    """SHA-256 of the model file, used to detect stale grids."""
+    digest = hashlib.sha256()
+    with open(model_path, "rb") as fh:
+        for block in iter(lambda: fh.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class ETAGrid:
+    """
+    ETA table of shape (24, distance_points, speed_points) on uniform axes
+    starting at zero. Distances are meters, speeds meters per second.
+    """
+
+    def __init__(self, table: np.ndarray, distance_max: float, speed_max: float, fingerprint: str = ""):
+        self.table = table
+        self.distance_max = float(distance_max)
+        self.speed_max = float(speed_max)
+        self.fingerprint = fingerprint
+        self.distance_step = self.distance_max / (table.shape[1] - 1)
+        self.speed_step = self.speed_max / (table.shape[2] - 1)
+
+    # --- Construction ---
+
+    @classmethod
+    def build(
+        cls,
+        predict_array: Callable[[np.ndarray], np.ndarray],
+        distance_max: float = 20_000.0,
+        distance_points: int = 401,
+        speed_max: float = 30.0,
+        speed_points: int = 121,
+        fingerprint: str = "",
+    ) -> "ETAGrid":
+        """Evaluate `predict_array` at every grid node, one hour-slice per call."""
+        distances = np.linspace(0.0, distance_max, distance_points)
+        speeds = np.linspace(0.0, speed_max, speed_points)
+        dd, ss = np.meshgrid(distances, speeds, indexing="ij")
+
+        features = np.empty((dd.size, 3), dtype=np.float32)
+        features[:, 0] = dd.ravel()
+        features[:, 1] = ss.ravel()
+        table = np.empty((HOURS, distance_points, speed_points), dtype=np.float32)
+        for hour in range(HOURS):
+            features[:, 2] = hour
+            table[hour] = predict_array(features).reshape(distance_points, speed_points)
+        return cls(table, distance_max, speed_max, fingerprint)
+
+    def save(self, path) -> None:
+        """Write the table beside `path` and rename it in, since a live server may have it mapped."""
+        path = Path(path)
+        # Unique name: several inference workers may save the same grid at once
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=path.name, suffix=".tmp")
+        with os.fdopen(fd, "wb") as fh:
+            np.save(fh, self.table)
+        os.replace(tmp_path, path)
+        path.with_suffix(".json").write_text(json.dumps({
+            "distance_max": self.distance_max,
+            "speed_max": self.speed_max,
+            "fingerprint": self.fingerprint,
+        }))
+
+    @classmethod
+    def load(cls, path) -> "ETAGrid":
+        """Load a saved grid; the table is memory-mapped read-only."""
+        path = Path(path)
+        meta = json.loads(path.with_suffix(".json").read_text())
+        table = np.load(path, mmap_mode="r")
+        return cls(table, meta["distance_max"], meta["speed_max"], meta.get("fingerprint", ""))
+
+    # --- Serving ---
+
+    def _bilinear(self, hour_idx, i0, j0, td, ts) -> np.ndarray:
+        t = self.table
+        c00 = t[hour_idx, i0, j0]
+        c01 = t[hour_idx, i0, j0 + 1]
+        c10 = t[hour_idx, i0 + 1, j0]
+        c11 = t[hour_idx, i0 + 1, j0 + 1]
+        return (c00 * (1 - td) + c10 * td) * (1 - ts) + (c01 * (1 - td) + c11 * td) * ts
+
+    def interpolate(self, distances, speeds, hours) -> np.ndarray:
+        """
+        Trilinear interpolation; hours wrap around midnight.
+
+        Returns:
+            ETAs in minutes, NaN for rows outside the grid bounds.
+        """
+        d = np.asarray(distances, dtype=np.float64)
+        s = np.asarray(speeds, dtype=np.float64)
+        h = np.broadcast_to(np.asarray(hours, dtype=np.float64), d.shape)
+
+        fd = d / self.distance_step
+        fs = s / self.speed_step
+        i0 = np.clip(np.floor(fd).astype(np.intp), 0, self.table.shape[1] - 2)
+        j0 = np.clip(np.floor(fs).astype(np.intp), 0, self.table.shape[2] - 2)
+        td = fd - i0
+        ts = fs - j0
+
+        h_floor = np.floor(h)
+        h0 = h_floor.astype(np.intp) % HOURS
+        th = h - h_floor
+        out = self._bilinear(h0, i0, j0, td, ts)
+        fractional = th > 0
+        if fractional.any():
+            h1 = (h0[fractional] + 1) % HOURS
+            upper = self._bilinear(h1, i0[fractional], j0[fractional], td[fractional], ts[fractional])
+            out[fractional] = out[fractional] * (1 - th[fractional]) + upper * th[fractional]
+
+        in_range = (d >= 0) & (d <= self.distance_max) & (s >= 0) & (s <= self.speed_max)
+        out[~in_range] = np.nan
+        return out
+
+    def holdout_error(self, predict_array: Callable[[np.ndarray], np.ndarray], samples: int = 5000, seed: int = 0) -> dict:
+        """Compare the grid with the real model on random in-range points (minutes)."""
+        rng = np.random.default_rng(seed)
+        features = np.column_stack((
+            rng.uniform(0, self.distance_max, samples),
+            rng.uniform(0, self.speed_max, samples),
+            rng.integers(0, HOURS, samples),
+        )).astype(np.float32)
+        errors = np.abs(self.interpolate(features[:, 0], features[:, 1], features[:, 2]) - predict_array(features))
+        return {
+            "mean_abs_error": float(errors.mean()),
+            "p99_abs_error": float(np.percentile(errors, 99)),
+            "max_abs_error": float(errors.max()),
+        }
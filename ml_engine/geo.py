@@ -0,0 +1,74 @@
+"""
+Geodesy helpers shared by the ML pipeline — vectorized over NumPy arrays.
+"""
+
+import numpy as np
+
+EARTH_RADIUS_M = 6_371_000.0
+
+
+def haversine_m(lat1, lng1, lat2, lng2):
+    """Great-circle distance in meters; accepts scalars or broadcastable arrays of degrees."""
+    lat1, lng1, lat2, lng2 = (np.radians(np.asarray(a, dtype=np.float64)) for a in (lat1, lng1, lat2, lng2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+# Rows projected per step in project_to_segments; bounds the (points x segments) matrices
+_PROJECT_CHUNK = 65536
+
+
+def project_to_segments(lat, lng, stop_lat, stop_lng):
+    """
+    Snap points to the nearest leg of a polyline through consecutive stops.
+
+    Uses a local equirectangular projection, accurate to well under a meter
+    over a city. Requires at least two stops.
+
+    Returns:
+        (segment_index, fraction along that segment in [0, 1], distance to it in meters)
+    """
+    lat = np.asarray(lat, dtype=np.float64)
+    lng = np.asarray(lng, dtype=np.float64)
+    stop_lat = np.asarray(stop_lat, dtype=np.float64)
+    stop_lng = np.asarray(stop_lng, dtype=np.float64)
+
+    scale_y = np.radians(1.0) * EARTH_RADIUS_M
+    scale_x = scale_y * np.cos(np.radians(stop_lat.mean()))
+    ax, ay = stop_lng[:-1] * scale_x, stop_lat[:-1] * scale_y
+    dx, dy = stop_lng[1:] * scale_x - ax, stop_lat[1:] * scale_y - ay
+    length_sq = np.maximum(dx * dx + dy * dy, 1e-9)
+
+    segment = np.empty(lat.shape[0], dtype=np.int64)
+    fraction = np.empty(lat.shape[0])
+    distance = np.empty(lat.shape[0])
+    for start in range(0, lat.shape[0], _PROJECT_CHUNK):
+        rows = slice(start, start + _PROJECT_CHUNK)
+        px = (lng[rows] * scale_x)[:, None] - ax
+        py = (lat[rows] * scale_y)[:, None] - ay
+        t = np.clip((px * dx + py * dy) / length_sq, 0.0, 1.0)
+        dist_sq = (px - t * dx) ** 2 + (py - t * dy) ** 2
+        best = np.argmin(dist_sq, axis=1)
+        picked = np.arange(best.shape[0])
+        segment[rows] = best
+        fraction[rows] = t[picked, best]
+        distance[rows] = np.sqrt(dist_sq[picked, best])
+    return segment, fraction, distance
+
+
+def stop_offsets_m(stop_lat, stop_lng):
+    """Distance in meters along a polyline of stops from its first stop to each stop."""
+    legs = haversine_m(stop_lat[:-1], stop_lng[:-1], stop_lat[1:], stop_lng[1:])
+    return np.concatenate(([0.0], np.cumsum(legs)))
+
+
+def along_route_m(lat, lng, stop_lat, stop_lng, offsets=None):
+    """
+    Position of points along a polyline of stops, in meters from its first stop.
+
+    Returns:
+        (position along the route, distance off the route) in meters
+    """
+    offsets = stop_offsets_m(stop_lat, stop_lng) if offsets is None else offsets
+    segment, fraction, distance = project_to_segments(lat, lng, stop_lat, stop_lng)
+    return offsets[segment] + fraction * np.diff(offsets)[segment], distance
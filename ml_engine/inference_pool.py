@@ -0,0 +1,157 @@
+"""
+Inference Executor — runs ETA model calls off the API event loop.
+
+Model inference is CPU-bound, so running it inline in an `async` handler
+stalls every other request. The executor hands batches to a thread pool
+(or a process pool whose workers preload the model) and bounds the amount
+of queued work; callers that cannot be admitted, or whose call overruns
+the timeout, are expected to fall back to the rule-based estimate.
+"""
+
+import logging
+import multiprocessing
+import threading
+from collections import OrderedDict
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+
+logger = logging.getLogger("smart_transit.ml")
+
+INFERENCE_MODES = ("inline", "thread", "process")
+
+
+class InferenceSaturated(RuntimeError):
+    """Raised when the executor already holds `max_pending` calls."""
+
+
+# --- Process-pool worker side ---
+
+# Models a worker keeps loaded: the global one plus recently used route models
+_WORKER_MAX_MODELS = 8
+_worker_predictors: OrderedDict = OrderedDict()
+# The global model's path and its (grid_path, error_budget_min) in grid serving mode
+_worker_global: dict = {"model_path": None, "grid_config": None}
+
+
+def _init_worker(model_path: str, grid_config: tuple | None = None) -> None:
+    """Preload the model once per worker process, serving it the same way the API does."""
+    _worker_global.update(model_path=model_path, grid_config=grid_config)
+    _load_worker_predictor(model_path)
+
+
+def _load_worker_predictor(model_path: str, signature: tuple | None = None):
+    """
+    The worker's predictor for `model_path`, reloaded when `signature` (the
+    API's (mtime_ns, size) of the file) differs from the one it loaded.
+    """
+    from ml_engine.predictor import ETAPredictor
+
+    predictor = _worker_predictors.get(model_path)
+    if predictor is not None and signature is not None and predictor.model_signature != signature:
+        # Replaced at the same path since this worker loaded it
+        del _worker_predictors[model_path]
+        predictor = None
+    if predictor is None:
+        predictor = ETAPredictor(model_path=model_path)
+        # Like the API's predictor, only the global model is served from a grid. Segment speed
+        # profiles need nothing here: the speed is blended before the call is dispatched.
+        if model_path == _worker_global["model_path"] and _worker_global["grid_config"] is not None:
+            predictor.enable_grid(*_worker_global["grid_config"])
+        _worker_predictors[model_path] = predictor
+        while len(_worker_predictors) > _WORKER_MAX_MODELS:
+            _worker_predictors.popitem(last=False)
+    else:
+        _worker_predictors.move_to_end(model_path)
+    return predictor
+
+
+def _worker_predict_batch(model_path: str, signature: tuple | None, distances, speeds, hours):
+    return _load_worker_predictor(model_path, signature).predict_batch(distances, speeds, hours)
+
+
+# --- API side ---
+
+class InferenceExecutor:
+    """
+    Bounded pool for ETA model inference.
+
+    Args:
+        mode: "thread" shares the in-process model; "process" runs a pool of
+            worker processes that each load `model_path` at startup.
+        grid_config: (grid_path, error_budget_min) when the API serves the
+            global model from a lookup grid; process workers do the same.
+        workers: Pool size.
+        max_pending: Maximum calls queued or running at once.
+        timeout_ms: Per-call deadline enforced by the caller.
+    """
+
+    def __init__(
+        self,
+        model_path: str,
+        mode: str = "thread",
+        workers: int = 2,
+        max_pending: int = 64,
+        timeout_ms: float = 250.0,
+        grid_config: tuple | None = None,
+    ):
+        if mode not in ("thread", "process"):
+            raise ValueError(f"Unsupported inference mode: {mode!r}")
+        self.model_path = model_path
+        self.grid_config = grid_config
+        self.mode = mode
+        self.workers = max(1, workers)
+        self.max_pending = max(1, max_pending)
+        self.timeout = timeout_ms / 1000.0
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._pool = self._create_pool()
+        self.rejected = 0
+        self.timed_out = 0
+
+    def _create_pool(self) -> Executor:
+        if self.mode == "thread":
+            return ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="eta-inference")
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(self.model_path, self.grid_config),
+        )
+
+    def submit(self, predictor, distances, speeds, hours) -> Future:
+        """
+        Queue one batch prediction.
+
+        Raises:
+            InferenceSaturated: If `max_pending` calls are already in flight.
+        """
+        if not self._slots.acquire(blocking=False):
+            self.rejected += 1
+            raise InferenceSaturated(f"{self.max_pending} inference calls already pending")
+        try:
+            if self.mode == "thread":
+                future = self._pool.submit(predictor.predict_batch, distances, speeds, hours)
+            else:
+                # Workers load whichever model file the predictor serves (global or per-route),
+                # as of the version the predictor loaded
+                future = self._pool.submit(_worker_predict_batch, predictor.model_path, predictor.model_signature,
+                                           distances, speeds, hours)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def restart(self) -> None:
+        """
+        Pick up a reloaded model.
+
+        Thread workers share the caller's predictor, so only process pools
+        need replacing; calls already running finish on the old workers.
+        """
+        if self.mode != "process":
+            return
+        old_pool, self._pool = self._pool, self._create_pool()
+        old_pool.shutdown(wait=False)
+        logger.info("Restarted %d inference worker processes for the new model.", self.workers)
+
+    def shutdown(self) -> None:
+        self._pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,165 @@
+"""
+Model Registry — per-route ETA models, loaded on demand within a memory budget.
+
+Route models live in one directory as `{route_id}_h{HH}.npz` (one hour of
+the day) or `{route_id}.npz` (all day); pickles (`.pkl`) are accepted too.
+A lookup for (route_id, hour) prefers the hourly file, then the route file,
+then the global predictor. Models are loaded the first time they are asked
+for and kept in an LRU bounded by total file size; compiled models are
+memory-mapped, so their file size is what they cost while resident.
+
+Produce a route model by training on that route's rows and exporting it:
+    python -m ml_engine.compiled_model route_101.pkl route_models/RT-101.npz
+"""
+
+import asyncio
+import logging
+import re
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+from ml_engine.predictor import ETAPredictor
+
+logger = logging.getLogger("smart_transit.ml")
+
+MODEL_SUFFIXES = (".npz", ".pkl")
+_HOURLY_NAME = re.compile(r"^(?P<route>.+)_h(?P<hour>\d{2})$")
+
+# Lookup outcomes reported by resolve()
+HIT, MISS, GLOBAL = "hit", "miss", "global"
+
+
+class ModelRegistry:
+    """
+    Resolves the ETA model for a (route_id, hour) key.
+
+    Args:
+        model_dir: Directory holding route model files.
+        fallback: Global predictor used when a route has no model of its own.
+        max_bytes: Budget for resident route models, measured by file size.
+        executor: Inference executor handed to every loaded route predictor.
+    """
+
+    def __init__(self, model_dir, fallback: ETAPredictor, max_bytes: int = 256 * 1024 * 1024, executor=None):
+        self.model_dir = Path(model_dir)
+        self.fallback = fallback
+        self.max_bytes = max_bytes
+        self.executor = executor
+        self._lock = threading.Lock()
+        # (route_id, hour or None) -> model file; only indexed files can ever be opened
+        self._files: dict[tuple[str, int | None], Path] = {}
+        # path -> (predictor, size, (mtime_ns, size) when loaded)
+        self._resident: OrderedDict[Path, tuple[ETAPredictor, int, tuple]] = OrderedDict()
+        self._broken: set[Path] = set()
+        self.resident_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.refresh()
+
+    def refresh(self) -> None:
+        """
+        Re-scan `model_dir`. Resident models whose files were removed or
+        replaced are dropped (and reloaded on next use); models that failed
+        to load get another chance.
+        """
+        files = {}
+        signatures = {}
+        if self.model_dir.is_dir():
+            for path in self.model_dir.iterdir():
+                if path.suffix not in MODEL_SUFFIXES or not path.is_file():
+                    continue
+                match = _HOURLY_NAME.match(path.stem)
+                if match and int(match["hour"]) < 24:
+                    files.setdefault((match["route"], int(match["hour"])), path)
+                else:
+                    files.setdefault((path.stem, None), path)
+                stat = path.stat()
+                signatures[path] = (stat.st_mtime_ns, stat.st_size)
+
+        with self._lock:
+            self._files = files
+            for path, (_, _, signature) in list(self._resident.items()):
+                if signatures.get(path) != signature:
+                    self._drop(path)
+            self._broken.clear()
+        logger.debug("Model registry indexed %d route models in %s", len(files), self.model_dir)
+
+    def _path_for(self, route_id: str, hour: int):
+        return self._files.get((route_id, hour)) or self._files.get((route_id, None))
+
+    def _drop(self, path: Path) -> None:
+        _, size, _ = self._resident.pop(path)
+        self.resident_bytes -= size
+
+    def _load(self, path: Path) -> ETAPredictor | None:
+        predictor = ETAPredictor(model_path=str(path))
+        if not predictor.ready:
+            return None
+        # Attached after loading so the first load doesn't restart shared workers
+        predictor.executor = self.executor
+        return predictor
+
+    def resolve(self, route_id: str | None, hour: int) -> tuple[ETAPredictor, str]:
+        """
+        Find (loading it if needed) the model for `route_id` at `hour`.
+
+        Blocking on a miss; async callers should use `aresolve`.
+
+        Returns:
+            (predictor, outcome) where outcome is "hit", "miss" or "global".
+        """
+        path = self._path_for(route_id, hour) if route_id else None
+        if path is None or path in self._broken:
+            return self.fallback, GLOBAL
+
+        with self._lock:
+            entry = self._resident.get(path)
+            if entry is not None:
+                self._resident.move_to_end(path)
+                self.hits += 1
+                return entry[0], HIT
+
+        # Loaded outside the lock so lookups of resident models never wait on disk
+        try:
+            stat = path.stat()
+        except OSError:
+            return self.fallback, GLOBAL
+        predictor = self._load(path)
+
+        with self._lock:
+            if predictor is None:
+                logger.warning("Route model %s failed to load — using the global model.", path.name)
+                self._broken.add(path)
+                return self.fallback, GLOBAL
+            entry = self._resident.get(path)
+            if entry is not None:
+                # Another thread loaded it meanwhile
+                return entry[0], HIT
+
+            size = stat.st_size
+            self._resident[path] = (predictor, size, (stat.st_mtime_ns, stat.st_size))
+            self.resident_bytes += size
+            self.misses += 1
+            # Never evict the model just loaded, even if it alone exceeds the budget
+            while self.resident_bytes > self.max_bytes and len(self._resident) > 1:
+                self._drop(next(iter(self._resident)))
+                self.evictions += 1
+            return predictor, MISS
+
+    async def aresolve(self, route_id: str | None, hour: int) -> tuple[ETAPredictor, str]:
+        """`resolve` that loads missing models in a worker thread."""
+        path = self._path_for(route_id, hour) if route_id else None
+        if path is not None and path not in self._broken and path not in self._resident:
+            return await asyncio.to_thread(self.resolve, route_id, hour)
+        return self.resolve(route_id, hour)
+
+    @property
+    def resident_models(self) -> int:
+        return len(self._resident)
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
@@ -1,35 +1,168 @@
 """
 ETA Predictor — ML model wrapper with rule-based fallback.
 
-Predicts Estimated Time of Arrival using a trained sklearn model.
+Predicts Estimated Time of Arrival using a trained sklearn model, either the
+compiled `.npz` form (served with NumPy only) or a joblib pickle.
 Falls back to physics-based calculation (distance / speed) when no model is available.
 """
 
+import asyncio
 import logging
-import joblib
-import pandas as pd
+import os
+import threading
+from typing import NamedTuple
+
+import numpy as np
 
 logger = logging.getLogger("smart_transit.ml")
 
 
+class _ServingModel(NamedTuple):
+    """Everything a prediction reads, swapped as one reference on reload."""
+    model: object
+    grid: object
+    version: int
+    # (mtime_ns, size) of the model file when it was read
+    signature: tuple | None = None
+
+
 class ETAPredictor:
     """
     Predicts ETA in minutes using a trained ML model.
     Falls back to a rule-based calculation if the model is not found.
+
+    The model can be (re)loaded at any time with `load()`, e.g. from a
+    background thread: the replacement is validated on a smoke batch and
+    swapped in atomically, and the previous model keeps serving if it fails.
     """
 
     # Feature columns must match what train_model.py uses during training
     FEATURE_COLUMNS = ["distance_meters", "speed", "hour"]
 
-    def __init__(self, model_path: str = "eta_model.pkl"):
-        try:
-            self.model = joblib.load(model_path)
-            self.ready = True
-            logger.info("ML model loaded from %s", model_path)
-        except Exception:
-            logger.warning("No model found at '%s'. Using rule-based fallback.", model_path)
-            self.model = None
-            self.ready = False
+    # Fixed rows every new model must answer sensibly before it is served
+    SMOKE_BATCH = np.array(
+        [[100.0, 2.0, 3], [1000.0, 8.0, 8], [5000.0, 15.0, 17], [20000.0, 25.0, 23]],
+        dtype=np.float32,
+    )
+
+    def __init__(self, model_path: str = "eta_model.pkl", executor=None, lazy: bool = False):
+        # Optional InferenceExecutor that apredict_batch dispatches model calls to
+        self.executor = executor
+        self.model_path = model_path
+        # Per-thread (1, n_features) scratch row reused by scalar predict()
+        self._local = threading.local()
+        self._serving = _ServingModel(model=None, grid=None, version=0)
+        # (grid_path, error_budget_min) once grid serving is requested (see enable_grid)
+        self._grid_config = None
+        self._load_lock = threading.Lock()
+        self.warming = False
+        # Optional SegmentSpeedProfiles with historical speeds per route segment
+        self.segment_profiles = None
+        if not lazy:
+            self.load()
+
+    @property
+    def ready(self) -> bool:
+        return self._serving.model is not None
+
+    @property
+    def model(self):
+        return self._serving.model
+
+    @property
+    def grid(self):
+        return self._serving.grid
+
+    @property
+    def model_version(self) -> int:
+        """Bumped whenever a model is swapped in so caches keyed on it can flush."""
+        return self._serving.version
+
+    @property
+    def model_signature(self) -> tuple | None:
+        """(mtime_ns, size) of the file the serving model was read from; None on the fallback."""
+        return self._serving.signature
+
+    @property
+    def status(self) -> str:
+        if self.ready:
+            return "loaded"
+        return "warming" if self.warming else "fallback"
+
+    def load(self) -> bool:
+        """
+        Load `model_path`, validate and warm it, then swap it in.
+
+        Blocking; call from a worker thread to keep an event loop responsive.
+        Requests in flight finish on whichever model they started with.
+
+        Returns:
+            True if a new model is now serving.
+        """
+        with self._load_lock:
+            self.warming = not self.ready
+            try:
+                stat = os.stat(self.model_path)
+                model = self._load_model(self.model_path)
+                self._validate_features(model)
+                self._smoke_check(model)
+                grid = self._build_grid(model) if self._grid_config else None
+            except FileNotFoundError:
+                logger.warning("No model found at '%s'. Using rule-based fallback.", self.model_path)
+                return False
+            except Exception as e:
+                logger.warning("Could not load model from '%s' (%s). Keeping the current model.", self.model_path, e)
+                return False
+            finally:
+                self.warming = False
+
+            self._serving = _ServingModel(model=model, grid=grid, version=self._serving.version + 1,
+                                          signature=(stat.st_mtime_ns, stat.st_size))
+            logger.info("ML model v%d loaded from %s", self._serving.version, self.model_path)
+
+        if self.executor is not None:
+            # Process workers hold their own copy of the model
+            self.executor.restart()
+        return True
+
+    def _smoke_check(self, model) -> None:
+        predicted = np.asarray(model.predict(self.SMOKE_BATCH))
+        if predicted.shape != (len(self.SMOKE_BATCH),) or not np.all(np.isfinite(predicted)):
+            raise ValueError(f"smoke batch produced invalid predictions: {predicted!r}")
+
+    @staticmethod
+    def _load_model(model_path: str):
+        """Load a compiled `.npz` ensemble, or a joblib pickle for any other path."""
+        if str(model_path).endswith(".npz"):
+            from ml_engine.compiled_model import CompiledTreeEnsemble
+            return CompiledTreeEnsemble.load(model_path)
+
+        # sklearn/joblib are only needed when serving a pickled estimator
+        import joblib
+        return joblib.load(model_path)
+
+    def _validate_features(self, model) -> None:
+        """
+        Check the model's feature layout once, at load time.
+
+        Inference then feeds plain arrays in FEATURE_COLUMNS order, so the
+        fitted column names are dropped to skip sklearn's per-call name check.
+        """
+        names = getattr(model, "feature_names_in_", None)
+        if names is not None:
+            if list(names) != self.FEATURE_COLUMNS:
+                raise ValueError(f"model features {list(names)} do not match {self.FEATURE_COLUMNS}")
+            del model.feature_names_in_
+        n_features = getattr(model, "n_features_in_", len(self.FEATURE_COLUMNS))
+        if n_features != len(self.FEATURE_COLUMNS):
+            raise ValueError(f"model expects {n_features} features, not {len(self.FEATURE_COLUMNS)}")
+
+    def _row_buffer(self) -> np.ndarray:
+        row = getattr(self._local, "row", None)
+        if row is None:
+            row = np.empty((1, len(self.FEATURE_COLUMNS)), dtype=np.float32)
+            self._local.row = row
+        return row
 
     def predict(self, distance_meters: float, current_speed: float, hour_of_day: int) -> float:
         """
@@ -52,16 +185,178 @@ class ETAPredictor:
             logger.debug("Fallback ETA: %.2f min (dist=%.0fm, speed=%.1fm/s)", eta_minutes, distance_meters, safe_speed)
             return eta_minutes
 
-        # ML Prediction — feature names MUST match train_model.py columns
-        features = pd.DataFrame(
-            [[distance_meters, current_speed, hour_of_day]],
-            columns=self.FEATURE_COLUMNS,
-        )
+        row = self._row_buffer()
+        row[0, 0] = distance_meters
+        row[0, 1] = current_speed
+        row[0, 2] = hour_of_day
+        predicted = float(self.predict_array(row)[0])
 
-        predicted = self.model.predict(features)[0]
+        logger.debug("ML ETA: %.2f min (dist=%.0fm, speed=%.1fm/s, hour=%d)", predicted, distance_meters, current_speed, hour_of_day)
+        return predicted
 
+    def blend_segment_speed(self, speed_kmh: float, route_id: str, segment_index: int, hour_of_week: int,
+                            weight: float = 0.5) -> float:
+        """
+        Mix the instantaneous speed with the segment's historical median.
+
+        A single speed reading is noisy (a bus waiting at a light reads 0), so
+        the typical speed for this segment and hour of week is weighted in.
+        Returns `speed_kmh` unchanged when no profile is available.
+        """
+        profiles = self.segment_profiles
+        if profiles is None:
+            return speed_kmh
+        typical = profiles.median_speed(route_id, segment_index, hour_of_week)
+        if typical is None:
+            return speed_kmh
+        return weight * typical + (1.0 - weight) * speed_kmh
+
+    def predict_array(self, features: np.ndarray) -> np.ndarray:
+        """
+        Array-native prediction.
+
+        Args:
+            features: (n, 3) array with columns in FEATURE_COLUMNS order
+                (distance in meters, speed in m/s, hour). float32 input is
+                used as-is; other dtypes are converted once.
+
+        Returns:
+            (n,) float64 array of ETAs in minutes, clamped to be non-negative.
+        """
+        serving = self._serving
+        if serving.model is None:
+            return self.fallback_batch(features[:, 0], features[:, 1])
+
+        # Tree models compare features in float32; passing float32 avoids a copy
+        features = np.asarray(features, dtype=np.float32)
+        if serving.grid is None:
+            return self._predict_with(serving.model, features)
+
+        predicted = serving.grid.interpolate(features[:, 0], features[:, 1], features[:, 2])
+        outside = np.isnan(predicted)
+        if outside.any():
+            predicted[outside] = self._predict_with(serving.model, features[outside])
+        return np.maximum(predicted, 0.0, out=predicted)
+
+    @staticmethod
+    def _predict_with(model, features: np.ndarray) -> np.ndarray:
+        predicted = model.predict(features)
         # Clamp to non-negative (model could predict negative with bad input)
-        predicted = max(predicted, 0.0)
+        return np.maximum(predicted, 0.0, out=predicted)
 
-        logger.debug("ML ETA: %.2f min (dist=%.0fm, speed=%.1fm/s, hour=%d)", predicted, distance_meters, current_speed, hour_of_day)
-        return predicted
\ No newline at end of file
+    def predict_batch(self, distances_meters, current_speeds, hours_of_day) -> np.ndarray:
+        """
+        Predict ETAs in minutes for many rows with a single model call.
+
+        Args:
+            distances_meters: Remaining distances (meters), array-like.
+            current_speeds: Vehicle speeds (meters per second), array-like.
+            hours_of_day: Hours (0-23), array-like or a scalar applied to every row.
+
+        Returns:
+            Array of ETAs in minutes, in input order.
+        """
+        if not self.ready:
+            return self.fallback_batch(distances_meters, current_speeds)
+
+        distances = np.asarray(distances_meters)
+        features = np.empty((distances.shape[0], len(self.FEATURE_COLUMNS)), dtype=np.float32)
+        features[:, 0] = distances
+        features[:, 1] = current_speeds
+        features[:, 2] = hours_of_day
+        return self.predict_array(features)
+
+    def enable_grid(self, grid_path, error_budget_min: float = 0.25) -> bool:
+        """
+        Serve predictions from a precomputed lookup grid.
+
+        Reuses the grid at `grid_path` when it was built from the current
+        model file, otherwise tabulates the model and saves it there. The grid
+        is only enabled if its p99 absolute error against the real model on a
+        random holdout stays within `error_budget_min` minutes. The setting
+        sticks: models loaded later get a grid of their own.
+
+        Returns:
+            True if grid serving is now active.
+        """
+        self._grid_config = (grid_path, error_budget_min)
+        with self._load_lock:
+            serving = self._serving
+            if serving.model is None:
+                return False
+            grid = self._build_grid(serving.model)
+            if grid is None:
+                return False
+            self._serving = serving._replace(grid=grid, version=serving.version + 1)
+        return True
+
+    def _build_grid(self, model):
+        from ml_engine.eta_grid import ETAGrid, model_fingerprint
+
+        grid_path, error_budget_min = self._grid_config
+        predict = lambda features: self._predict_with(model, features)  # noqa: E731
+
+        fingerprint = model_fingerprint(self.model_path)
+        grid = None
+        try:
+            cached = ETAGrid.load(grid_path)
+            if cached.fingerprint == fingerprint:
+                grid = cached
+        except (OSError, ValueError, KeyError):
+            pass
+
+        if grid is None:
+            logger.info("Building ETA lookup grid for %s ...", self.model_path)
+            grid = ETAGrid.build(predict, fingerprint=fingerprint)
+            try:
+                grid.save(grid_path)
+            except OSError as e:
+                logger.warning("Could not save ETA grid to '%s': %s", grid_path, e)
+
+        errors = grid.holdout_error(predict)
+        if errors["p99_abs_error"] > error_budget_min:
+            logger.warning(
+                "ETA grid p99 error %.3f min exceeds budget %.3f min — serving the model directly.",
+                errors["p99_abs_error"], error_budget_min,
+            )
+            return None
+
+        logger.info("ETA grid serving enabled (p99 error %.3f min, max %.3f min).",
+                    errors["p99_abs_error"], errors["max_abs_error"])
+        return grid
+
+    def fallback_batch(self, distances_meters, current_speeds) -> np.ndarray:
+        """Rule-based ETAs in minutes: distance / speed."""
+        distances = np.asarray(distances_meters, dtype=np.float64)
+        speeds = np.asarray(current_speeds, dtype=np.float64)
+        return (distances / np.maximum(speeds, 0.1)) / 60.0
+
+    async def apredict_batch(self, distances_meters, current_speeds, hours_of_day) -> tuple[np.ndarray, str]:
+        """
+        Async batch prediction that keeps model work off the event loop.
+
+        Dispatches to `self.executor` when one is configured. If the executor
+        is saturated or the call overruns its timeout, the rule-based estimate
+        is returned instead.
+
+        Returns:
+            (ETAs in minutes, source) where source is "ML_model" or
+            "rule_based_fallback".
+        """
+        if not self.ready:
+            return self.fallback_batch(distances_meters, current_speeds), "rule_based_fallback"
+        if self.executor is None:
+            return self.predict_batch(distances_meters, current_speeds, hours_of_day), "ML_model"
+
+        from ml_engine.inference_pool import InferenceSaturated
+
+        try:
+            future = self.executor.submit(self, distances_meters, current_speeds, hours_of_day)
+            result = await asyncio.wait_for(asyncio.wrap_future(future), self.executor.timeout)
+            return result, "ML_model"
+        except InferenceSaturated:
+            logger.debug("Inference pool saturated — using rule-based fallback.")
+        except asyncio.TimeoutError:
+            self.executor.timed_out += 1
+            logger.debug("Inference call exceeded %.0f ms — using rule-based fallback.", self.executor.timeout * 1000)
+        return self.fallback_batch(distances_meters, current_speeds), "rule_based_fallback"
@@ -0,0 +1,248 @@
+"""
+Segment speed profiles — a small feature store of historical speeds.
+
+A refresh job snaps new `vehicle_logs` pings to the stop-to-stop segment of
+their route and adds them to per-(route, segment, hour-of-week) speed
+histograms in `segment_speed_hist`. Histograms merge by addition, so each
+run only reads logs after the stored watermark. The API loads the table
+once into `SegmentSpeedProfiles`, a dense NumPy array of speed
+percentiles, and looks profiles up in O(1) while predicting.
+
+Segment i runs from a route's i-th to (i+1)-th stop in stop_sequence order.
+
+Refresh (e.g. from cron):
+    python -m ml_engine.segment_profiles
+"""
+
+import argparse
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+from ml_engine.geo import project_to_segments
+from ml_engine.vehicle_logs import iter_log_windows, load_route_stops
+
+logger = logging.getLogger("smart_transit.ml")
+
+HOURS_PER_WEEK = 168
+BUCKET_KMH = 5.0
+N_BUCKETS = 17  # the last bucket collects everything from 80 km/h up
+PERCENTILES = (10, 50, 90)
+
+WATERMARK_NAME = "segment_speed_hist"
+# Logs newer than this are left for the next run so late-arriving pings are not skipped
+INGEST_LAG = timedelta(minutes=2)
+# Pings further than this from every segment of their route are off-route
+MAX_SNAP_DISTANCE_M = 150.0
+# Arbitrary constant identifying the refresh job for pg_try_advisory_lock
+_ADVISORY_LOCK_KEY = 0x5E6_5EED
+
+UPSERT_HIST_QUERY = """
+    INSERT INTO segment_speed_hist (route_id, segment_index, hour_of_week, bucket, samples)
+    VALUES ($1, $2, $3, $4, $5)
+    ON CONFLICT (route_id, segment_index, hour_of_week, bucket)
+    DO UPDATE SET samples = segment_speed_hist.samples + EXCLUDED.samples
+"""
+
+
+# --- Aggregation ---
+
+def histogram_rows(window, route_ids: list, route_stops: dict) -> list[tuple]:
+    """
+    Count one window's pings per (route, segment, hour-of-week, speed bucket).
+
+    Args:
+        window: `LogWindow` from `iter_log_windows`.
+        route_ids: route_id for each route code in `window.route`.
+        route_stops: route_id -> (stop latitudes, stop longitudes) in order.
+
+    Returns:
+        (route_id, segment_index, hour_of_week, bucket, samples) tuples.
+    """
+    hour_of_week = window.day_of_week * 24 + window.hour.astype(np.int64)
+    bucket = np.minimum(window.speed // BUCKET_KMH, N_BUCKETS - 1).astype(np.int64)
+
+    rows = []
+    for code in np.unique(window.route):
+        route_id = route_ids[code]
+        stops = route_stops.get(route_id)
+        if stops is None or len(stops[0]) < 2:
+            continue
+        mask = window.route == code
+        segment, _, distance = project_to_segments(window.lat[mask], window.lng[mask], *stops)
+        on_route = distance <= MAX_SNAP_DISTANCE_M
+
+        # One integer key per cell, counted in a single pass
+        keys = (segment[on_route] * HOURS_PER_WEEK + hour_of_week[mask][on_route]) * N_BUCKETS + bucket[mask][on_route]
+        unique, counts = np.unique(keys, return_counts=True)
+        cell, bucket_of = np.divmod(unique, N_BUCKETS)
+        segment_of, how_of = np.divmod(cell, HOURS_PER_WEEK)
+        rows.extend(zip([route_id] * len(unique), segment_of.tolist(), how_of.tolist(), bucket_of.tolist(), counts.tolist()))
+    return rows
+
+
+async def refresh_segment_profiles(conn, until: datetime | None = None, window: timedelta = timedelta(hours=1),
+                                   initial_lookback: timedelta = timedelta(days=28), tz: str = "UTC") -> int:
+    """
+    Fold logs from the watermark up to `until` into `segment_speed_hist`.
+
+    Hours of the week are counted on the `tz` clock, which /eta must share
+    when it looks profiles up.
+
+    Each window's counts and the advanced watermark are committed together,
+    so an interrupted run resumes where it stopped without double counting.
+    Concurrent runs are excluded with an advisory lock.
+
+    Returns:
+        Number of pings added.
+    """
+    if not await conn.fetchval("SELECT pg_try_advisory_lock($1)", _ADVISORY_LOCK_KEY):
+        logger.warning("Segment profile refresh already running elsewhere — skipping.")
+        return 0
+    try:
+        until = until or datetime.now(timezone.utc) - INGEST_LAG
+        since = await conn.fetchval(
+            "SELECT watermark FROM feature_store_watermarks WHERE name = $1", WATERMARK_NAME
+        ) or until - initial_lookback
+        route_stops = await load_route_stops(conn)
+        codes: dict = {}
+        route_ids: list = []
+        added = 0
+
+        async for log_window in iter_log_windows(conn, since, until, window=window, lookahead=timedelta(0),
+                                                 codes=codes, tz=tz):
+            route_ids.extend([None] * (len(codes) - len(route_ids)))
+            for route_id, code in codes.items():
+                route_ids[code] = route_id
+            rows = histogram_rows(log_window, route_ids, route_stops)
+            window_end = datetime.fromtimestamp(log_window.end, timezone.utc)
+            async with conn.transaction():
+                await conn.executemany(UPSERT_HIST_QUERY, rows)
+                await _set_watermark(conn, window_end)
+            added += sum(r[4] for r in rows)
+            logger.info("Segment profiles: %d pings folded in up to %s", sum(r[4] for r in rows), window_end.isoformat())
+
+        # Windows without any logs yield nothing; still move past them
+        await _set_watermark(conn, until)
+        return added
+    finally:
+        await conn.execute("SELECT pg_advisory_unlock($1)", _ADVISORY_LOCK_KEY)
+
+
+async def _set_watermark(conn, watermark: datetime) -> None:
+    await conn.execute(
+        """
+        INSERT INTO feature_store_watermarks (name, watermark) VALUES ($1, $2)
+        ON CONFLICT (name) DO UPDATE SET watermark = GREATEST(feature_store_watermarks.watermark, EXCLUDED.watermark)
+        """,
+        WATERMARK_NAME, watermark,
+    )
+
+
+# --- Serving ---
+
+def _histogram_percentiles(hist: np.ndarray, percentiles=PERCENTILES) -> np.ndarray:
+    """Percentiles (km/h) of bucketed speeds along the last axis, linear within a bucket; NaN if empty."""
+    cumulative = np.cumsum(hist, axis=-1, dtype=np.float64)
+    total = cumulative[..., -1:]
+    out = np.full(hist.shape[:-1] + (len(percentiles),), np.nan, dtype=np.float32)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        for i, q in enumerate(percentiles):
+            rank = total * (q / 100.0)
+            idx = np.minimum((cumulative < rank).sum(axis=-1, keepdims=True), N_BUCKETS - 1)
+            below = np.take_along_axis(cumulative, idx, axis=-1) - np.take_along_axis(hist, idx, axis=-1)
+            within = (rank - below) / np.take_along_axis(hist, idx, axis=-1)
+            value = (idx + np.clip(within, 0.0, 1.0)) * BUCKET_KMH
+            out[..., i] = np.where(total > 0, value, np.nan)[..., 0]
+    return out
+
+
+class SegmentSpeedProfiles:
+    """
+    Speed percentiles (PERCENTILES, km/h) for every (route, segment, hour of week).
+
+    Stored as one float32 array of shape (segments, 168, len(PERCENTILES));
+    a route's segments are contiguous, found through a dict of offsets.
+    Hours with fewer than `min_samples` pings use the segment's whole-week
+    distribution instead.
+    """
+
+    def __init__(self, route_offsets: dict, percentiles: np.ndarray):
+        self.route_offsets = route_offsets  # route_id -> (first row, number of segments)
+        self.percentiles = percentiles
+
+    @classmethod
+    def from_histograms(cls, rows, min_samples: int = 20) -> "SegmentSpeedProfiles":
+        """Build from (route_id, segment_index, hour_of_week, bucket, samples) rows."""
+        routes = [r[0] for r in rows]
+        segment_index, hour_of_week, bucket, samples = (
+            np.fromiter((r[i] for r in rows), dtype=np.int64, count=len(rows)) for i in range(1, 5)
+        )
+        names, route_code = np.unique(np.array(routes, dtype=object), return_inverse=True) if rows else ([], np.empty(0, int))
+        n_segments = np.zeros(len(names), dtype=np.int64)
+        np.maximum.at(n_segments, route_code, segment_index + 1)
+        first_row = np.concatenate(([0], np.cumsum(n_segments)[:-1])).astype(np.int64)
+        route_offsets = {name: (int(first), int(n)) for name, first, n in zip(names, first_row, n_segments)}
+
+        hist = np.zeros((int(n_segments.sum()), HOURS_PER_WEEK, N_BUCKETS), dtype=np.int64)
+        np.add.at(hist, (first_row[route_code] + segment_index, hour_of_week, bucket), samples)
+
+        percentiles = _histogram_percentiles(hist)
+        sparse = hist.sum(axis=-1) < min_samples
+        weekly = _histogram_percentiles(hist.sum(axis=1))
+        percentiles[sparse] = np.broadcast_to(weekly[:, None, :], percentiles.shape)[sparse]
+        return cls(route_offsets, percentiles)
+
+    def lookup(self, route_id: str, segment_index: int, hour_of_week: int) -> np.ndarray | None:
+        """Percentiles for one cell, or None if the route/segment has no history."""
+        entry = self.route_offsets.get(route_id)
+        if entry is None or not 0 <= segment_index < entry[1]:
+            return None
+        row = self.percentiles[entry[0] + segment_index, hour_of_week % HOURS_PER_WEEK]
+        return None if np.isnan(row[0]) else row
+
+    def median_speed(self, route_id: str, segment_index: int, hour_of_week: int) -> float | None:
+        row = self.lookup(route_id, segment_index, hour_of_week)
+        return None if row is None else float(row[PERCENTILES.index(50)])
+
+    @property
+    def nbytes(self) -> int:
+        return self.percentiles.nbytes
+
+
+async def load_segment_profiles(pool, min_samples: int = 20) -> SegmentSpeedProfiles:
+    """Read the whole histogram table and build the in-memory profiles."""
+    async with pool.acquire() as conn:
+        rows = await conn.fetch(
+            "SELECT route_id, segment_index, hour_of_week, bucket, samples FROM segment_speed_hist"
+        )
+    return SegmentSpeedProfiles.from_histograms([tuple(r) for r in rows], min_samples=min_samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Refresh segment speed profiles from vehicle_logs")
+    parser.add_argument("--window-hours", type=float, default=1.0, help="Log range folded in per transaction")
+    parser.add_argument("--initial-days", type=float, default=28.0, help="History read on the very first run")
+    args = parser.parse_args()
+
+    import asyncpg
+    from backend.app.config import settings
+
+    async def run():
+        conn = await asyncpg.connect(settings.DATABASE_URL)
+        try:
+            return await refresh_segment_profiles(
+                conn, window=timedelta(hours=args.window_hours), initial_lookback=timedelta(days=args.initial_days),
+                tz=settings.TRANSIT_TIMEZONE,
+            )
+        finally:
+            await conn.close()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s | %(levelname)-7s | %(message)s")
+    print(f"✅ Folded {asyncio.run(run())} pings into segment speed profiles")
+
+
+if __name__ == "__main__":
+    main()
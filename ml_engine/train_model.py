@@ -1,15 +1,29 @@
 import pandas as pd
 import joblib
+import argparse
+import asyncio
 import os
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
 import numpy as np # Needed for handling inf values in speed calculation
 from sklearn.model_selection import train_test_split
 from sklearn.ensemble import GradientBoostingRegressor
 from sklearn.metrics import mean_absolute_error, r2_score
 
+# Allow running as a plain script from inside ml_engine/
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from ml_engine.compiled_model import CompiledTreeEnsemble, export_gradient_boosting
+
 # --- Configuration ---
 # FIX 1: Corrected file name to match the output of your generator script.
 DATA_FILE = 'transit_data.csv' 
 MODEL_OUTPUT_FILE = 'eta_model.pkl'
+# Flat-array form served by the API without sklearn/joblib
+COMPILED_MODEL_OUTPUT_FILE = 'eta_model.npz'
+FEATURE_COLUMNS = ['distance_meters', 'speed', 'hour']
+# Routes with fewer sampled traversals than this keep using the global model
+MIN_ROUTE_SAMPLES = 500
 
 def train_and_evaluate_model():
     """
@@ -31,12 +45,21 @@ def train_and_evaluate_model():
         print(f"\n❌ Error loading data: {e}")
         return
 
+    X, y = prepare_features(data)
+    fit_and_export(X, y, MODEL_OUTPUT_FILE, COMPILED_MODEL_OUTPUT_FILE)
+
+
+def prepare_features(data):
+    """
+    Turns generator output (dataset_generator.py) into the model's
+    features (FEATURE_COLUMNS) and target (minutes).
+    """
     # 2. Prepare and Rename Columns for ML Model
     
     # FIX 2: Rename Target Column (Fixes KeyError: 'time_taken_minutes')
     TARGET_COLUMN_OLD = 'travel_time_min'
     TARGET_COLUMN_NEW = 'time_taken_minutes'
-    data.rename(columns={TARGET_COLUMN_OLD: TARGET_COLUMN_NEW}, inplace=True)
+    data = data.rename(columns={TARGET_COLUMN_OLD: TARGET_COLUMN_NEW})
 
     # Prepare ML Model Features: 'distance_meters', 'speed', 'hour'
 
@@ -49,20 +72,24 @@ def train_and_evaluate_model():
     data['speed'] = data['distance_km'] / (data[TARGET_COLUMN_NEW] / 60.0)
     
     # Handle division by zero (where travel_time_min is very close to zero)
-    data['speed'].replace([np.inf, -np.inf], 0, inplace=True) 
+    data['speed'] = data['speed'].replace([np.inf, -np.inf], 0)
     
     # Rename Hour Column
     data.rename(columns={'hour_of_day': 'hour'}, inplace=True)
 
     # 3. Define Features (X) and Target (y)
-    FEATURE_COLUMNS = ['distance_meters', 'speed', 'hour']
-    
+
     # Filter out records where target time is zero or negative (due to noise in generator)
     data = data[data[TARGET_COLUMN_NEW] > 0] 
 
-    X = data[FEATURE_COLUMNS]
-    y = data[TARGET_COLUMN_NEW]
-    
+    return data[FEATURE_COLUMNS], data[TARGET_COLUMN_NEW]
+
+
+def fit_and_export(X, y, model_output_file, compiled_output_file, verbose=True):
+    """
+    Splits, trains and evaluates a GradientBoosting ETA model, then saves the
+    pickle (if `model_output_file` is set) and the compiled serving artifact.
+    """
     # 4. Split the data into training and testing sets (80% train, 20% test)
     X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
 
@@ -79,19 +106,96 @@ def train_and_evaluate_model():
     mae = mean_absolute_error(y_test, y_pred)
     r2 = r2_score(y_test, y_pred)
 
-    print("-" * 35)
-    print("✅ Training Complete.")
-    print("🎯 Model Efficiency Metrics (on 20% Test Data):")
-    print(f"   - Mean Absolute Error (MAE): {mae:.3f} minutes")
-    print(f"     (Interpretation: Predictions are off by an average of {mae:.3f} minutes.)")
-    print(f"   - R-squared (R2): {r2:.3f}")
-    print(f"     (Interpretation: {r2*100:.1f}% of the variance in ETA is explained.)")
-    print("-" * 35)
+    if verbose:
+        print("-" * 35)
+        print("✅ Training Complete.")
+        print("🎯 Model Efficiency Metrics (on 20% Test Data):")
+        print(f"   - Mean Absolute Error (MAE): {mae:.3f} minutes")
+        print(f"     (Interpretation: Predictions are off by an average of {mae:.3f} minutes.)")
+        print(f"   - R-squared (R2): {r2:.3f}")
+        print(f"     (Interpretation: {r2*100:.1f}% of the variance in ETA is explained.)")
+        print("-" * 35)
+    else:
+        print(f"   MAE {mae:.3f} min, R2 {r2:.3f}")
 
     # 7. Save the model for deployment
-    joblib.dump(model, MODEL_OUTPUT_FILE) 
-    print(f"✅ Model saved to {MODEL_OUTPUT_FILE}")
+    if model_output_file:
+        joblib.dump(model, model_output_file) 
+        print(f"✅ Model saved to {model_output_file}")
+
+    # 8. Export the compiled serving artifact and check it reproduces sklearn
+    export_gradient_boosting(model, compiled_output_file, FEATURE_COLUMNS)
+    compiled_pred = CompiledTreeEnsemble.load(compiled_output_file).predict(np.asarray(X_test))
+    max_diff = float(np.max(np.abs(compiled_pred - y_pred)))
+    if max_diff > 1e-9:
+        print(f"⚠️  Compiled model deviates from sklearn by up to {max_diff:.2e} minutes")
+    print(f"✅ Compiled model saved to {compiled_output_file} (max deviation {max_diff:.1e})")
+    return model
+
+
+def train_from_vehicle_logs(dsn, since, until, sample_size=1_000_000, window_hours=6.0, route_model_dir=None, tz="UTC"):
+    """
+    Trains on segment traversals mined from the recorded `vehicle_logs`.
+
+    Logs are streamed window by window into a fixed-size uniform sample, so
+    memory stays bounded however long the [since, until) range is. With
+    `route_model_dir`, routes with enough traversals also get their own
+    model, named as the API's model registry expects. The hour feature is
+    local to `tz`, which must be the API's TRANSIT_TIMEZONE.
+    """
+    from ml_engine.vehicle_logs import TRAVERSAL_COLUMNS, sample_traversals
+
+    print(f"🚀 Streaming vehicle_logs from {since:%Y-%m-%d %H:%M} to {until:%Y-%m-%d %H:%M}...")
+    rows, route_ids = asyncio.run(sample_traversals(
+        dsn, since, until, sample_size=sample_size, window=timedelta(hours=window_hours), tz=tz,
+    ))
+    if len(rows) == 0:
+        print("\n❌ Error: No usable trajectories found in vehicle_logs for that range.")
+        return
+
+    data = pd.DataFrame(rows, columns=TRAVERSAL_COLUMNS)
+    print(f"Sampled {len(data)} segment traversals across {len(route_ids)} routes.")
+    fit_and_export(data[FEATURE_COLUMNS], data['travel_time_min'], MODEL_OUTPUT_FILE, COMPILED_MODEL_OUTPUT_FILE)
+
+    if route_model_dir:
+        os.makedirs(route_model_dir, exist_ok=True)
+        for code, route_data in data.groupby('route_code'):
+            route_id = route_ids[int(code)]
+            if route_id is None or len(route_data) < MIN_ROUTE_SAMPLES:
+                continue
+            print(f"🚌 Route {route_id} ({len(route_data)} traversals):")
+            fit_and_export(
+                route_data[FEATURE_COLUMNS], route_data['travel_time_min'],
+                None, os.path.join(route_model_dir, f"{route_id}.npz"), verbose=False,
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train the ETA model")
+    parser.add_argument("--source", choices=["csv", "db"], default="csv",
+                        help="csv: synthetic transit_data.csv; db: recorded vehicle_logs")
+    parser.add_argument("--since", type=datetime.fromisoformat, help="Start of the log range (db source)")
+    parser.add_argument("--until", type=datetime.fromisoformat, help="End of the log range (db source)")
+    parser.add_argument("--days", type=float, default=30.0, help="Range length when --since is omitted")
+    parser.add_argument("--sample-size", type=int, default=1_000_000, help="Traversals kept for training")
+    parser.add_argument("--window-hours", type=float, default=6.0, help="Log range streamed per query")
+    parser.add_argument("--route-model-dir", help="Also train per-route models into this directory")
+    args = parser.parse_args()
+
+    if args.source == "csv":
+        train_and_evaluate_model()
+        return
+
+    from backend.app.config import settings
+
+    until = args.until or datetime.now().astimezone()
+    since = args.since or until - timedelta(days=args.days)
+    train_from_vehicle_logs(
+        settings.DATABASE_URL, since, until,
+        sample_size=args.sample_size, window_hours=args.window_hours, route_model_dir=args.route_model_dir,
+        tz=settings.TRANSIT_TIMEZONE,
+    )
 
 
 if __name__ == "__main__":
-    train_and_evaluate_model()
\ No newline at end of file
+    main()
\ No newline at end of file
@@ -0,0 +1,258 @@
+"""
+Training data from recorded trajectories in `vehicle_logs`.
+
+Logs are streamed out of Postgres one time window at a time through a
+server-side cursor, so memory is bounded by the window, not the table.
+Each window is turned into segment traversals with vectorized NumPy: a
+traversal starts at a ping and ends where the bus has covered a randomly
+drawn distance further along its own path, giving one (distance, speed,
+hour, route, observed travel time) training row. Rows feed a fixed-size
+uniform reservoir, so a year of logs trains from a sample of bounded size.
+"""
+
+import logging
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import AsyncIterator
+
+import numpy as np
+
+from ml_engine.geo import haversine_m
+
+logger = logging.getLogger("smart_transit.ml")
+
+# Pings of one vehicle ordered in time; the window is read a little past its
+# end ($2) so traversals starting near the boundary can still finish. Hour and
+# day of week are on the network's clock ($3), not the database session's.
+LOG_WINDOW_QUERY = """
+    SELECT vehicle_id, route_id,
+           EXTRACT(EPOCH FROM time)::float8 AS t,
+           EXTRACT(HOUR FROM time AT TIME ZONE $3)::int AS hour,
+           latitude, longitude, COALESCE(speed, 0) AS speed,
+           (EXTRACT(ISODOW FROM time AT TIME ZONE $3)::int - 1) AS day_of_week
+    FROM vehicle_logs
+    WHERE time >= $1 AND time < $2
+      AND latitude IS NOT NULL AND longitude IS NOT NULL
+    ORDER BY vehicle_id, time
+"""
+
+ROUTE_STOPS_QUERY = """
+    SELECT route_id, latitude, longitude
+    FROM stops
+    ORDER BY route_id, stop_sequence, stop_id
+"""
+
+TRAVERSAL_COLUMNS = ["distance_meters", "speed", "hour", "route_code", "travel_time_min"]
+
+# Cumulative distance jump inserted between trips so one sorted search covers all of them
+_TRIP_GAP_M = 1e7
+
+
+@dataclass
+class TraversalConfig:
+    min_distance_m: float = 200.0
+    max_distance_m: float = 5000.0
+    # A silence longer than this splits a vehicle's pings into separate trips
+    max_gap_s: float = 120.0
+    # Traversals slower than this are dropped; also how far past a window we read
+    max_duration_s: float = 1800.0
+    # Pings implying a faster jump than this are GPS glitches
+    max_speed_kmh: float = 150.0
+    # Share of pings used as traversal starts (neighbouring pings are near-duplicates)
+    start_fraction: float = 0.1
+
+
+@dataclass
+class LogWindow:
+    """One time window of pings sorted by (vehicle, time); strings are integer-coded."""
+    vehicle: np.ndarray
+    route: np.ndarray
+    t: np.ndarray
+    hour: np.ndarray
+    lat: np.ndarray
+    lng: np.ndarray
+    speed: np.ndarray
+    start: float
+    end: float
+    day_of_week: np.ndarray | None = None  # 0=Monday
+
+
+def traversal_features(window: LogWindow, config: TraversalConfig, rng: np.random.Generator) -> np.ndarray:
+    """
+    Derive traversal rows (TRAVERSAL_COLUMNS) from one window of pings.
+
+    Only traversals that start inside [window.start, window.end) are kept,
+    so overlapping reads never produce a row twice.
+    """
+    n = window.t.shape[0]
+    if n < 2:
+        return np.empty((0, len(TRAVERSAL_COLUMNS)))
+
+    step = haversine_m(window.lat[:-1], window.lng[:-1], window.lat[1:], window.lng[1:])
+    dt = np.diff(window.t)
+    same_vehicle = window.vehicle[1:] == window.vehicle[:-1]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        implied_kmh = step / dt * 3.6
+    linked = same_vehicle & (dt > 0) & (dt <= config.max_gap_s) & (implied_kmh <= config.max_speed_kmh)
+
+    # Trip ids and a cumulative distance that jumps by _TRIP_GAP_M between trips
+    trip = np.concatenate(([0], np.cumsum(~linked)))
+    cumulative = np.concatenate(([0.0], np.cumsum(np.where(linked, step, _TRIP_GAP_M))))
+
+    starts = np.flatnonzero(
+        (window.t >= window.start) & (window.t < window.end) & (rng.random(n) < config.start_fraction)
+    )
+    target = rng.uniform(config.min_distance_m, config.max_distance_m, starts.shape[0])
+    ends = np.searchsorted(cumulative, cumulative[starts] + target)
+    inside = ends < n
+    starts, ends = starts[inside], ends[inside]
+
+    duration = window.t[ends] - window.t[starts]
+    keep = (trip[ends] == trip[starts]) & (duration > 0) & (duration <= config.max_duration_s)
+    starts, ends, duration = starts[keep], ends[keep], duration[keep]
+
+    rows = np.empty((starts.shape[0], len(TRAVERSAL_COLUMNS)))
+    rows[:, 0] = cumulative[ends] - cumulative[starts]
+    rows[:, 1] = window.speed[starts]
+    rows[:, 2] = window.hour[starts]
+    rows[:, 3] = window.route[starts]
+    rows[:, 4] = duration / 60.0
+    return rows
+
+
+class Reservoir:
+    """
+    Uniform fixed-size sample of a row stream (Algorithm R, vectorized per chunk).
+
+    Every row seen so far is in the sample with equal probability
+    capacity / seen, whatever the order and size of the chunks.
+    """
+
+    def __init__(self, capacity: int, n_columns: int, seed: int | None = None):
+        self.capacity = capacity
+        self.rows = np.empty((capacity, n_columns))
+        self.seen = 0
+        self._rng = np.random.default_rng(seed)
+
+    def add(self, chunk: np.ndarray) -> None:
+        filled = min(self.seen, self.capacity)
+        take = min(self.capacity - filled, chunk.shape[0])
+        self.rows[filled:filled + take] = chunk[:take]
+        self.seen += take
+
+        rest = chunk[take:]
+        if rest.shape[0]:
+            # Row number k (1-based) replaces a random slot with probability capacity / k
+            positions = np.arange(self.seen + 1, self.seen + rest.shape[0] + 1)
+            slots = (self._rng.random(rest.shape[0]) * positions).astype(np.int64)
+            accepted = slots < self.capacity
+            # Later rows win on duplicate slots, as in the sequential algorithm
+            self.rows[slots[accepted]] = rest[accepted]
+            self.seen += rest.shape[0]
+
+    @property
+    def sample(self) -> np.ndarray:
+        return self.rows[:min(self.seen, self.capacity)]
+
+
+async def iter_log_windows(
+    conn,
+    since: datetime,
+    until: datetime,
+    window: timedelta = timedelta(hours=6),
+    lookahead: timedelta = timedelta(seconds=TraversalConfig.max_duration_s),
+    fetch_rows: int = 50_000,
+    codes: dict | None = None,
+    tz: str = "UTC",
+) -> AsyncIterator[LogWindow]:
+    """
+    Stream `vehicle_logs` between `since` and `until` one window at a time.
+
+    Each window is read through a server-side cursor in `fetch_rows`
+    batches. Vehicle and route ids are coded as integers; `codes` (updated
+    in place) maps route_id -> code across windows. Hours and days of week
+    are local to `tz` (TRANSIT_TIMEZONE, as /eta uses when serving).
+    """
+    codes = {} if codes is None else codes
+    start = since
+    while start < until:
+        end = min(start + window, until)
+        columns = [[] for _ in range(8)]
+        async with conn.transaction():
+            cursor = await conn.cursor(LOG_WINDOW_QUERY, start, end + lookahead, tz)
+            while True:
+                batch = await cursor.fetch(fetch_rows)
+                if not batch:
+                    break
+                for column, values in zip(columns, zip(*batch)):
+                    column.extend(values)
+
+        if columns[0]:
+            vehicles = {}
+            yield LogWindow(
+                vehicle=np.fromiter((vehicles.setdefault(v, len(vehicles)) for v in columns[0]), dtype=np.int64),
+                route=np.fromiter((codes.setdefault(r, len(codes)) for r in columns[1]), dtype=np.int64),
+                t=np.asarray(columns[2], dtype=np.float64),
+                hour=np.asarray(columns[3], dtype=np.float64),
+                lat=np.asarray(columns[4], dtype=np.float64),
+                lng=np.asarray(columns[5], dtype=np.float64),
+                speed=np.asarray(columns[6], dtype=np.float64),
+                start=start.timestamp(),
+                end=end.timestamp(),
+                day_of_week=np.asarray(columns[7], dtype=np.int64),
+            )
+        start = end
+
+
+async def load_route_stops(conn) -> dict:
+    """route_id -> (stop latitudes, stop longitudes) in stop_sequence order."""
+    route_stops: dict = {}
+    for record in await conn.fetch(ROUTE_STOPS_QUERY):
+        lats, lngs = route_stops.setdefault(record["route_id"], ([], []))
+        lats.append(record["latitude"])
+        lngs.append(record["longitude"])
+    return {route: (np.array(lats), np.array(lngs)) for route, (lats, lngs) in route_stops.items()}
+
+
+async def sample_traversals(
+    dsn: str,
+    since: datetime,
+    until: datetime,
+    sample_size: int = 1_000_000,
+    window: timedelta = timedelta(hours=6),
+    config: TraversalConfig | None = None,
+    seed: int = 42,
+    tz: str = "UTC",
+):
+    """
+    Stream logs from `dsn` and return a uniform sample of traversal rows.
+
+    Returns:
+        (rows, route_ids): rows has TRAVERSAL_COLUMNS; route_ids[code] is
+        the route_id for each value of the route_code column.
+    """
+    import asyncpg
+
+    config = config or TraversalConfig()
+    rng = np.random.default_rng(seed)
+    reservoir = Reservoir(sample_size, len(TRAVERSAL_COLUMNS), seed=seed)
+    codes: dict = {}
+
+    conn = await asyncpg.connect(dsn)
+    try:
+        async for log_window in iter_log_windows(
+            conn, since, until, window=window, lookahead=timedelta(seconds=config.max_duration_s), codes=codes, tz=tz,
+        ):
+            rows = traversal_features(log_window, config, rng)
+            reservoir.add(rows)
+            logger.info(
+                "%s: %d pings -> %d traversals (%d seen)",
+                datetime.fromtimestamp(log_window.start).isoformat(), log_window.t.shape[0], rows.shape[0], reservoir.seen,
+            )
+    finally:
+        await conn.close()
+
+    route_ids = [None] * len(codes)
+    for route_id, code in codes.items():
+        route_ids[code] = route_id
+    return reservoir.sample, route_ids
@@ -0,0 +1,102 @@
+"""
+Local OSRM Stand-in
+===================
+A tiny OSRM-compatible HTTP server for offline development. It answers
+`/route/v1/{profile}/{lng,lat;lng,lat;...}` with great-circle arcs between
+the waypoints (densified every 50 m) in OSRM's GeoJSON response format,
+so the API and simulator can run with no internet access.
+
+Usage:
+    python scripts/osrm_standin.py --port 5000
+    PATH_BACKEND=osrm:http://localhost:5000 uvicorn backend.app.main:app
+
+Run from project root: python scripts/osrm_standin.py --help
+"""
+
+import argparse
+import json
+import logging
+import sys
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import unquote, urlsplit
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from backend.app.path_service import densify_great_circle  # noqa: E402
+from ml_engine.geo import haversine_m  # noqa: E402
+
+logger = logging.getLogger("osrm_standin")
+
+# Used for the "duration" field only
+ASSUMED_SPEED_M_S = 30 / 3.6
+
+
+def route_response(waypoints: str) -> dict:
+    """OSRM /route response body for "lng,lat;lng,lat;..." waypoints."""
+    coords = []
+    for pair in waypoints.split(";"):
+        lng, lat = (float(v) for v in pair.split(","))
+        coords.append((lat, lng))
+    if len(coords) < 2:
+        raise ValueError("at least two waypoints are required")
+
+    path = densify_great_circle(coords)
+    distance = sum(float(haversine_m(a[0], a[1], b[0], b[1])) for a, b in zip(path[:-1], path[1:]))
+    return {
+        "code": "Ok",
+        "routes": [{
+            "geometry": {"type": "LineString", "coordinates": [[lng, lat] for lat, lng in path]},
+            "distance": round(distance, 1),
+            "duration": round(distance / ASSUMED_SPEED_M_S, 1),
+        }],
+        "waypoints": [{"location": [lng, lat]} for lat, lng in coords],
+    }
+
+
+class StandinHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        parts = urlsplit(self.path).path.strip("/").split("/")
+        if len(parts) != 4 or parts[:2] != ["route", "v1"]:
+            return self._send(404, {"code": "InvalidUrl", "message": "expected /route/v1/{profile}/{coordinates}"})
+        try:
+            body = route_response(unquote(parts[3]))
+        except ValueError as e:
+            return self._send(400, {"code": "InvalidQuery", "message": str(e)})
+        self._send(200, body)
+
+    def _send(self, status: int, body: dict) -> None:
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        logger.debug(format, *args)
+
+
+def make_server(host: str = "127.0.0.1", port: int = 5000) -> ThreadingHTTPServer:
+    return ThreadingHTTPServer((host, port), StandinHandler)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve great-circle routes in OSRM's format")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5000)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s | %(levelname)-7s | %(message)s")
+    server = make_server(args.host, args.port)
+    logger.info("OSRM stand-in listening on http://%s:%d", args.host, args.port)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
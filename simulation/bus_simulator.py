@@ -1,7 +1,8 @@
 """
 Bus GPS Simulator — sends simulated bus position pings to the backend API.
 
-Uses OSRM for realistic road-following paths and variable speed simulation.
+Uses road-following paths from the shared path service (OSRM by default,
+cached on disk after the first run) and variable speed simulation.
 Run from project root: python simulation/bus_simulator.py
 """
 
@@ -10,6 +11,7 @@ import json
 import requests
 import random
 import os
+import sys
 import logging
 from datetime import datetime, timezone
 from pathlib import Path
@@ -18,6 +20,9 @@ from dotenv import load_dotenv
 # Load .env from project root
 PROJECT_ROOT = Path(__file__).resolve().parent.parent
 load_dotenv(PROJECT_ROOT / ".env")
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from backend.app.path_service import path_service  # noqa: E402
 
 # Configuration
 API_PORT = os.getenv("API_PORT", "8000")
@@ -25,7 +30,6 @@ API_URL = f"http://localhost:{API_PORT}/location"
 SIMULATOR_API_KEY = os.getenv("SIMULATOR_API_KEY", "sim-key-change-me")
 REQUEST_HEADERS = {"X-API-Key": SIMULATOR_API_KEY}
 CONFIG_PATH = PROJECT_ROOT / "simulation" / "data" / "config.json"
-OSRM_ROUTE_URL = "http://router.project-osrm.org/route/v1/driving/{coords}?overview=full&geometries=geojson"
 
 logging.basicConfig(
     level=logging.INFO,
@@ -43,27 +47,11 @@ def load_config():
         exit(1)
 
 
-def fetch_osrm_path(stops):
-    """Fetch detailed road path between stops using OSRM."""
-    if len(stops) < 2:
-        return [tuple(s["coords"]) for s in stops]
-
-    coords_str = ";".join([f"{s['coords'][1]},{s['coords'][0]}" for s in stops])
-    url = OSRM_ROUTE_URL.format(coords=coords_str)
-
-    try:
-        logger.info("Fetching road path for %d stops...", len(stops))
-        response = requests.get(url, timeout=5)
-        if response.status_code == 200:
-            data = response.json()
-            if "routes" in data and len(data["routes"]) > 0:
-                path = [(p[1], p[0]) for p in data["routes"][0]["geometry"]["coordinates"]]
-                logger.info("Path found: %d points", len(path))
-                return path
-    except Exception as e:
-        logger.warning("OSRM fetch failed: %s. Using straight lines.", e)
-
-    return [tuple(stop["coords"]) for stop in stops]
+def fetch_route_path(stops):
+    """Road path between stops from the path service (backend set by PATH_BACKEND)."""
+    path, source = path_service.resolve([tuple(s["coords"]) for s in stops])
+    logger.info("Path for %d stops: %d points (%s)", len(stops), len(path), source)
+    return path
 
 
 def simulate_buses():
@@ -76,7 +64,7 @@ def simulate_buses():
     routes_cache = {}
     for route_id, route_data in config["routes"].items():
         logger.info("Processing route: %s", route_data["routeName"])
-        routes_cache[route_id] = fetch_osrm_path(route_data["stops"])
+        routes_cache[route_id] = fetch_route_path(route_data["stops"])
 
     # Assign buses to routes
     for route_id, bus_ids in config.get("bus_assignments", {}).items():
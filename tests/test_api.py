@@ -26,7 +26,7 @@ def test_health_check_returns_200(client):
     assert data["version"] == "2.1.0"
     assert data["system"] == "Smart-Transit Backend"
     assert data["database"] in ("connected", "disconnected")
-    assert data["ml_model"] in ("loaded", "fallback")
+    assert data["ml_model"] in ("loaded", "warming", "fallback")
 
 
 # --- ETA Prediction ---
@@ -294,6 +294,31 @@ def test_admin_create_route_validation(client, auth_token):
     assert response.status_code in (422, 503)
 
 
+def test_admin_route_delete_clears_its_stop_boards(client, auth_token, monkeypatch):
+    """Deleting a route takes its buses off the stop boards at once."""
+    from contextlib import asynccontextmanager
+    from backend.app.routers import admin
+    from backend.app.stop_boards import stop_boards
+
+    class _Conn:
+        async def execute(self, query, *args):
+            return "DELETE 1"
+
+    class _Pool:
+        @asynccontextmanager
+        async def acquire(self):
+            yield _Conn()
+
+    monkeypatch.setattr(admin, "get_pool", lambda: _Pool())
+    stop_boards.update_vehicle("ADMIN-BUS", "RT-ADMIN", [9001], [2000.0], [300.0])
+    try:
+        response = client.delete("/admin/routes/RT-ADMIN", headers={"Authorization": f"Bearer {auth_token}"})
+    finally:
+        remaining = stop_boards.arrivals(9001)
+        stop_boards.remove_vehicle("ADMIN-BUS")
+    assert response.status_code == 200 and remaining == []
+
+
 def test_admin_gtfs_status_requires_auth(client):
     """GTFS status endpoint should require auth."""
     response = client.get("/admin/gtfs/status")
@@ -348,3 +373,1495 @@ def test_gtfs_stop_sequences_are_ordered():
     for route in routes:
         seqs = [s["sequence"] for s in route["stops"]]
         assert seqs == sorted(seqs), f"Stops not ordered in route {route['route_id']}"
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# GTFS-Realtime Feed
+# ─────────────────────────────────────────────────────────────────────────────
+
+def _decode_protobuf(data: bytes) -> dict[int, list]:
+    """Tiny wire-format decoder: field number -> list of raw values."""
+    import struct
+
+    fields: dict[int, list] = {}
+    i = 0
+
+    def varint():
+        nonlocal i
+        shift = result = 0
+        while True:
+            b = data[i]
+            i += 1
+            result |= (b & 0x7F) << shift
+            shift += 7
+            if not b & 0x80:
+                return result
+
+    while i < len(data):
+        key = varint()
+        number, wire_type = key >> 3, key & 7
+        if wire_type == 0:
+            value = varint()
+        elif wire_type == 2:
+            length = varint()
+            value = data[i:i + length]
+            i += length
+        elif wire_type == 5:
+            value = struct.unpack("<f", data[i:i + 4])[0]
+            i += 4
+        else:
+            value = struct.unpack("<d", data[i:i + 8])[0]
+            i += 8
+        fields.setdefault(number, []).append(value)
+    return fields
+
+
+def test_gtfs_rt_vehicle_positions_no_db(client):
+    """Without DB, the GTFS-RT feed should return 503."""
+    response = client.get("/gtfs-rt/vehicle-positions")
+    assert response.status_code == 503
+
+
+def test_gtfs_rt_feed_encodes_vehicle_positions():
+    """Encoded FeedMessage should carry header and one entity per bus."""
+    from datetime import datetime, timezone
+    from backend.app.gtfs_realtime import encode_vehicle_positions
+
+    ts = datetime(2025, 1, 1, 12, 0, tzinfo=timezone.utc)
+    buses = [
+        {"vehicle_id": "PB-02-1001", "route_id": "RT-101", "lat": 31.62, "lng": 74.87, "speed": 36.0, "last_update": ts},
+        {"vehicle_id": "PB-02-2001", "route_id": "RT-202", "lat": 31.63, "lng": 74.88, "speed": 0.0, "last_update": ts},
+    ]
+    feed = _decode_protobuf(encode_vehicle_positions(buses, ts))
+
+    header = _decode_protobuf(feed[1][0])
+    assert header[1] == [b"2.0"]
+    assert header[3] == [int(ts.timestamp())]
+    assert len(feed[2]) == 2
+
+    entity = _decode_protobuf(feed[2][0])
+    assert entity[1] == [b"PB-02-1001"]
+    vehicle = _decode_protobuf(entity[4][0])
+    assert _decode_protobuf(vehicle[1][0])[5] == [b"RT-101"]
+    position = _decode_protobuf(vehicle[2][0])
+    assert abs(position[1][0] - 31.62) < 1e-4
+    assert abs(position[2][0] - 74.87) < 1e-4
+    assert abs(position[5][0] - 10.0) < 1e-4  # 36 km/h -> 10 m/s
+
+
+def test_tick_cache_builds_once_per_tick():
+    """Concurrent readers within a tick should share one build."""
+    import asyncio
+    from backend.app.live_cache import TickCache
+
+    cache = TickCache(tick_seconds=60)
+    calls = []
+
+    async def builder():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return len(calls)
+
+    async def run():
+        results = await asyncio.gather(*(cache.get("k", builder) for _ in range(10)))
+        return {r.value for r in results}
+
+    assert asyncio.run(run()) == {1}
+    assert len(calls) == 1
+    cache.invalidate("k")
+    assert asyncio.run(cache.get("k", builder)).value == 2
+
+
+def test_gtfs_rt_if_modified_since():
+    """Feed should be reported unmodified when the client copy is current."""
+    from datetime import datetime, timezone
+    from email.utils import format_datetime
+    from backend.app.routers.gtfs_rt import _not_modified_since
+
+    modified = datetime(2025, 1, 1, 12, 0, 30, 500000, tzinfo=timezone.utc)
+    assert _not_modified_since(format_datetime(modified, usegmt=True), modified)
+    earlier = datetime(2025, 1, 1, 12, 0, 0, tzinfo=timezone.utc)
+    assert not _not_modified_since(format_datetime(earlier, usegmt=True), modified)
+    assert not _not_modified_since(None, modified)
+    assert not _not_modified_since("not a date", modified)
+
+
+def test_gtfs_rt_validators_follow_feed_content():
+    """Dropping a bus changes the ETag at once; Last-Modified follows but never runs ahead of now."""
+    from datetime import datetime, timezone
+    from backend.app.routers.gtfs_rt import _version
+
+    etag, modified = _version(b"two buses")
+    assert _version(b"two buses") == (etag, modified)
+    for payload in (b"one bus", b"no buses", b"one bus again"):
+        newer_etag, newer = _version(payload)
+        assert newer_etag != etag and modified <= newer <= datetime.now(timezone.utc)
+        etag, modified = newer_etag, newer
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Batched ETA
+# ─────────────────────────────────────────────────────────────────────────────
+
+@pytest.fixture
+def fallback_predictor():
+    """Install a rule-based predictor on the app for the duration of a test."""
+    from ml_engine.predictor import ETAPredictor
+    previous = getattr(app.state, "eta_predictor", None)
+    app.state.eta_predictor = ETAPredictor(model_path="NON_EXISTENT")
+    yield app.state.eta_predictor
+    app.state.eta_predictor = previous
+
+
+def test_eta_batch_preserves_order(client, fallback_predictor):
+    """Batch results should line up with the request rows."""
+    payload = {"distances_meters": [1000, 2000, 500], "speeds_kmh": [36, 36, 18], "hours": [8, 9, 10]}
+    response = client.post("/eta/batch", json=payload)
+    assert response.status_code == 200
+    data = response.json()
+    assert data["source"] == "rule_based_fallback"
+    assert [round(s) for s in data["seconds"]] == [100, 200, 100]
+
+
+def test_eta_batch_hours_optional(client, fallback_predictor):
+    """Hours default to the current hour when omitted."""
+    response = client.post("/eta/batch", json={"distances_meters": [1000], "speeds_kmh": [36]})
+    assert response.status_code == 200
+    assert len(response.json()["seconds"]) == 1
+
+
+def test_eta_batch_length_mismatch_rejected(client):
+    """Arrays of different lengths should return 422."""
+    response = client.post("/eta/batch", json={"distances_meters": [1000, 2000], "speeds_kmh": [30]})
+    assert response.status_code == 422
+
+
+def test_eta_batch_invalid_values_rejected(client):
+    """Non-positive distances and out-of-range hours should return 422."""
+    response = client.post("/eta/batch", json={"distances_meters": [0], "speeds_kmh": [30]})
+    assert response.status_code == 422
+    response = client.post("/eta/batch", json={"distances_meters": [100], "speeds_kmh": [30], "hours": [24]})
+    assert response.status_code == 422
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# ETA Micro-batching
+# ─────────────────────────────────────────────────────────────────────────────
+
+class _CountingPredictor:
+    """Rule-based predictor that records the size of every batch it runs."""
+
+    def __init__(self):
+        from ml_engine.predictor import ETAPredictor
+        self._inner = ETAPredictor(model_path="NON_EXISTENT")
+        self.ready = False
+        self.batches = []
+
+    async def apredict_batch(self, distances_meters, current_speeds, hours_of_day):
+        self.batches.append(len(distances_meters))
+        return await self._inner.apredict_batch(distances_meters, current_speeds, hours_of_day)
+
+
+def test_micro_batcher_coalesces_concurrent_requests():
+    """A burst of concurrent predictions should run as a few model calls."""
+    import asyncio
+    from backend.app.eta_batcher import ETAMicroBatcher
+
+    predictor = _CountingPredictor()
+    batcher = ETAMicroBatcher(predictor, max_wait_ms=20, max_batch_size=64)
+
+    async def run():
+        results = await asyncio.gather(*(batcher.predict(600.0 * (i + 1), 10.0, 8) for i in range(100)))
+        await batcher.close()
+        return results
+
+    results = asyncio.run(run())
+    assert [minutes for minutes, _ in results] == pytest.approx([i + 1.0 for i in range(100)])
+    assert {source for _, source in results} == {"rule_based_fallback"}
+    assert sum(predictor.batches) == 100
+    assert max(predictor.batches) <= 64
+    assert len(predictor.batches) <= 4
+
+
+def test_micro_batcher_splits_batches_by_predictor():
+    """Rows for different models share a batch window but not a model call."""
+    import asyncio
+    from backend.app.eta_batcher import ETAMicroBatcher
+
+    default, route = _CountingPredictor(), _CountingPredictor()
+    batcher = ETAMicroBatcher(default, max_wait_ms=20, max_batch_size=64)
+
+    async def run():
+        calls = [batcher.predict(600.0, 10.0, 8, route if i % 3 == 0 else None) for i in range(30)]
+        results = await asyncio.gather(*calls)
+        await batcher.close()
+        return results
+
+    assert len(asyncio.run(run())) == 30
+    assert sum(default.batches) == 20 and sum(route.batches) == 10
+
+
+def test_micro_batcher_single_request_waits_at_most_max_wait():
+    """A lone request should be answered once max_wait elapses."""
+    import asyncio
+    from backend.app.eta_batcher import ETAMicroBatcher
+
+    batcher = ETAMicroBatcher(_CountingPredictor(), max_wait_ms=5, max_batch_size=64)
+
+    async def run():
+        result = await asyncio.wait_for(batcher.predict(1000.0, 10.0, 8), timeout=1.0)
+        await batcher.close()
+        return result
+
+    minutes, _ = asyncio.run(run())
+    assert minutes == pytest.approx(1000.0 / 10.0 / 60.0)
+
+
+def test_micro_batcher_limits_batches_in_flight_and_fails_them_on_close():
+    """Slow model calls hold back new batches; close() answers every waiting caller."""
+    import asyncio
+    from backend.app.eta_batcher import ETAMicroBatcher
+
+    class _Stuck:
+        ready = False
+        calls = 0
+
+        async def apredict_batch(self, distances_meters, current_speeds, hours_of_day):
+            _Stuck.calls += 1
+            await asyncio.Event().wait()
+
+    batcher = ETAMicroBatcher(_Stuck(), max_wait_ms=1, max_batch_size=2, max_in_flight=2)
+
+    async def run():
+        calls = [asyncio.ensure_future(batcher.predict(1000.0, 10.0, 8)) for _ in range(10)]
+        await asyncio.sleep(0.05)
+        in_flight, queued = len(batcher._in_flight), batcher._queue.qsize()
+        await batcher.close()
+        results = await asyncio.gather(*calls, return_exceptions=True)
+        return in_flight, queued, results
+
+    in_flight, queued, results = asyncio.run(run())
+    assert in_flight == 2 and _Stuck.calls == 2 and queued == 6
+    assert all(isinstance(r, RuntimeError) for r in results)
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# ETA Prediction Cache
+# ─────────────────────────────────────────────────────────────────────────────
+
+def test_eta_cache_quantizes_near_duplicates():
+    """Inputs within one grid step should share a key and a representative."""
+    from backend.app.eta_cache import ETAPredictionCache
+
+    cache = ETAPredictionCache(distance_step_m=10, speed_step_kmh=0.5)
+    assert cache.key(1003.0, 30.1, 8) == cache.key(998.0, 29.9, 8)
+    assert cache.key(1003.0, 30.1, 8) != cache.key(1003.0, 30.1, 9)
+    assert cache.representative(cache.key(1003.0, 30.1, 8)) == (1000.0, 30.0, 8)
+
+
+def test_eta_cache_lru_ttl_and_model_flush():
+    """Cache should evict LRU entries, expire by TTL and flush on model change."""
+    import time
+    from backend.app.eta_cache import ETAPredictionCache
+
+    cache = ETAPredictionCache(max_entries=2, ttl_seconds=60)
+    a, b, c = cache.key(10, 0.5, 1), cache.key(20, 1.0, 2), cache.key(30, 1.5, 3)
+    cache.put(a, 1, 1.0, "ML_model")
+    cache.put(b, 1, 2.0, "ML_model")
+    assert cache.get(a, 1) == (1.0, "ML_model")  # refreshes a
+    cache.put(c, 1, 3.0, "ML_model")              # evicts b
+    assert cache.get(b, 1) is None
+    assert cache.get(c, 1) == (3.0, "ML_model")
+    assert cache.get(cache.key(30, 1.5, 3, ("RT-101.npz", (1, 100))), 1) is None  # route models never share entries
+
+    assert cache.get(a, 2) is None  # new model version flushes everything
+    assert cache.get(c, 2) is None
+
+    short = ETAPredictionCache(ttl_seconds=0.01)
+    short.put(a, 1, 1.0, "ML_model")
+    time.sleep(0.02)
+    assert short.get(a, 1) is None
+    assert 0 < cache.hit_rate < 1
+
+
+class _ReadyCountingPredictor:
+    """Stands in for a loaded model: predicts distance / speed and counts calls."""
+    ready = True
+    model_version = 1
+
+    def __init__(self):
+        self.calls = 0
+
+    def predict(self, distance_meters, current_speed, hour_of_day):
+        self.calls += 1
+        return distance_meters / current_speed / 60.0
+
+
+def test_eta_endpoint_uses_transit_timezone(client, monkeypatch):
+    """The hour fed to the model is on TRANSIT_TIMEZONE's clock, as in training."""
+    from datetime import datetime
+    from zoneinfo import ZoneInfo
+    from backend.app.config import settings
+
+    class _HourRecorder(_ReadyCountingPredictor):
+        def predict(self, distance_meters, current_speed, hour_of_day):
+            self.hour = hour_of_day
+            return super().predict(distance_meters, current_speed, hour_of_day)
+
+    predictor = _HourRecorder()
+    monkeypatch.setattr(settings, "TRANSIT_TIMEZONE", "Pacific/Kiritimati")  # UTC+14
+    previous = tuple(getattr(app.state, name, None) for name in ("eta_predictor", "eta_cache"))
+    app.state.eta_predictor, app.state.eta_cache = predictor, None
+    try:
+        assert client.get("/eta?distance_meters=1000&current_speed_kmh=36").status_code == 200
+    finally:
+        app.state.eta_predictor, app.state.eta_cache = previous
+    assert predictor.hour in {datetime.now(ZoneInfo("Pacific/Kiritimati")).hour % 24,
+                              (datetime.now(ZoneInfo("Pacific/Kiritimati")).hour - 1) % 24}
+
+
+def test_eta_endpoint_serves_cache_hits(client):
+    """Repeated near-identical /eta calls should reach the model once."""
+    from backend.app.eta_cache import ETAPredictionCache
+
+    predictor = _ReadyCountingPredictor()
+    previous = (getattr(app.state, "eta_predictor", None), getattr(app.state, "eta_cache", None))
+    app.state.eta_predictor = predictor
+    app.state.eta_cache = ETAPredictionCache()
+    try:
+        first = client.get("/eta?distance_meters=1003&current_speed_kmh=36.1")
+        second = client.get("/eta?distance_meters=998&current_speed_kmh=35.9")
+        assert first.status_code == second.status_code == 200
+        assert first.json() == second.json()
+        assert abs(first.json()["seconds"] - 100.0) < 0.01  # answered at the 1000 m / 36 km/h grid point
+        assert predictor.calls == 1
+    finally:
+        app.state.eta_predictor, app.state.eta_cache = previous
+
+
+def test_eta_endpoint_uses_route_model(client, tmp_path):
+    """/eta?route_id= should be answered by the route's model, other routes by the global one."""
+    from backend.app.eta_cache import ETAPredictionCache
+    from ml_engine.model_registry import ModelRegistry
+
+    class _RoutePredictor(_ReadyCountingPredictor):
+        model_path = str(tmp_path / "RT-101.npz")
+        model_signature = (1, 100)
+
+        def predict(self, distance_meters, current_speed, hour_of_day):
+            return 2 * super().predict(distance_meters, current_speed, hour_of_day)
+
+    global_predictor, route_predictor = _ReadyCountingPredictor(), _RoutePredictor()
+    (tmp_path / "RT-101.npz").write_bytes(b"")
+    registry = ModelRegistry(tmp_path, fallback=global_predictor)
+    registry._load = lambda path: route_predictor
+
+    previous = tuple(getattr(app.state, name, None) for name in ("eta_predictor", "eta_cache", "model_registry"))
+    app.state.eta_predictor, app.state.eta_cache, app.state.model_registry = global_predictor, ETAPredictionCache(), registry
+    try:
+        on_route = client.get("/eta?distance_meters=1000&current_speed_kmh=36&route_id=RT-101")
+        other = client.get("/eta?distance_meters=1000&current_speed_kmh=36&route_id=RT-999")
+        assert on_route.status_code == other.status_code == 200
+        assert abs(on_route.json()["seconds"] - 200.0) < 0.01
+        assert abs(other.json()["seconds"] - 100.0) < 0.01
+        assert route_predictor.calls == global_predictor.calls == 1
+
+        # The registry reloads the route's model from a new file: cached answers of the old one are not served
+        reloaded = _RoutePredictor()
+        reloaded.model_signature = (2, 120)
+        registry._load = lambda path: reloaded
+        registry._resident.clear()
+        again = client.get("/eta?distance_meters=1000&current_speed_kmh=36&route_id=RT-101")
+        assert again.status_code == 200 and reloaded.calls == 1
+    finally:
+        app.state.eta_predictor, app.state.eta_cache, app.state.model_registry = previous
+
+
+def test_eta_endpoint_blends_segment_speed_profile(client):
+    """With route_id + segment_index, a bus reading 0 km/h is predicted at a blended speed."""
+    from ml_engine.predictor import ETAPredictor
+    from ml_engine.segment_profiles import HOURS_PER_WEEK, SegmentSpeedProfiles
+
+    predictor = ETAPredictor(model_path="NON_EXISTENT")
+    # 35-40 km/h in every hour of the week, median 37.5 km/h
+    predictor.segment_profiles = SegmentSpeedProfiles.from_histograms(
+        [("RT-101", 0, how, 7, 100) for how in range(HOURS_PER_WEEK)]
+    )
+    previous = getattr(app.state, "eta_predictor", None)
+    app.state.eta_predictor = predictor
+    try:
+        plain = client.get("/eta?distance_meters=1900&current_speed_kmh=0&route_id=RT-101")
+        blended = client.get("/eta?distance_meters=1900&current_speed_kmh=0&route_id=RT-101&segment_index=0")
+        assert plain.status_code == blended.status_code == 200
+        # 0.5 * 37.5 km/h = 18.75 km/h -> 1900 m takes 364.8 s
+        assert blended.json()["seconds"] == pytest.approx(364.8, rel=1e-3)
+        assert plain.json()["seconds"] > 10 * blended.json()["seconds"]
+    finally:
+        app.state.eta_predictor = previous
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Route snapping
+# ─────────────────────────────────────────────────────────────────────────────
+
+# ~111 m per 0.001 degree of latitude
+_SNAP_STOPS = [
+    {"stop_id": 101, "route_id": "RT-101", "stop_name": "A", "latitude": 31.620, "longitude": 74.870},
+    {"stop_id": 102, "route_id": "RT-101", "stop_name": "B", "latitude": 31.625, "longitude": 74.870},
+    {"stop_id": 103, "route_id": "RT-101", "stop_name": "C", "latitude": 31.630, "longitude": 74.870},
+    # Back south on a parallel street ~40 m east
+    {"stop_id": 104, "route_id": "RT-101", "stop_name": "D", "latitude": 31.630, "longitude": 74.8704},
+    {"stop_id": 105, "route_id": "RT-101", "stop_name": "E", "latitude": 31.620, "longitude": 74.8704},
+]
+
+
+def test_route_geometry_next_stop_is_ahead_not_nearest():
+    """A bus just past a stop is heading for the following one."""
+    from backend.app.route_snapping import RouteSnapper
+
+    snapper = RouteSnapper()
+    snapper.load(_SNAP_STOPS)
+    geometry = snapper.routes["RT-101"]
+    assert geometry.stop_offsets[:3] == pytest.approx([0, 556, 1112], abs=1)
+
+    # 100 m past B: B is nearer, but C is next
+    snap = snapper.snap("BUS-1", "RT-101", 31.6259, 74.87)
+    assert snap.next_stop == "C" and snap.next_stop_index == 2
+    assert snap.distance_along_m == pytest.approx(656, abs=2)
+    assert snap.next_stop_distance_m == pytest.approx(456, abs=2)
+    assert snap.off_route_m < 1
+
+    # A bus at a stop has arrived there; unknown routes are not snapped
+    end = snapper.snap("BUS-2", "RT-101", 31.620, 74.8704)
+    assert end.next_stop == "E" and end.next_stop_distance_m == 0.0
+    assert end.distance_along_m == pytest.approx(geometry.length_m, abs=1)
+    assert snapper.snap("BUS-3", "RT-999", 31.62, 74.87) is None
+
+
+def test_route_snapping_hint_keeps_direction_of_travel():
+    """Between two parallel legs, the previous position decides which one the bus is on."""
+    from backend.app.route_snapping import RouteSnapper
+
+    snapper = RouteSnapper()
+    snapper.load(_SNAP_STOPS)
+    # Slightly nearer the outbound leg than the return leg
+    lat, lng = 31.6265, 74.87018
+    assert snapper.snap("FRESH", "RT-101", lat, lng).next_stop == "C"
+
+    # A bus that was already on the return leg stays on it
+    snapper.snap("RETURNING", "RT-101", 31.628, 74.8704)
+    snap = snapper.snap("RETURNING", "RT-101", lat, lng)
+    assert snap.next_stop == "E" and snap.distance_along_m > 1200
+
+    # Beyond the snapping radius of the hinted segments a route-wide search takes over
+    snap = snapper.snap("RETURNING", "RT-101", 31.6205, 74.8685)
+    assert snap.next_stop == "B" and snap.distance_along_m == pytest.approx(56, abs=2)
+    assert snap.off_route_m == pytest.approx(142, abs=2)
+
+
+def test_route_snapping_batches_match_single_snaps():
+    """Vectorized snapping of many buses agrees with one-at-a-time snapping."""
+    import numpy as np
+    from backend.app.route_snapping import RouteSnapper
+
+    rng = np.random.default_rng(0)
+    lats = rng.uniform(31.619, 31.631, 200).tolist()
+    lngs = rng.uniform(74.8699, 74.8705, 200).tolist()
+    ids = [f"BUS-{i}" for i in range(200)]
+
+    batch, single = RouteSnapper(), RouteSnapper()
+    batch.load(_SNAP_STOPS)
+    single.load(_SNAP_STOPS)
+    many = batch.snap_many(ids, ["RT-101"] * 200, lats, lngs)
+    assert many == [single.snap(i, "RT-101", a, b) for i, a, b in zip(ids, lats, lngs)]
+
+
+def test_live_buses_include_next_stop(client, monkeypatch):
+    """/buses/live reports each bus's position along its route."""
+    from contextlib import asynccontextmanager
+    from datetime import datetime, timezone
+    from backend.app import live_cache
+    from backend.app.live_cache import tick_cache
+    from backend.app.route_snapping import route_snapper
+    from backend.app.routers import tracking
+
+    class _Conn:
+        async def fetch(self, query):
+            if "FROM stops" in query:
+                return _SNAP_STOPS
+            return [{
+                "vehicle_id": "PB-02-1001", "route_id": "RT-101", "latitude": 31.6259, "longitude": 74.87,
+                "speed": 30.0, "passenger_count": 3, "last_update": datetime.now(timezone.utc),
+            }]
+
+    class _Pool:
+        @asynccontextmanager
+        async def acquire(self):
+            yield _Conn()
+
+    monkeypatch.setattr(tracking, "get_pool", lambda: _Pool())
+    monkeypatch.setattr(live_cache, "get_pool", lambda: _Pool())
+    route_snapper.invalidate()
+    tick_cache.invalidate()
+    try:
+        response = client.get("/buses/live")
+    finally:
+        route_snapper.invalidate()
+        tick_cache.invalidate()
+    assert response.status_code == 200
+    bus = response.json()[0]
+    assert bus["next_stop"] == "C" and bus["next_stop_index"] == 2
+    assert bus["next_stop_distance_m"] == pytest.approx(456, abs=2)
+
+
+def test_route_eta_matrix_covers_downstream_stops(client, fallback_predictor, monkeypatch):
+    """Every bus gets an ETA to each stop ahead of it, computed once per tick."""
+    from contextlib import asynccontextmanager
+    from datetime import datetime, timezone
+    from backend.app import live_cache
+    from backend.app.live_cache import tick_cache
+    from backend.app.route_snapping import route_snapper
+    from backend.app.routers import routes
+
+    fleet_queries = []
+
+    class _Conn:
+        async def fetch(self, query):
+            if "FROM stops" in query:
+                return _SNAP_STOPS
+            fleet_queries.append(query)
+            now = datetime.now(timezone.utc)
+            return [
+                {"vehicle_id": "BUS-1", "route_id": "RT-101", "latitude": 31.6259, "longitude": 74.87,
+                 "speed": 36.0, "passenger_count": 0, "last_update": now},
+                {"vehicle_id": "BUS-2", "route_id": "RT-101", "latitude": 31.6210, "longitude": 74.8704,
+                 "speed": 36.0, "passenger_count": 0, "last_update": now},
+                {"vehicle_id": "BUS-3", "route_id": "RT-202", "latitude": 31.6, "longitude": 74.8,
+                 "speed": 36.0, "passenger_count": 0, "last_update": now},
+            ]
+
+    class _Pool:
+        @asynccontextmanager
+        async def acquire(self):
+            yield _Conn()
+
+    monkeypatch.setattr(routes, "get_pool", lambda: _Pool())
+    monkeypatch.setattr(live_cache, "get_pool", lambda: _Pool())
+    monkeypatch.setattr(tick_cache, "tick_seconds", 60)
+    route_snapper.invalidate()
+    tick_cache.invalidate()
+    try:
+        first = client.get("/routes/RT-101/eta-matrix")
+        second = client.get("/routes/RT-101/eta-matrix")
+        missing = client.get("/routes/RT-999/eta-matrix")
+    finally:
+        route_snapper.invalidate()
+        tick_cache.invalidate()
+
+    assert first.status_code == 200 and second.content == first.content
+    assert len(fleet_queries) == 1
+    assert missing.status_code == 404
+
+    data = first.json()
+    assert data["stops"] == ["A", "B", "C", "D", "E"] and data["source"] == "rule_based_fallback"
+    bus1, bus2 = data["buses"]
+    # 10 m/s with the rule-based model: seconds = meters / 10
+    assert [e["stop"] for e in bus1["etas"]] == ["C", "D", "E"]
+    assert [e["seconds"] for e in bus1["etas"]] == pytest.approx([45.6, 49.4, 160.6], abs=0.3)
+    # Near the end of the return leg only the last stop is ahead
+    assert [e["stop"] for e in bus2["etas"]] == ["E"]
+    assert bus2["etas"][0]["distance_m"] == pytest.approx(111, abs=2)
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Stop arrival boards
+# ─────────────────────────────────────────────────────────────────────────────
+
+def test_stop_boards_stay_sorted_and_drop_passed_stops():
+    """Boards list the soonest arrivals first and forget stops a bus has passed."""
+    from backend.app.stop_boards import StopBoards
+
+    boards = StopBoards()
+    boards.update_vehicle("BUS-1", "RT-101", [102, 103], [2000.0, 2100.0], [500.0, 1000.0])
+    boards.update_vehicle("BUS-2", "RT-101", [102, 103], [1900.0, 2300.0], [300.0, 900.0])
+    assert [a["vehicle_id"] for a in boards.arrivals(102)] == ["BUS-2", "BUS-1"]
+    assert [a["vehicle_id"] for a in boards.arrivals(103)] == ["BUS-1", "BUS-2"]
+    assert len(boards.arrivals(103, limit=1)) == 1
+
+    # BUS-2 passed stop 102: only its later stop remains, with the new prediction
+    boards.update_vehicle("BUS-2", "RT-101", [103], [2050.0], [400.0])
+    assert [a["vehicle_id"] for a in boards.arrivals(102)] == ["BUS-1"]
+    board = boards.arrivals(103)
+    assert [a["vehicle_id"] for a in board] == ["BUS-2", "BUS-1"] and board[0]["distance_m"] == 400.0
+
+    boards.remove_vehicle("BUS-1")
+    assert boards.arrivals(102) == [] and len(boards.arrivals(103)) == 1
+
+
+def test_stop_boards_prune_silent_buses_and_edited_routes(monkeypatch):
+    """Silent buses are skipped on read and pruned on the flusher tick; route edits clear the route."""
+    import asyncio
+    from backend.app import stop_boards as module
+    from backend.app.stop_boards import StopBoards, Subscription
+    from backend.app.stop_events import StopEventDetector, StopEventFlusher
+
+    class _Pool:
+        pass
+
+    clock = [1000.0]
+    monkeypatch.setattr(module.time, "monotonic", lambda: clock[0])
+    boards = StopBoards()
+    subscription = Subscription()
+    boards.update_vehicle("SILENT", "RT-101", [102, 103], [2100.0, 2200.0], [500.0, 900.0])
+    clock[0] += module.STALE_SECONDS
+    boards.update_vehicle("LIVE", "RT-101", [102], [2000.0], [300.0])
+    boards.update_vehicle("OTHER", "RT-202", [201], [2000.0], [300.0])
+    boards.subscribe(subscription, [103])
+    subscription.queue.get_nowait()
+    clock[0] += 1
+    # SILENT sits behind LIVE on 102: skipped while reading, without a scan of the board
+    assert [a["vehicle_id"] for a in boards.arrivals(102)] == ["LIVE"] and boards.arrivals(103) == []
+    assert "SILENT" in boards._vehicles
+
+    # The flusher tick drops it everywhere and tells 103's subscribers
+    flusher = StopEventFlusher(StopEventDetector(), _Pool(), boards=boards)
+    monkeypatch.setattr(flusher.detector, "flush", lambda pool: asyncio.sleep(0, result=0))
+    asyncio.run(flusher.flush())
+    assert "SILENT" not in boards._vehicles and boards._boards.get(103) is None
+    assert subscription.queue.get_nowait() == {"type": "stop_board", "stop_id": 103, "arrivals": []}
+
+    boards.invalidate_route("RT-101")
+    assert boards.arrivals(102) == [] and [a["vehicle_id"] for a in boards.arrivals(201)] == ["OTHER"]
+
+
+def test_stop_board_subscribers_only_get_their_stops():
+    """A subscription receives the current board, then only changes to its stops."""
+    import asyncio
+    from backend.app.stop_boards import StopBoards, Subscription
+
+    async def run():
+        boards = StopBoards()
+        subscription = Subscription()
+        boards.subscribe(subscription, [103])
+        initial = subscription.queue.get_nowait()
+
+        boards.update_vehicle("BUS-1", "RT-101", [102], [2000.0], [500.0])
+        assert subscription.queue.empty()
+        boards.update_vehicle("BUS-1", "RT-101", [102, 103], [2000.0, 2100.0], [500.0, 1000.0])
+        change = subscription.queue.get_nowait()
+
+        boards.unsubscribe(subscription)
+        boards.update_vehicle("BUS-1", "RT-101", [103], [2050.0], [400.0])
+        return initial, change, subscription.queue.empty()
+
+    initial, change, quiet = asyncio.run(run())
+    assert initial == {"type": "stop_board", "stop_id": 103, "arrivals": []}
+    assert change["stop_id"] == 103 and change["arrivals"][0]["vehicle_id"] == "BUS-1"
+    assert quiet
+
+
+def test_ping_updates_stop_arrivals(client, fallback_predictor, monkeypatch):
+    """A location ping puts the bus on the boards of the stops ahead of it."""
+    from contextlib import asynccontextmanager
+    from backend.app.route_snapping import route_snapper
+    from backend.app.routers import stops, tracking
+    from backend.app.stop_boards import stop_boards
+
+    class _Conn:
+        async def fetch(self, query):
+            return _SNAP_STOPS
+
+        async def execute(self, query, *args):
+            return "INSERT 0 1"
+
+    class _Pool:
+        @asynccontextmanager
+        async def acquire(self):
+            yield _Conn()
+
+    monkeypatch.setattr(tracking, "get_pool", lambda: _Pool())
+    monkeypatch.setattr(stops, "get_pool", lambda: _Pool())
+    route_snapper.invalidate()
+    ping = {"vehicle_id": "BOARD-BUS", "route_id": "RT-101", "lat": 31.6259, "lng": 74.87, "speed": 36.0}
+    try:
+        assert client.post("/location", json=ping, headers={"X-API-Key": "sim-key-change-me"}).status_code == 200
+        board_c = client.get("/stops/103/arrivals").json()
+        board_b = client.get("/stops/102/arrivals").json()
+        missing = client.get("/stops/999/arrivals")
+    finally:
+        stop_boards.remove_vehicle("BOARD-BUS")
+        route_snapper.invalidate()
+
+    assert board_c["stop"] == "C" and board_c["route_id"] == "RT-101"
+    (arrival,) = board_c["arrivals"]
+    assert arrival["vehicle_id"] == "BOARD-BUS" and arrival["distance_m"] == pytest.approx(456, abs=2)
+    assert arrival["seconds"] == pytest.approx(45.6, abs=2)
+    assert board_b["arrivals"] == []
+    assert missing.status_code == 404
+
+
+def test_stop_board_websocket_sends_current_board(client):
+    """Subscribing over /ws/stops immediately returns the stop's board."""
+    with client.websocket_connect("/ws/stops") as ws:
+        ws.send_json({"action": "subscribe", "stop_ids": [103]})
+        assert ws.receive_json() == {"type": "stop_board", "stop_id": 103, "arrivals": []}
+        ws.send_json({"stop_ids": "nope"})
+        assert ws.receive_json()["type"] == "error"
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Nearby stops
+# ─────────────────────────────────────────────────────────────────────────────
+
+def test_grid_index_matches_brute_force_on_50k_stops():
+    """Radius queries agree with measuring every stop, and stay fast at network scale."""
+    import time
+    import numpy as np
+    from backend.app.spatial_index import GridIndex
+    from ml_engine.geo import haversine_m
+
+    rng = np.random.default_rng(0)
+    lat = rng.uniform(31.45, 31.70, 50_000)
+    lng = rng.uniform(74.20, 74.50, 50_000)
+    grid = GridIndex(lat, lng)
+
+    timings = []
+    for q_lat, q_lng, radius in zip(rng.uniform(31.45, 31.70, 50), rng.uniform(74.20, 74.50, 50), rng.uniform(50, 1500, 50)):
+        started = time.perf_counter()
+        indices, distances = grid.within(q_lat, q_lng, radius, limit=20)
+        timings.append(time.perf_counter() - started)
+
+        exact = haversine_m(q_lat, q_lng, lat, lng)
+        expected = np.argsort(exact, kind="stable")[:min(20, int((exact <= radius).sum()))]
+        np.testing.assert_array_equal(np.sort(indices), np.sort(expected))
+        assert np.all(np.diff(distances) >= 0) and np.all(distances <= radius)
+
+    assert sorted(timings)[len(timings) // 2] < 0.002
+
+
+def test_nearby_stops_endpoint(client, monkeypatch):
+    """/stops/nearby returns stops inside the radius, nearest first."""
+    from contextlib import asynccontextmanager
+    from backend.app.routers import stops
+    from backend.app.spatial_index import stop_index
+
+    class _Conn:
+        async def fetch(self, query):
+            return _SNAP_STOPS
+
+    class _Pool:
+        @asynccontextmanager
+        async def acquire(self):
+            yield _Conn()
+
+    monkeypatch.setattr(stops, "get_pool", lambda: _Pool())
+    stop_index.invalidate()
+    try:
+        response = client.get("/stops/nearby?lat=31.6249&lng=74.8702&radius=300")
+        none = client.get("/stops/nearby?lat=31.70&lng=74.95")
+        invalid = client.get("/stops/nearby?lat=31.6&lng=74.8&radius=0")
+    finally:
+        stop_index.invalidate()
+
+    assert response.status_code == 200
+    nearby = response.json()
+    assert [s["stop"] for s in nearby] == ["B"]
+    assert nearby[0]["stop_id"] == 102 and nearby[0]["distance_m"] == pytest.approx(21, abs=2)
+    assert none.json() == [] and invalid.status_code == 422
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Viewport filtering of live buses
+# ─────────────────────────────────────────────────────────────────────────────
+
+def test_vehicle_grid_tracks_moving_buses():
+    """Buses move between cells as they ping, and box queries match a full scan."""
+    import numpy as np
+    from backend.app.spatial_index import VehicleGrid
+
+    rng = np.random.default_rng(1)
+    grid = VehicleGrid()
+    positions = {}
+    for step in range(5):
+        for i in range(2000):
+            lat, lng = float(rng.uniform(31.45, 31.70)), float(rng.uniform(74.20, 74.50))
+            positions[f"BUS-{i}"] = (lat, lng)
+            grid.update({"vehicle_id": f"BUS-{i}", "lat": lat, "lng": lng})
+    assert len(grid) == 2000
+
+    for min_lat, min_lng in zip(rng.uniform(31.45, 31.68, 20), rng.uniform(74.20, 74.48, 20)):
+        box = (min_lat, min_lng, min_lat + 0.02, min_lng + 0.02)
+        found = [b["vehicle_id"] for b in grid.within_bbox(*box)]
+        expected = sorted(v for v, (lat, lng) in positions.items()
+                          if box[0] <= lat <= box[2] and box[1] <= lng <= box[3])
+        assert found == expected
+    # A box larger than the whole fleet scans occupied cells instead
+    assert len(grid.within_bbox(-90, -180, 90, 180)) == 2000
+
+    grid.sync([{"vehicle_id": "BUS-0", "lat": 31.5, "lng": 74.3}])
+    assert [b["vehicle_id"] for b in grid.within_bbox(31, 74, 32, 75)] == ["BUS-0"]
+
+
+def test_parse_bbox_validates_order_and_range():
+    from backend.app.spatial_index import parse_bbox
+
+    assert parse_bbox("74.86,31.61,74.88,31.64") == (31.61, 74.86, 31.64, 74.88)
+    assert parse_bbox([74.86, 31.61, 74.88, 31.64]) == (31.61, 74.86, 31.64, 74.88)
+    for bad in ("74.86,31.61,74.88", "a,b,c,d", "74.88,31.61,74.86,31.64", "0,95,1,96", None):
+        with pytest.raises(ValueError):
+            parse_bbox(bad)
+
+
+def test_live_buses_bbox_and_viewport_subscription(client, monkeypatch):
+    """Only buses inside the requested box come back, over HTTP and the WebSocket."""
+    from contextlib import asynccontextmanager
+    from datetime import datetime, timezone
+    from backend.app import live_cache
+    from backend.app.live_cache import tick_cache
+    from backend.app.route_snapping import route_snapper
+    from backend.app.routers import tracking, websocket
+    from backend.app.spatial_index import vehicle_grid
+
+    class _Conn:
+        async def fetch(self, query):
+            if "FROM stops" in query:
+                return _SNAP_STOPS
+            now = datetime.now(timezone.utc)
+            return [
+                {"vehicle_id": "FAR", "route_id": "RT-202", "latitude": 31.40, "longitude": 74.20,
+                 "speed": 30.0, "passenger_count": 3, "last_update": now},
+                {"vehicle_id": "NEAR", "route_id": "RT-101", "latitude": 31.6259, "longitude": 74.87,
+                 "speed": 30.0, "passenger_count": 3, "last_update": now},
+            ]
+
+        async def execute(self, query, *args):
+            return "INSERT 0 1"
+
+    class _Pool:
+        @asynccontextmanager
+        async def acquire(self):
+            yield _Conn()
+
+    for module in (tracking, live_cache, websocket):
+        monkeypatch.setattr(module, "get_pool", lambda: _Pool())
+    monkeypatch.setattr(tick_cache, "tick_seconds", 60)
+    route_snapper.invalidate()
+    tick_cache.invalidate()
+    viewport = "74.86,31.62,74.88,31.64"
+    try:
+        everything = client.get("/buses/live").json()
+        inside = client.get(f"/buses/live?bbox={viewport}").json()
+        # A ping moves the bus in the grid at once, without waiting for the next tick
+        ping = {"vehicle_id": "FAR", "route_id": "RT-202", "lat": 31.63, "lng": 74.875, "speed": 20.0}
+        assert client.post("/location", json=ping, headers={"X-API-Key": "sim-key-change-me"}).status_code == 200
+        after_ping = client.get(f"/buses/live?bbox={viewport}").json()
+        invalid = client.get("/buses/live?bbox=1,2,3")
+
+        with client.websocket_connect("/ws/buses") as ws:
+            assert len(ws.receive_json()["buses"]) == 2
+            ws.send_json({"type": "viewport", "bbox": [74.869, 31.625, 74.871, 31.627]})
+            update = ws.receive_json()
+            ws.send_json({"type": "viewport", "bbox": "nope"})
+            error = ws.receive_json()
+    finally:
+        route_snapper.invalidate()
+        tick_cache.invalidate()
+        vehicle_grid.sync([])
+
+    assert [b["vehicle_id"] for b in everything] == ["FAR", "NEAR"]
+    assert [b["vehicle_id"] for b in inside] == ["NEAR"]
+    assert inside[0]["next_stop"] == "C"
+    assert [b["vehicle_id"] for b in after_ping] == ["FAR", "NEAR"]
+    assert invalid.status_code == 422
+    assert update["type"] == "bus_update" and [b["vehicle_id"] for b in update["buses"]] == ["NEAR"]
+    assert error["type"] == "error"
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Vector tiles
+# ─────────────────────────────────────────────────────────────────────────────
+
+_TILE_ROWS = [{**s, "route_name": "Test Line"} for s in _SNAP_STOPS]
+
+
+def _decode_packed(data: bytes) -> list[int]:
+    values, shift, current = [], 0, 0
+    for b in data:
+        current |= (b & 0x7F) << shift
+        shift += 7
+        if not b & 0x80:
+            values.append(current)
+            shift = current = 0
+    return values
+
+
+def _unzigzag(value: int) -> int:
+    return (value >> 1) ^ -(value & 1)
+
+
+def test_douglas_peucker_keeps_corners_and_turnarounds():
+    import numpy as np
+    from backend.app.vector_tiles import douglas_peucker
+
+    x = np.linspace(0, 10, 11)
+    assert douglas_peucker(x, np.zeros(11), 0.1).tolist() == [True] + [False] * 9 + [True]
+
+    # An L keeps its corner; small wiggles under the tolerance go
+    lx = np.array([0, 1, 2, 3, 3.02, 3, 3])
+    ly = np.array([0, 0.01, 0, 0, 1, 2, 3])
+    assert np.flatnonzero(douglas_peucker(lx, ly, 0.1)).tolist() == [0, 3, 6]
+
+    # Out and back: the far end lies on the line through the endpoints but must stay
+    assert douglas_peucker([0, 5, 2], [0, 0, 0], 0.1).tolist() == [True, True, True]
+
+
+def test_vector_tile_encodes_routes_and_stops():
+    """A tile carries the route line in tile coordinates and the stops inside it."""
+    import numpy as np
+    from backend.app.vector_tiles import TILE_EXTENT, RouteNetwork, mercator
+
+    network = RouteNetwork(_TILE_ROWS)
+    z = 14
+    wx, wy = mercator(31.625, 74.870)
+    tx, ty = int(wx * 2 ** z), int(wy * 2 ** z)
+
+    layers = [_decode_protobuf(layer) for layer in _decode_protobuf(network.render(z, tx, ty))[3]]
+    assert [layer[1][0] for layer in layers] == [b"routes", b"stops"]
+    routes, stops = layers
+    assert routes[15] == [2] and routes[5] == [TILE_EXTENT]
+    assert set(routes[3]) == {b"route_id", b"route_name"}
+
+    (feature,) = (_decode_protobuf(f) for f in routes[2])
+    assert feature[3] == [2]
+    geometry = _decode_packed(feature[4][0])
+    assert geometry[0] == 9  # MoveTo, one point
+    ax, ay = mercator(31.620, 74.870)
+    assert _unzigzag(geometry[1]) == round((ax * 2 ** z - tx) * TILE_EXTENT)
+    assert _unzigzag(geometry[2]) == round((ay * 2 ** z - ty) * TILE_EXTENT)
+    # B lies on the A-C leg and goes at any zoom; at zoom 5 the 40 m between the legs is under a pixel
+    assert len(network.simplified(16)[0][0]) == 4
+    assert len(network.simplified(5)[0][0]) == 2
+
+    stop_ids = sorted(_decode_protobuf(f)[1][0] for f in stops[2])
+    assert stop_ids == [101, 102, 103, 104, 105]
+    assert network.render(z, tx + 5, ty) == b""
+    # Stops are left out at low zoom
+    assert len(_decode_protobuf(network.render(10, tx >> 4, ty >> 4))[3]) == 1
+
+
+def test_tiles_endpoint_caches_and_invalidates(client, tmp_path, monkeypatch):
+    """Tiles are served from memory and disk, and a network change makes a new version."""
+    from contextlib import asynccontextmanager
+    from backend.app.routers import tiles
+    from backend.app.vector_tiles import NetworkTiles, mercator
+
+    rows = list(_TILE_ROWS)
+    fetches = []
+
+    class _Conn:
+        async def fetch(self, query):
+            fetches.append(query)
+            return rows
+
+    class _Pool:
+        @asynccontextmanager
+        async def acquire(self):
+            yield _Conn()
+
+    service = NetworkTiles(cache_dir=str(tmp_path), max_entries=16)
+    # Unrelated data sharing the cache directory, even with a hash-like name
+    (tmp_path / "path_cache").mkdir()
+    (tmp_path / "path_cache" / "keep.json").write_text("{}")
+    (tmp_path / "0123456789abcdef").mkdir()
+    monkeypatch.setattr(tiles, "get_pool", lambda: _Pool())
+    monkeypatch.setattr(tiles, "network_tiles", service)
+    wx, wy = mercator(31.625, 74.870)
+    url = f"/tiles/14/{int(wx * 2 ** 14)}/{int(wy * 2 ** 14)}.mvt"
+
+    first = client.get(url)
+    assert first.status_code == 200
+    assert first.headers["content-type"] == "application/vnd.mapbox-vector-tile"
+    assert client.get(url).content == first.content and len(fetches) == 1
+    assert list(tmp_path.glob("*/14/*/*.mvt"))
+    assert client.get(url, headers={"If-None-Match": first.headers["etag"]}).status_code == 304
+    assert client.get("/tiles/3/8/0.mvt").status_code == 404
+
+    # Renaming a stop changes the network version: a fresh tile and the old disk cache is pruned
+    rows[1] = {**rows[1], "stop_name": "B2"}
+    service.invalidate()
+    second = client.get(url)
+    assert second.headers["etag"] != first.headers["etag"] and len(fetches) == 2
+    assert sorted(p.name for p in tmp_path.iterdir()) == sorted(
+        ["0123456789abcdef", "path_cache", second.headers["etag"].strip('"')]
+    )
+    assert (tmp_path / "path_cache" / "keep.json").exists()
+
+
+def test_tiles_no_db(client):
+    assert client.get("/tiles/0/0/0.mvt").status_code == 503
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Route paths
+# ─────────────────────────────────────────────────────────────────────────────
+
+def test_great_circle_densifier_spacing():
+    import numpy as np
+    from backend.app.path_service import densify_great_circle
+    from ml_engine.geo import haversine_m
+
+    stops = [(31.620, 74.870), (31.630, 74.870), (31.630, 74.870), (31.630, 74.880)]
+    path = np.array(densify_great_circle(stops, step_m=50))
+    assert tuple(path[0]) == pytest.approx(stops[0]) and tuple(path[-1]) == pytest.approx(stops[-1])
+    steps = haversine_m(path[:-1, 0], path[:-1, 1], path[1:, 0], path[1:, 1])
+    assert steps.max() <= 50.0 and steps.min() > 40.0
+    assert steps.sum() == pytest.approx(1112 + 948, abs=5)
+
+
+def test_path_service_caches_osrm_paths_on_disk(tmp_path):
+    """The first resolution goes to the backend; later ones (even in a new process) read the disk cache."""
+    import threading
+    from backend.app.path_service import OSRMBackend, PathService
+    from scripts.osrm_standin import make_server
+
+    server = make_server(port=0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    stops = [(31.620, 74.870), (31.630, 74.870), (31.630, 74.880)]
+    try:
+        backend = OSRMBackend(f"http://127.0.0.1:{server.server_address[1]}")
+        path, source = PathService(backend, str(tmp_path)).resolve(stops)
+    finally:
+        server.shutdown()
+        server.server_close()
+    assert source == backend.name and len(path) > 40
+    assert path[0] == pytest.approx(stops[0]) and path[-1] == pytest.approx(stops[-1])
+    assert len(list(tmp_path.glob("*.json"))) == 1
+
+    # The server is gone: a fresh service on the same directory still answers from disk
+    offline = PathService(OSRMBackend(backend.base_url, timeout=0.5), str(tmp_path))
+    assert offline.resolve(stops) == (path, backend.name)
+
+
+def test_path_service_falls_back_without_persisting(tmp_path):
+    from backend.app.path_service import GreatCircleBackend, PathService
+
+    class _Down:
+        name = "osrm:http://unreachable"
+        calls = 0
+
+        def route(self, coords):
+            self.calls += 1
+            raise ConnectionError("no network")
+
+    backend = _Down()
+    service = PathService(backend, str(tmp_path))
+    stops = [(31.620, 74.870), (31.630, 74.870)]
+    path, source = service.resolve(stops)
+    assert source == GreatCircleBackend.name and len(path) > 2
+    # The failure is remembered for a while instead of retried on every request, and never cached on disk
+    service.resolve(stops)
+    assert backend.calls == 1 and not list(tmp_path.iterdir())
+
+
+def test_route_path_endpoint(client, tmp_path, monkeypatch):
+    from contextlib import asynccontextmanager
+    from backend.app.path_service import GreatCircleBackend, PathService
+    from backend.app.routers import routes
+
+    class _Conn:
+        async def fetch(self, query, route_id):
+            return [s for s in _SNAP_STOPS if s["route_id"] == route_id]
+
+    class _Pool:
+        @asynccontextmanager
+        async def acquire(self):
+            yield _Conn()
+
+    monkeypatch.setattr(routes, "get_pool", lambda: _Pool())
+    monkeypatch.setattr(routes, "path_service", PathService(GreatCircleBackend(), str(tmp_path)))
+    response = client.get("/routes/RT-101/path")
+    assert response.status_code == 200
+    data = response.json()
+    assert data["source"] == "great_circle" and data["coordinates"][0] == pytest.approx([31.620, 74.870])
+    assert len(data["coordinates"]) > 40
+    assert client.get("/routes/RT-999/path").status_code == 404
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Stop events
+# ─────────────────────────────────────────────────────────────────────────────
+
+def test_stop_event_detector_records_visits_and_dwell():
+    """A bus driving A -> C, waiting 20 s at B, leaves one event per stop it passed through."""
+    from datetime import datetime, timedelta, timezone
+    from backend.app.route_snapping import RouteSnapper
+    from backend.app.stop_events import StopEventDetector
+
+    snapper = RouteSnapper()
+    snapper.load(_SNAP_STOPS)
+    geometry = snapper.routes["RT-101"]
+    detector = StopEventDetector(radius_m=30)
+    start = datetime(2025, 1, 6, 8, 0, tzinfo=timezone.utc)
+
+    # ~11 m per second northwards, standing at B for 20 pings
+    lats = [31.620 + 0.0001 * i for i in range(51)]
+    lats = lats[:50] + [31.625] * 20 + lats[50:] + [31.620 + 0.0001 * i for i in range(51, 100)]
+    for t, lat in enumerate(lats):
+        snap = snapper.snap("BUS-1", "RT-101", lat, 74.870)
+        detector.observe("BUS-1", "RT-101", geometry, snap, start + timedelta(seconds=t))
+
+    a, b = detector.pending
+    assert (a.stop_id, a.arrive) == (101, start) and (a.depart - a.arrive).total_seconds() == 2
+    assert b.stop_id == 102 and b.vehicle_id == "BUS-1" and b.route_id == "RT-101"
+    # Inside 30 m from 27 m before B to 27 m after it, plus the 20 s stood still
+    assert (b.depart - b.arrive).total_seconds() == pytest.approx(25, abs=1)
+
+    # The bus reached C; going silent completes that visit at its last ping
+    assert detector.close_stale(start + timedelta(hours=1)) == 1
+    c = detector.pending[-1]
+    assert c.stop_id == 103 and c.depart == start + timedelta(seconds=len(lats) - 1)
+
+
+def test_stop_event_flush_is_one_copy_and_retries():
+    import asyncio
+    from contextlib import asynccontextmanager
+    from datetime import datetime, timezone
+    from backend.app.stop_events import StopEvent, StopEventDetector
+
+    copies = []
+    fail = [True]
+
+    class _Conn:
+        async def copy_records_to_table(self, table, records, columns):
+            if fail[0]:
+                raise ConnectionError("db down")
+            copies.append((table, list(records), columns))
+
+    class _Pool:
+        @asynccontextmanager
+        async def acquire(self):
+            yield _Conn()
+
+    detector = StopEventDetector()
+    now = datetime.now(timezone.utc)
+    detector.pending = [StopEvent(f"BUS-{i}", "RT-101", 101, now, now) for i in range(3)]
+
+    with pytest.raises(ConnectionError):
+        asyncio.run(detector.flush(_Pool()))
+    assert len(detector.pending) == 3
+
+    fail[0] = False
+    assert asyncio.run(detector.flush(_Pool())) == 3
+    (table, records, columns), = copies
+    assert table == "stop_events" and columns == ["vehicle_id", "route_id", "stop_id", "arrive", "depart"]
+    assert [r[0] for r in records] == ["BUS-0", "BUS-1", "BUS-2"] and detector.pending == []
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Headways and bunching
+# ─────────────────────────────────────────────────────────────────────────────
+
+def test_headway_monitor_raises_and_clears_bunching_and_gaps():
+    from backend.app.headways import HeadwayMonitor
+
+    monitor = HeadwayMonitor()
+    # 4 buses on a 10 km route: even spacing is 2.5 km
+    for vehicle_id, along in [("A", 0.0), ("B", 2500.0), ("C", 5000.0), ("D", 7500.0)]:
+        assert monitor.update(vehicle_id, "RT-101", along, 36.0, 10_000.0) == []
+
+    # B catches up with C
+    (alert,) = monitor.update("B", "RT-101", 4600.0, 36.0, 10_000.0)
+    assert alert["kind"] == "bunching" and (alert["follower"], alert["leader"]) == ("B", "C")
+    assert alert["headway_m"] == 400.0 and alert["headway_s"] == 40.0
+    # Moving within the bunch updates the alert without raising it again
+    assert monitor.update("B", "RT-101", 4700.0, 36.0, 10_000.0) == []
+    assert monitor.alerts("RT-101")[0]["headway_m"] == 300.0
+
+    # C pulls away and the bunch clears; A is 4.7 km behind B, still under twice the spacing
+    (cleared,) = monitor.update("C", "RT-101", 5700.0, 36.0, 10_000.0)
+    assert cleared["kind"] == "cleared" and cleared["cleared_kind"] == "bunching"
+    assert monitor.alerts() == []
+
+    # With D gone the spacing is 3.33 km; A dropping back to 6.7 km behind B opens a gap
+    assert monitor.remove("D") == []
+    (gap,) = monitor.update("A", "RT-101", -2000.0, 36.0, 10_000.0)
+    assert gap["kind"] == "gap" and gap["follower"] == "A" and gap["leader"] == "B"
+
+    report = monitor.route_headways("RT-101")
+    assert [b["vehicle_id"] for b in report["buses"]] == ["C", "B", "A"]
+    assert report["buses"][0]["leader"] is None and report["buses"][1]["headway_m"] == 1000.0
+    assert report["distribution"]["samples"] > 0 and report["distribution"]["p50_s"] > 0
+    assert monitor.route_headways("RT-999") is None
+
+
+def test_headway_alerts_follow_overtakes_and_ignore_silent_buses(monkeypatch):
+    from backend.app import headways
+    from backend.app.headways import HeadwayMonitor
+
+    clock = [1000.0]
+    monkeypatch.setattr(headways.time, "monotonic", lambda: clock[0])
+    monitor = HeadwayMonitor()
+    for vehicle_id, along in [("A", 0.0), ("B", 2500.0), ("C", 5000.0), ("D", 7500.0)]:
+        monitor.update(vehicle_id, "RT-101", along, 36.0, 10_000.0)
+    (alert,) = monitor.update("A", "RT-101", 2300.0, 36.0, 10_000.0)
+    assert (alert["kind"], alert["leader"]) == ("bunching", "B")
+
+    # B overtakes C: A's bunch with B is over, though A itself has not pinged
+    (cleared,) = monitor.update("B", "RT-101", 5700.0, 36.0, 10_000.0)
+    assert (cleared["kind"], cleared["follower"]) == ("cleared", "A") and monitor.alerts() == []
+    # C switching routes leaves A behind B, 1.1 km ahead with three buses left on the route
+    (bunch,) = monitor.update("A", "RT-101", 4600.0, 36.0, 10_000.0)
+    assert (bunch["kind"], bunch["leader"]) == ("bunching", "C")
+    (cleared,) = monitor.update("C", "RT-202", 100.0, 36.0, 8_000.0)
+    assert (cleared["kind"], cleared["follower"]) == ("cleared", "A") and monitor.alerts() == []
+
+    # Silent buses do not count towards the even spacing
+    monitor = HeadwayMonitor()
+    for vehicle_id, along in [("A", 0.0), ("B", 2500.0), ("C", 5000.0), ("D", 7500.0)]:
+        monitor.update(vehicle_id, "RT-101", along, 36.0, 10_000.0)
+    clock[0] += headways.STALE_SECONDS + 1
+    for vehicle_id, along in [("A", 100.0), ("B", 2600.0), ("C", 5100.0)]:
+        monitor.update(vehicle_id, "RT-101", along, 36.0, 10_000.0)
+    assert monitor.expected_headway_m("RT-101") == pytest.approx(10_000.0 / 3)
+
+
+def test_headway_endpoints(client):
+    from backend.app.headways import headway_monitor
+
+    headway_monitor.update("HW-1", "RT-HW", 0.0, 36.0, 4000.0)
+    headway_monitor.update("HW-2", "RT-HW", 100.0, 36.0, 4000.0)
+    try:
+        report = client.get("/routes/RT-HW/headways")
+        alerts = client.get("/headways/alerts?route_id=RT-HW")
+        missing = client.get("/routes/RT-NONE/headways")
+    finally:
+        headway_monitor.remove("HW-1")
+        headway_monitor.remove("HW-2")
+
+    assert report.status_code == 200
+    data = report.json()
+    assert data["expected_headway_m"] == 2000.0
+    assert [b["vehicle_id"] for b in data["buses"]] == ["HW-2", "HW-1"]
+    assert [a["kind"] for a in alerts.json()] == ["bunching"]
+    assert missing.status_code == 404
+
+
+def test_telemetry_is_broadcast_to_websocket_clients(client, monkeypatch):
+    from contextlib import asynccontextmanager
+    from backend.app.routers import tracking
+
+    class _Conn:
+        async def execute(self, query, *args):
+            return "UPDATE 1"
+
+    class _Pool:
+        @asynccontextmanager
+        async def acquire(self):
+            yield _Conn()
+
+    with client.websocket_connect("/ws/buses") as ws:
+        assert ws.receive_json()["type"] == "bus_update"
+        monkeypatch.setattr(tracking, "get_pool", lambda: _Pool())
+        response = client.post(
+            "/location/telemetry", json={"vehicle_id": "PB-02-1001", "passenger_count": 7},
+            headers={"X-API-Key": "sim-key-change-me"},
+        )
+        assert response.status_code == 200
+        message = ws.receive_json()
+        while message["type"] == "bus_update":
+            message = ws.receive_json()
+    assert message == {"vehicle_id": "PB-02-1001", "passenger_count": 7, "type": "telemetry"}
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Schedule adherence
+# ─────────────────────────────────────────────────────────────────────────────
+
+# stops.txt of the _SNAP_STOPS route: S1-S5 at stops A-E
+_GTFS_STOPS = [
+    {"stop_id": f"S{k + 1}", "stop_lat": str(s["latitude"]), "stop_lon": str(s["longitude"])}
+    for k, s in enumerate(_SNAP_STOPS)
+]
+
+
+def _gtfs_trip(trip_id, times, stops=("S1", "S2", "S3", "S4", "S5")):
+    """stop_times rows of a trip over `stops` (A-E of the _SNAP_STOPS route), times as (arrival, departure)."""
+    return [
+        {"trip_id": trip_id, "stop_sequence": str(k + 1), "stop_id": stop_id, "arrival_time": a, "departure_time": d}
+        for k, (stop_id, (a, d)) in enumerate(zip(stops, times))
+    ]
+
+
+def test_schedule_adherence_matches_trips_and_computes_delay():
+    from datetime import date, timedelta
+    from backend.app.route_snapping import RouteSnapper
+    from backend.app.schedule_adherence import ScheduleAdherence, build_timetable
+
+    times = [("07:00:00", "07:00:00"), ("07:05:00", "07:06:00"), ("07:10:00", "07:11:00"),
+             ("07:12:00", "07:12:00"), ("07:20:00", "07:20:00")]
+    later = [(f"07:{int(a[3:5]) + 30}:00", f"07:{int(d[3:5]) + 30}:00") for a, d in times]
+    tables = {
+        "agency.txt": [{"agency_timezone": "Asia/Karachi"}],
+        "calendar.txt": [
+            {"service_id": "WD", "monday": "1", "tuesday": "1", "wednesday": "1", "thursday": "1", "friday": "1",
+             "saturday": "0", "sunday": "0", "start_date": "20260101", "end_date": "20261231"},
+            {"service_id": "WE", "monday": "0", "tuesday": "0", "wednesday": "0", "thursday": "0", "friday": "0",
+             "saturday": "1", "sunday": "1", "start_date": "20260101", "end_date": "20261231"},
+        ],
+        "stops.txt": _GTFS_STOPS,
+        "trips.txt": [{"route_id": "RT-101", "service_id": s, "trip_id": t} for t, s in
+                      [("T1", "WD"), ("T2", "WD"), ("T3", "WE"), ("BACK", "WD"), ("SHORT", "WD")]],
+        "stop_times.txt": _gtfs_trip("T1", times) + _gtfs_trip("T2", later) + _gtfs_trip("T3", times)
+        # The opposite direction, and a short turn from B to D
+        + _gtfs_trip("BACK", times, stops=("S5", "S4", "S3", "S2", "S1"))
+        + _gtfs_trip("SHORT", [("09:00:00", "09:00:00"), ("09:05:00", "09:05:00"), ("09:07:00", "09:07:00")],
+                     stops=("S2", "S3", "S4")),
+    }
+    # A Monday: the weekend trip is not running, and Sunday's trips have finished
+    timetable = build_timetable(tables, date(2026, 10, 19))
+    assert sorted(t.trip_id for t in timetable.trips["RT-101"]) == ["BACK", "SHORT", "T1", "T2"]
+    assert timetable.start.isoformat() == "2026-10-18T19:00:00+00:00"
+
+    snapper = RouteSnapper()
+    snapper.load(_SNAP_STOPS)
+    adherence = ScheduleAdherence()
+    adherence.load(timetable, snapper.routes)
+    at = lambda hh, mm: timetable.start + timedelta(hours=hh, minutes=mm)
+
+    # The reverse trip does not run this route's stops in order; the short turn sits on B-D
+    schedule = adherence.routes["RT-101"]
+    assert schedule.trip_ids == ["T1", "T2", "SHORT"]
+    assert schedule.along[2].tolist() == schedule.along[0][1:4].tolist()
+
+    # 100 m past B at 07:08: due there at 07:06:43 (departed B 07:06, 100/556 of the way to C by 07:10)
+    first = adherence.observe("BUS-1", "RT-101", 656.0, at(7, 8))
+    assert first.trip_id == "T1" and first.delay_s == pytest.approx(77, abs=1)
+    # Waiting at the first stop before departure is on time, and T1 is taken
+    second = adherence.observe("BUS-2", "RT-101", 0.0, at(7, 29))
+    assert second.trip_id == "T2" and second.delay_s == 0.0
+    # BUS-1 keeps its trip as it falls behind
+    late = adherence.observe("BUS-1", "RT-101", 1112.0, at(7, 18))
+    assert late.trip_id == "T1" and late.delay_s == 420.0
+    # Nothing is scheduled in the small hours; unknown routes have no schedule
+    assert adherence.observe("BUS-3", "RT-101", 656.0, at(3, 0)) is None
+    assert adherence.observe("BUS-4", "RT-999", 656.0, at(7, 8)) is None
+
+    report = adherence.route_adherence("RT-101", now=at(7, 20))
+    assert [(b["vehicle_id"], b["status"]) for b in report["buses"]] == [("BUS-1", "late"), ("BUS-2", "on_time")]
+    assert report["summary"]["matched"] == 2 and report["summary"]["max_delay_s"] == 420.0
+    assert report["unmatched_trips"] == []
+    assert adherence.route_adherence("RT-999") is None
+
+
+def test_live_buses_are_served_while_the_gtfs_feed_is_unreadable(client, monkeypatch, tmp_path):
+    """A missing feed is logged, retried after a backoff and leaves buses unannotated."""
+    from contextlib import asynccontextmanager
+    from datetime import datetime, timezone
+    from backend.app import live_cache, schedule_adherence as module
+    from backend.app.live_cache import tick_cache
+    from backend.app.route_snapping import route_snapper
+    from backend.app.routers import tracking
+    from backend.app.schedule_adherence import ScheduleAdherence
+
+    class _Conn:
+        async def fetch(self, query):
+            if "FROM stops" in query:
+                return _SNAP_STOPS
+            return [{
+                "vehicle_id": "PB-02-1001", "route_id": "RT-101", "latitude": 31.6259, "longitude": 74.87,
+                "speed": 30.0, "passenger_count": 3, "last_update": datetime.now(timezone.utc),
+            }]
+
+    class _Pool:
+        @asynccontextmanager
+        async def acquire(self):
+            yield _Conn()
+
+    reads = []
+
+    def load_feed(path, service_date=None):
+        reads.append(path)
+        raise FileNotFoundError(path)
+
+    monkeypatch.setattr(tracking, "get_pool", lambda: _Pool())
+    monkeypatch.setattr(live_cache, "get_pool", lambda: _Pool())
+    monkeypatch.setattr(module, "load_feed", load_feed)
+    monkeypatch.setattr(live_cache, "schedule_adherence", ScheduleAdherence(str(tmp_path / "missing.zip")))
+    tick_cache.invalidate()
+    try:
+        first = client.get("/buses/live")
+        tick_cache.invalidate()
+        second = client.get("/buses/live")
+    finally:
+        route_snapper.invalidate()
+        tick_cache.invalidate()
+
+    assert first.status_code == 200 and second.status_code == 200
+    bus = second.json()[0]
+    assert bus["vehicle_id"] == "PB-02-1001" and bus.get("trip_id") is None
+    assert len(reads) == 1  # the second request is inside the retry backoff
+
+
+def test_live_buses_and_route_adherence_report_delay(client, monkeypatch):
+    from contextlib import asynccontextmanager
+    from datetime import datetime, timedelta, timezone
+    from backend.app import live_cache
+    from backend.app.live_cache import tick_cache
+    from backend.app.route_snapping import route_snapper
+    from backend.app.routers import routes, tracking
+    from backend.app.schedule_adherence import build_timetable, schedule_adherence
+
+    now = datetime.now(timezone.utc)
+    service_date = (now - timedelta(hours=1)).date()
+    # Scheduled times around now on that service day (past 24:00 shortly after midnight)
+    base = int((now - datetime.combine(service_date, datetime.min.time(), tzinfo=timezone.utc)).total_seconds()) - 120
+
+    def clock(seconds):
+        return f"{seconds // 3600:02d}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+
+    offsets = [(-360, -360), (-60, 0), (240, 300), (360, 360), (840, 840)]
+    tables = {
+        "stops.txt": _GTFS_STOPS,
+        "trips.txt": [{"route_id": "RT-101", "service_id": "ALL", "trip_id": "T-NOW"}],
+        "stop_times.txt": _gtfs_trip("T-NOW", [(clock(base + a), clock(base + d)) for a, d in offsets]),
+    }
+
+    class _Conn:
+        async def fetch(self, query):
+            if "FROM stops" in query:
+                return _SNAP_STOPS
+            return [{
+                "vehicle_id": "PB-02-1001", "route_id": "RT-101", "latitude": 31.6259, "longitude": 74.87,
+                "speed": 30.0, "passenger_count": 3, "last_update": now,
+            }]
+
+    class _Pool:
+        @asynccontextmanager
+        async def acquire(self):
+            yield _Conn()
+
+    monkeypatch.setattr(tracking, "get_pool", lambda: _Pool())
+    monkeypatch.setattr(routes, "get_pool", lambda: _Pool())
+    monkeypatch.setattr(live_cache, "get_pool", lambda: _Pool())
+    route_snapper.load(_SNAP_STOPS)
+    schedule_adherence.load(build_timetable(tables, service_date), route_snapper.routes)
+    tick_cache.invalidate()
+    try:
+        bus = client.get("/buses/live").json()[0]
+        report = client.get("/routes/RT-101/adherence")
+        missing = client.get("/routes/RT-999/adherence")
+    finally:
+        schedule_adherence.routes = {}
+        schedule_adherence.invalidate()
+        route_snapper.invalidate()
+        tick_cache.invalidate()
+
+    # 100 m past B, which it was due to leave 2 min ago and 100/556 of the way to C 43 s later
+    assert bus["trip_id"] == "T-NOW" and bus["delay_s"] == pytest.approx(77, abs=2)
+    assert bus["schedule_status"] == "on_time"
+    assert report.status_code == 200
+    data = report.json()
+    assert data["buses"][0]["vehicle_id"] == "PB-02-1001" and data["summary"]["on_time"] == 1
+    assert data["unmatched_trips"] == []
+    assert missing.status_code == 404
@@ -0,0 +1,827 @@
+"""
+Unit tests for the ml_engine package (no DB or API required).
+
+Run: pytest tests/ -v
+"""
+
+import joblib
+import numpy as np
+import pandas as pd
+import pytest
+
+from ml_engine.predictor import ETAPredictor
+
+
+@pytest.fixture(scope="module")
+def model_path(tmp_path_factory):
+    """Train a small GradientBoosting model on synthetic rows and save it."""
+    from sklearn.ensemble import GradientBoostingRegressor
+
+    rng = np.random.default_rng(0)
+    n = 2000
+    X = pd.DataFrame({
+        "distance_meters": rng.uniform(100, 5000, n),
+        "speed": rng.uniform(5, 50, n),
+        "hour": rng.integers(0, 24, n),
+    })
+    rush = X["hour"].isin([7, 8, 16, 17]).to_numpy() * 1.4 + 1.0
+    y = X["distance_meters"] / (X["speed"] * 1000 / 60) * rush + rng.normal(0, 0.1, n)
+
+    model = GradientBoostingRegressor(n_estimators=30, max_depth=3, random_state=0)
+    model.fit(X, y)
+    path = tmp_path_factory.mktemp("model") / "eta_model.pkl"
+    joblib.dump(model, path)
+    return str(path)
+
+
+@pytest.fixture(scope="module")
+def predictor(model_path):
+    p = ETAPredictor(model_path=model_path)
+    assert p.ready
+    return p
+
+
+# --- Batch prediction ---
+
+def test_predict_batch_matches_scalar(predictor):
+    """Batched predictions should equal row-by-row predictions, in order."""
+    distances = np.array([250.0, 1200.0, 4800.0])
+    speeds = np.array([8.0, 20.0, 45.0])
+    hours = np.array([3, 8, 17])
+    batch = predictor.predict_batch(distances, speeds, hours)
+    scalar = [predictor.predict(d, s, int(h)) for d, s, h in zip(distances, speeds, hours)]
+    np.testing.assert_allclose(batch, scalar)
+
+
+def test_predict_batch_fallback():
+    """Without a model, the batch path should use distance / speed."""
+    p = ETAPredictor(model_path="NON_EXISTENT")
+    out = p.predict_batch([600.0, 1200.0], [10.0, 0.0], 12)
+    np.testing.assert_allclose(out, [1.0, 1200.0 / 0.1 / 60.0])
+
+
+# --- Inference executor ---
+
+def test_thread_executor_matches_inline(model_path):
+    """Dispatching through a thread pool should not change predictions."""
+    import asyncio
+    from ml_engine.inference_pool import InferenceExecutor
+
+    executor = InferenceExecutor(model_path, mode="thread", workers=2, timeout_ms=5000)
+    pooled = ETAPredictor(model_path=model_path, executor=executor)
+    try:
+        d, s, h = np.array([500.0, 3000.0]), np.array([10.0, 30.0]), np.array([8, 20])
+        result, source = asyncio.run(pooled.apredict_batch(d, s, h))
+        assert source == "ML_model"
+        np.testing.assert_allclose(result, pooled.predict_batch(d, s, h))
+    finally:
+        executor.shutdown()
+
+
+def test_process_executor_preloads_model(model_path):
+    """Process workers should load the model themselves and agree with it."""
+    import asyncio
+    from ml_engine.inference_pool import InferenceExecutor
+
+    executor = InferenceExecutor(model_path, mode="process", workers=1, timeout_ms=60000)
+    pooled = ETAPredictor(model_path=model_path, executor=executor)
+    try:
+        result, source = asyncio.run(pooled.apredict_batch([1500.0], [20.0], [9]))
+        assert source == "ML_model"
+        np.testing.assert_allclose(result, pooled.predict_batch([1500.0], [20.0], [9]))
+    finally:
+        executor.shutdown()
+
+
+def test_process_worker_serves_grid_like_the_api(model_path, tmp_path, monkeypatch):
+    """In grid mode, workers serve the global model from the grid, as the API's predictor does."""
+    from collections import OrderedDict
+    from ml_engine import inference_pool
+
+    monkeypatch.setattr(inference_pool, "_worker_predictors", OrderedDict())
+    monkeypatch.setattr(inference_pool, "_worker_global", {"model_path": None, "grid_config": None})
+    grid_config = (str(tmp_path / "eta_grid.npy"), 60.0)
+    api = ETAPredictor(model_path=model_path)
+    assert api.enable_grid(*grid_config)
+
+    inference_pool._init_worker(model_path, grid_config)
+    worker = inference_pool._load_worker_predictor(model_path)
+    assert worker.grid is not None
+    d, s, h = [500.0, 3000.0], [10.0, 30.0], [8, 20]
+    np.testing.assert_allclose(inference_pool._worker_predict_batch(model_path, api.model_signature, d, s, h),
+                               api.predict_batch(d, s, h))
+    # Route models are served directly, in workers as in the API
+    route_model = tmp_path / "RT-101.npz"
+    route_model.write_bytes(open(model_path, "rb").read())
+    assert inference_pool._load_worker_predictor(str(route_model)).grid is None
+
+
+def test_process_workers_reload_a_route_model_replaced_in_place(model_path, tmp_path):
+    """A route model swapped at the same path is served fresh by workers that had the old one."""
+    import asyncio
+    import os
+    from sklearn.ensemble import GradientBoostingRegressor
+    from ml_engine.inference_pool import InferenceExecutor
+
+    route_model = tmp_path / "RT-101.pkl"
+    route_model.write_bytes(open(model_path, "rb").read())
+    executor = InferenceExecutor(model_path, mode="process", workers=1, timeout_ms=60000)
+    d, s, h = [1500.0, 3000.0], [20.0, 10.0], [9, 17]
+    try:
+        # Attached after loading, as the registry does, so loading never restarts the pool
+        old = ETAPredictor(model_path=str(route_model))
+        old.executor = executor
+        before, _ = asyncio.run(old.apredict_batch(d, s, h))
+        np.testing.assert_allclose(before, old.predict_batch(d, s, h))
+
+        # Retrained model written over the old file, as the registry would then reload it
+        rng = np.random.default_rng(1)
+        X = pd.DataFrame({"distance_meters": rng.uniform(100, 5000, 300), "speed": rng.uniform(5, 50, 300),
+                          "hour": rng.integers(0, 24, 300)})
+        y = 2 * X["distance_meters"] / (X["speed"] * 1000 / 60)
+        joblib.dump(GradientBoostingRegressor(n_estimators=5, random_state=0).fit(X, y), route_model)
+        stat = route_model.stat()
+        os.utime(route_model, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+        new = ETAPredictor(model_path=str(route_model))
+        new.executor = executor
+        assert new.model_signature != old.model_signature
+
+        after, _ = asyncio.run(new.apredict_batch(d, s, h))
+        np.testing.assert_allclose(after, new.predict_batch(d, s, h))
+        assert not np.allclose(after, before)
+    finally:
+        executor.shutdown()
+
+
+class _SlowPredictor(ETAPredictor):
+    def __init__(self, model_path, delay, executor=None):
+        super().__init__(model_path=model_path, executor=executor)
+        self.delay = delay
+
+    def predict_batch(self, distances_meters, current_speeds, hours_of_day):
+        import time
+        time.sleep(self.delay)
+        return super().predict_batch(distances_meters, current_speeds, hours_of_day)
+
+
+def test_executor_timeout_falls_back(model_path):
+    """Calls that overrun the timeout should get the rule-based estimate."""
+    import asyncio
+    from ml_engine.inference_pool import InferenceExecutor
+
+    executor = InferenceExecutor(model_path, mode="thread", workers=1, timeout_ms=20)
+    slow = _SlowPredictor(model_path, delay=0.3, executor=executor)
+    try:
+        result, source = asyncio.run(slow.apredict_batch([600.0], [10.0], [8]))
+        assert source == "rule_based_fallback"
+        np.testing.assert_allclose(result, [1.0])
+        assert executor.timed_out == 1
+    finally:
+        executor.shutdown()
+
+
+def test_executor_saturation_falls_back(model_path):
+    """Once max_pending calls are in flight, new calls should fall back immediately."""
+    import asyncio
+    from ml_engine.inference_pool import InferenceExecutor
+
+    executor = InferenceExecutor(model_path, mode="thread", workers=1, max_pending=1, timeout_ms=2000)
+    slow = _SlowPredictor(model_path, delay=0.2, executor=executor)
+
+    async def run():
+        return await asyncio.gather(
+            slow.apredict_batch([600.0], [10.0], [8]),
+            slow.apredict_batch([600.0], [10.0], [8]),
+        )
+
+    try:
+        (_, first), (_, second) = asyncio.run(run())
+        assert first == "ML_model"
+        assert second == "rule_based_fallback"
+        assert executor.rejected == 1
+    finally:
+        executor.shutdown()
+
+
+# --- NumPy fast path ---
+
+def test_predict_array_matches_sklearn_dataframe(model_path, predictor):
+    """Array-native predictions should equal the named-DataFrame sklearn path."""
+    reference = joblib.load(model_path)
+    X = pd.DataFrame(
+        [[250.0, 8.0, 3], [1200.0, 20.0, 8], [4800.0, 45.0, 17]],
+        columns=ETAPredictor.FEATURE_COLUMNS,
+    )
+    expected = np.maximum(reference.predict(X), 0.0)
+    np.testing.assert_allclose(predictor.predict_array(X.to_numpy()), expected)
+    assert predictor.predict(1200.0, 20.0, 8) == pytest.approx(expected[1])
+
+
+def test_mismatched_feature_order_rejected(tmp_path):
+    """A model fitted with a different column order must not be served."""
+    from sklearn.linear_model import LinearRegression
+
+    X = pd.DataFrame({"speed": [1.0, 2.0, 3.0], "distance_meters": [1.0, 5.0, 2.0], "hour": [1, 2, 3]})
+    path = tmp_path / "bad.pkl"
+    joblib.dump(LinearRegression().fit(X, [1.0, 2.0, 3.0]), path)
+    assert not ETAPredictor(model_path=str(path)).ready
+
+
+# --- Compiled tree ensemble ---
+
+@pytest.fixture(scope="module")
+def compiled_path(model_path, tmp_path_factory):
+    from ml_engine.compiled_model import export_gradient_boosting
+
+    path = tmp_path_factory.mktemp("compiled") / "eta_model.npz"
+    export_gradient_boosting(joblib.load(model_path), path, ETAPredictor.FEATURE_COLUMNS)
+    return str(path)
+
+
+def test_compiled_model_matches_sklearn(model_path, compiled_path):
+    """Flat-array evaluation should reproduce sklearn's predictions."""
+    from ml_engine.compiled_model import CompiledTreeEnsemble
+
+    rng = np.random.default_rng(1)
+    X = np.column_stack((rng.uniform(0, 6000, 5000), rng.uniform(0, 60, 5000), rng.integers(0, 24, 5000)))
+    reference = joblib.load(model_path).predict(pd.DataFrame(X, columns=ETAPredictor.FEATURE_COLUMNS))
+    np.testing.assert_allclose(CompiledTreeEnsemble.load(compiled_path).predict(X), reference, rtol=0, atol=1e-9)
+
+
+def test_predictor_serves_compiled_model(model_path, compiled_path):
+    """ETAPredictor should load .npz files and agree with the pickled model."""
+    compiled = ETAPredictor(model_path=compiled_path)
+    assert compiled.ready
+    pickled = ETAPredictor(model_path=model_path)
+    d, s, h = [300.0, 2500.0], [6.0, 25.0], [7, 22]
+    np.testing.assert_allclose(compiled.predict_batch(d, s, h), pickled.predict_batch(d, s, h), atol=1e-9)
+
+
+def test_compiled_model_is_memory_mapped(compiled_path):
+    """Tree arrays should be served straight from the page cache."""
+    from ml_engine.compiled_model import CompiledTreeEnsemble
+
+    mapped = CompiledTreeEnsemble.load(compiled_path)
+    assert isinstance(mapped.threshold.base, np.memmap)
+    assert isinstance(mapped.left.base, np.memmap)
+    X = np.array([[1200.0, 9.0, 8], [4000.0, 30.0, 13]])
+    np.testing.assert_array_equal(mapped.predict(X), CompiledTreeEnsemble.load(compiled_path, mmap=False).predict(X))
+
+
+def test_compiled_serving_needs_no_sklearn(compiled_path):
+    """Serving a compiled model must not import sklearn, joblib or pandas."""
+    import subprocess
+    import sys
+    from pathlib import Path
+
+    code = (
+        "import sys\n"
+        "from ml_engine.predictor import ETAPredictor\n"
+        f"p = ETAPredictor(model_path={compiled_path!r})\n"
+        "assert p.ready and p.predict(1000.0, 10.0, 8) >= 0\n"
+        "loaded = {'sklearn', 'joblib', 'pandas'} & set(sys.modules)\n"
+        "assert not loaded, loaded\n"
+    )
+    root = Path(__file__).resolve().parent.parent
+    result = subprocess.run([sys.executable, "-c", code], cwd=root, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+
+
+# --- Lookup grid serving ---
+
+def test_grid_interpolation_is_exact_for_linear_functions():
+    """Trilinear interpolation should reproduce a function linear in each axis."""
+    from ml_engine.eta_grid import ETAGrid
+
+    def linear(features):
+        return 0.001 * features[:, 0] + 0.5 * features[:, 1] + 0.1 * features[:, 2]
+
+    grid = ETAGrid.build(linear, distance_max=1000, distance_points=11, speed_max=20, speed_points=5)
+    d = np.array([0.0, 123.4, 999.0, 1000.0])
+    s = np.array([0.0, 7.3, 19.9, 20.0])
+    h = np.array([0.0, 5.0, 12.5, 22.0])
+    expected = 0.001 * d + 0.5 * s + 0.1 * h
+    np.testing.assert_allclose(grid.interpolate(d, s, h), expected, rtol=1e-5)
+    assert np.isnan(grid.interpolate([1500.0], [5.0], [1])).all()
+
+
+def test_predictor_grid_mode(model_path, tmp_path):
+    """Grid serving should stay close to the model and fall back to it out of range."""
+    grid_path = tmp_path / "eta_grid.npy"
+    p = ETAPredictor(model_path=model_path)
+    assert p.enable_grid(grid_path, error_budget_min=60.0)
+    assert grid_path.exists()
+
+    model_only = ETAPredictor(model_path=model_path)
+    rng = np.random.default_rng(3)
+    X = np.column_stack((rng.uniform(100, 5000, 500), rng.uniform(5, 25, 500), rng.integers(0, 24, 500)))
+    assert np.mean(np.abs(p.predict_array(X) - model_only.predict_array(X))) < 1.0
+
+    far = np.array([[50_000.0, 10.0, 8]])
+    np.testing.assert_allclose(p.predict_array(far), model_only.predict_array(far))
+
+    # A second predictor reuses the saved grid (memory-mapped) instead of rebuilding
+    again = ETAPredictor(model_path=model_path)
+    assert again.enable_grid(grid_path, error_budget_min=60.0)
+    assert isinstance(again.grid.table, np.memmap)
+
+
+def test_predictor_grid_rejected_over_budget(model_path, tmp_path):
+    """A grid that misses the error budget must not be enabled."""
+    p = ETAPredictor(model_path=model_path)
+    assert not p.enable_grid(tmp_path / "eta_grid.npy", error_budget_min=0.0)
+    assert p.grid is None
+
+
+# --- Lazy loading and hot-reload ---
+
+def test_lazy_predictor_serves_fallback_until_loaded(model_path):
+    p = ETAPredictor(model_path=model_path, lazy=True)
+    assert not p.ready and p.status == "fallback"
+    np.testing.assert_allclose(p.predict_batch([600.0], [10.0], [8]), [1.0])
+
+    assert p.load()
+    assert p.status == "loaded"
+    assert p.model_version == 1
+
+
+def test_reload_swaps_model_and_keeps_old_on_failure(model_path, compiled_path, tmp_path):
+    """A new file is swapped in with a version bump; a broken one leaves the old model serving."""
+    import os
+    import shutil
+
+    live_path = tmp_path / "eta_model.npz"
+    shutil.copy(compiled_path, live_path)
+    p = ETAPredictor(model_path=str(live_path))
+    before = p.predict_batch([2500.0], [12.0], [8])
+
+    from ml_engine.compiled_model import export_gradient_boosting
+    model = joblib.load(model_path)
+    model.learning_rate *= 2  # A visibly different "retrained" model
+    export_gradient_boosting(model, live_path, ETAPredictor.FEATURE_COLUMNS)
+    assert p.load()
+    assert p.model_version == 2
+    assert not np.allclose(p.predict_batch([2500.0], [12.0], [8]), before)
+
+    reloaded = p.predict_batch([2500.0], [12.0], [8])
+    broken = tmp_path / "broken.npz"
+    broken.write_bytes(b"not a model")
+    os.replace(broken, live_path)  # Model files are replaced, never rewritten in place
+    assert not p.load()
+    assert p.model_version == 2 and p.status == "loaded"
+    np.testing.assert_array_equal(p.predict_batch([2500.0], [12.0], [8]), reloaded)
+
+
+def test_model_reloader_picks_up_changed_file(compiled_path, tmp_path):
+    import asyncio
+    import os
+    import shutil
+    from backend.app.model_reloader import ModelReloader
+
+    live_path = tmp_path / "eta_model.npz"
+    p = ETAPredictor(model_path=str(live_path), lazy=True)
+    reloader = ModelReloader(p, poll_seconds=0)
+
+    async def scenario():
+        assert not await reloader.check()  # No file yet
+        shutil.copy(compiled_path, live_path)
+        assert await reloader.check()
+        assert not await reloader.check()  # Unchanged
+        stat = live_path.stat()
+        os.utime(live_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+        assert await reloader.check()
+
+    asyncio.run(scenario())
+    assert p.model_version == 2 and reloader.reloads == 2
+
+
+# --- Per-route model registry ---
+
+def test_model_registry_resolution_order(compiled_path, tmp_path):
+    """Hourly route model, then all-day route model, then the global model."""
+    import shutil
+    from ml_engine.model_registry import ModelRegistry
+
+    shutil.copy(compiled_path, tmp_path / "RT-101.npz")
+    shutil.copy(compiled_path, tmp_path / "RT-101_h08.npz")
+    (tmp_path / "RT-202.npz").write_bytes(b"broken")
+    fallback = ETAPredictor(model_path="NON_EXISTENT")
+    registry = ModelRegistry(tmp_path, fallback=fallback)
+
+    hourly, outcome = registry.resolve("RT-101", 8)
+    assert outcome == "miss" and hourly.model_path.endswith("RT-101_h08.npz")
+    assert registry.resolve("RT-101", 8) == (hourly, "hit")
+    all_day, _ = registry.resolve("RT-101", 9)
+    assert all_day.model_path.endswith("RT-101.npz")
+
+    assert registry.resolve("RT-202", 8) == (fallback, "global")  # unloadable file
+    assert registry.resolve("RT-999", 8) == (fallback, "global")
+    assert registry.resolve("../RT-101", 8) == (fallback, "global")  # only indexed files are opened
+
+
+def test_model_registry_evicts_least_recently_used(compiled_path, tmp_path):
+    import os
+    import shutil
+    from ml_engine.model_registry import ModelRegistry
+
+    for route in ("A", "B", "C"):
+        shutil.copy(compiled_path, tmp_path / f"{route}.npz")
+    size = os.path.getsize(compiled_path)
+    registry = ModelRegistry(tmp_path, fallback=ETAPredictor(model_path="NON_EXISTENT"), max_bytes=2 * size)
+
+    registry.resolve("A", 8)
+    registry.resolve("B", 8)
+    registry.resolve("A", 8)  # B is now least recently used
+    registry.resolve("C", 8)
+    assert registry.resident_models == 2 and registry.resident_bytes == 2 * size
+    assert registry.evictions == 1
+    assert registry.resolve("A", 8)[1] == "hit"
+    assert registry.resolve("B", 8)[1] == "miss"
+
+    # A replaced file is dropped on refresh and reloaded on next use
+    replacement = tmp_path / "A.tmp"
+    shutil.copy(compiled_path, replacement)
+    os.utime(replacement, ns=(0, 1))
+    os.replace(replacement, tmp_path / "A.npz")
+    registry.refresh()
+    assert registry.resolve("A", 8)[1] == "miss"
+
+
+# --- Training data from vehicle_logs ---
+
+def _straight_line_window(n=600, speed_m_s=10.0, gap_at=None):
+    """One bus driving north at constant speed, one ping per second."""
+    from ml_engine.geo import EARTH_RADIUS_M
+    from ml_engine.vehicle_logs import LogWindow
+
+    t = np.arange(n, dtype=np.float64)
+    if gap_at is not None:
+        t[gap_at:] += 600  # ten minutes of silence
+    lat = 12.97 + np.degrees(np.arange(n) * speed_m_s / EARTH_RADIUS_M)
+    return LogWindow(
+        vehicle=np.zeros(n, dtype=np.int64), route=np.zeros(n, dtype=np.int64), t=t,
+        hour=np.full(n, 8.0), lat=lat, lng=np.full(n, 77.59), speed=np.full(n, speed_m_s * 3.6),
+        start=0.0, end=float(n // 2),
+    )
+
+
+def test_haversine_matches_known_distance():
+    from ml_engine.geo import haversine_m
+
+    # One degree of latitude is ~111.2 km
+    assert haversine_m(0.0, 0.0, 1.0, 0.0) == pytest.approx(111_195, rel=1e-3)
+    np.testing.assert_allclose(haversine_m([0.0, 10.0], [0.0, 20.0], [0.0, 10.0], [0.0, 20.0]), [0.0, 0.0])
+
+
+def test_traversal_features_recover_travel_time():
+    from ml_engine.vehicle_logs import TraversalConfig, traversal_features
+
+    window = _straight_line_window()
+    config = TraversalConfig(min_distance_m=200, max_distance_m=1000, start_fraction=1.0)
+    rows = traversal_features(window, config, np.random.default_rng(0))
+
+    assert len(rows) > 100
+    distance, speed, hour, _, minutes = rows.T
+    assert np.all((distance >= 200) & (distance <= 1010))
+    np.testing.assert_allclose(minutes * 60, distance / 10.0, rtol=1e-3)  # 10 m/s throughout
+    np.testing.assert_allclose(speed, 36.0)
+    assert set(hour) == {8.0}
+
+
+def test_traversal_features_respect_gaps_and_window():
+    from ml_engine.vehicle_logs import TraversalConfig, traversal_features
+
+    window = _straight_line_window(gap_at=250)
+    config = TraversalConfig(min_distance_m=200, max_distance_m=1000, start_fraction=1.0)
+    rows = traversal_features(window, config, np.random.default_rng(0))
+
+    # Nothing spans the gap, so no traversal takes anywhere near 10 minutes
+    assert rows[:, 4].max() < 2.0
+    # Only pings inside [start, end) start traversals: 250 before the gap + 50 after
+    assert len(rows) <= 300
+
+
+def test_reservoir_is_uniform_over_the_stream():
+    from ml_engine.vehicle_logs import Reservoir
+
+    counts = np.zeros(1000)
+    for seed in range(200):
+        reservoir = Reservoir(capacity=100, n_columns=1, seed=seed)
+        for chunk in np.array_split(np.arange(1000.0), 7):
+            reservoir.add(chunk[:, None])
+        assert reservoir.seen == 1000 and len(reservoir.sample) == 100
+        counts[reservoir.sample[:, 0].astype(int)] += 1
+
+    # Each row should be kept ~10% of the time wherever it appeared in the stream
+    first, last = counts[:500].mean(), counts[500:].mean()
+    assert first == pytest.approx(20, rel=0.1) and last == pytest.approx(20, rel=0.1)
+
+
+def test_log_windows_stream_through_cursor():
+    """Windows are read in bounded cursor batches, with a lookahead past each window end."""
+    import asyncio
+    from contextlib import asynccontextmanager
+    from datetime import datetime, timedelta, timezone
+    from ml_engine.vehicle_logs import iter_log_windows
+
+    class _Cursor:
+        def __init__(self, rows):
+            self.rows = rows
+
+        async def fetch(self, n):
+            batch, self.rows = self.rows[:n], self.rows[n:]
+            return batch
+
+    class _Conn:
+        def __init__(self):
+            self.ranges = []
+
+        @asynccontextmanager
+        async def transaction(self):
+            yield
+
+        async def cursor(self, query, start, end, tz):
+            self.ranges.append((start, end))
+            self.tz = tz
+            base = start.timestamp()
+            return _Cursor([("BUS-1", "RT-101", base + i, 8, 12.97, 77.59, 30.0, 2) for i in range(7)])
+
+    since = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    conn = _Conn()
+
+    async def collect():
+        return [w async for w in iter_log_windows(
+            conn, since, since + timedelta(hours=12), window=timedelta(hours=6),
+            lookahead=timedelta(minutes=30), fetch_rows=3, tz="Asia/Kolkata",
+        )]
+
+    windows = asyncio.run(collect())
+    assert len(windows) == 2 and all(len(w.t) == 7 for w in windows)
+    assert conn.ranges[0] == (since, since + timedelta(hours=6, minutes=30))
+    assert windows[1].start == (since + timedelta(hours=6)).timestamp()
+    # Hours are extracted on the network's clock, as /eta reads it
+    assert conn.tz == "Asia/Kolkata"
+
+
+# --- Synthetic dataset generator ---
+
+def test_generated_chunk_follows_the_traffic_model():
+    from ml_engine.dataset_generator import generate_chunk
+
+    df = generate_chunk(20_000, np.random.default_rng(0))
+    assert list(df.columns) == [
+        "route_id", "stop_start", "stop_end", "timestamp", "day_of_week",
+        "hour_of_day", "is_weekend", "weather", "distance_km", "travel_time_min",
+    ]
+    assert (df["timestamp"].dt.dayofweek == df["day_of_week"]).all()
+    assert (df["timestamp"].dt.hour == df["hour_of_day"]).all()
+    assert (df.loc[df["route_id"] == "R-B2", "stop_start"].isin(["S-B1", "S-B2"])).all()
+
+    # Clear weekday off-peak R-A1 trips average distance / speed: (2.5 km / 3) / 30 km/h = 1.667 min
+    base = df[(df["route_id"] == "R-A1") & (df["weather"] == "Clear") & (df["is_weekend"] == 0)
+              & ~df["hour_of_day"].isin([7, 8, 16, 17])]
+    assert base["travel_time_min"].mean() == pytest.approx(2.5 / 3 / 30 * 60, abs=0.05)
+
+
+def test_generator_output_is_independent_of_workers(tmp_path):
+    from ml_engine.dataset_generator import generate_smart_transit_data
+
+    serial, parallel = tmp_path / "serial.csv", tmp_path / "parallel.csv"
+    generate_smart_transit_data(5000, serial, chunk_size=2000, seed=7)
+    generate_smart_transit_data(5000, parallel, chunk_size=2000, seed=7, workers=2)
+    assert serial.read_bytes() == parallel.read_bytes()
+    assert len(pd.read_csv(serial)) == 5000
+
+
+def test_generator_writes_partitioned_parquet(tmp_path):
+    pytest.importorskip("pyarrow")
+    from ml_engine.dataset_generator import generate_smart_transit_data
+
+    generate_smart_transit_data(3000, tmp_path / "trips", chunk_size=1000, seed=7, fmt="parquet")
+    # A rerun replaces its own dataset rather than appending to it
+    generate_smart_transit_data(3000, tmp_path / "trips", chunk_size=1000, seed=7, fmt="parquet")
+    assert sorted(p.name for p in (tmp_path / "trips").iterdir()) == [
+        "_SMART_TRANSIT_DATASET", "route_id=R-A1", "route_id=R-B2", "route_id=R-C3",
+    ]
+    assert len(pd.read_parquet(tmp_path / "trips")) == 3000
+
+
+def test_generator_refuses_ambiguous_or_foreign_outputs(tmp_path):
+    from ml_engine.dataset_generator import generate_smart_transit_data
+
+    with pytest.raises(ValueError):
+        generate_smart_transit_data(0, tmp_path / "empty.csv")
+    with pytest.raises(ValueError):
+        generate_smart_transit_data(100, tmp_path / "trips.txt")
+    assert not (tmp_path / "trips.txt").exists()
+
+    foreign = tmp_path / "home"
+    foreign.mkdir()
+    (foreign / "notes.md").write_text("keep me")
+    pytest.importorskip("pyarrow")
+    with pytest.raises(FileExistsError):
+        generate_smart_transit_data(100, foreign, fmt="parquet")
+    assert (foreign / "notes.md").read_text() == "keep me"
+
+
+# --- Model benchmark harness ---
+
+def test_bench_models_writes_model_cards(tmp_path):
+    import json
+    from ml_engine.bench_models import run_benchmark
+
+    cards = run_benchmark(["linear", "gbr"], rows=3000, output_dir=tmp_path, workers=2)
+    assert [card["name"] for card in cards] == ["linear", "gbr"]
+
+    gbr = json.loads((tmp_path / "gbr.card.json").read_text())
+    assert gbr["artifact"] == "gbr.npz" and (tmp_path / "gbr.npz").exists()
+    assert gbr["metrics"]["mae_minutes"] < cards[0]["metrics"]["mae_minutes"]  # trees beat the linear baseline
+    for key in ("single_row", "batch_1024"):
+        assert 0 < gbr["latency_us"][key]["p50"] <= gbr["latency_us"][key]["p99"]
+    assert gbr["size_bytes"] == (tmp_path / "gbr.npz").stat().st_size
+    assert gbr["load_ms"]["median"] > 0 and gbr["params"]["n_estimators"] == 100
+
+
+# --- Segment speed profiles ---
+
+def test_project_to_segments_picks_nearest_leg():
+    from ml_engine.geo import project_to_segments
+
+    # An L-shaped route: north along lng 77.59, then east along lat 12.98
+    stop_lat, stop_lng = [12.97, 12.98, 12.98], [77.59, 77.59, 77.60]
+    segment, fraction, distance = project_to_segments(
+        [12.975, 12.9801, 12.95], [77.5901, 77.595, 77.59], stop_lat, stop_lng,
+    )
+    assert segment.tolist() == [0, 1, 0]
+    np.testing.assert_allclose(fraction, [0.5, 0.5, 0.0], atol=1e-3)
+    assert distance[0] == pytest.approx(10.8, abs=0.5) and distance[2] == pytest.approx(2224, rel=1e-2)
+
+
+def test_segment_histograms_and_percentiles():
+    from ml_engine.segment_profiles import SegmentSpeedProfiles, histogram_rows
+    from ml_engine.vehicle_logs import LogWindow
+
+    rng = np.random.default_rng(0)
+    n = 4000
+    speeds = rng.uniform(10, 40, n)
+    window = LogWindow(
+        vehicle=np.zeros(n, dtype=np.int64), route=np.zeros(n, dtype=np.int64), t=np.arange(n, dtype=np.float64),
+        hour=np.full(n, 8.0), lat=rng.uniform(12.97, 12.98, n), lng=np.full(n, 77.59), speed=speeds,
+        start=0.0, end=float(n), day_of_week=np.full(n, 1),
+    )
+    stops = {"RT-101": (np.array([12.97, 12.975, 12.98]), np.array([77.59, 77.59, 77.59]))}
+    rows = histogram_rows(window, ["RT-101"], stops)
+    assert sum(r[4] for r in rows) == n
+    assert {(r[1], r[2]) for r in rows} == {(0, 32), (1, 32)}  # Tuesday 08:00 is hour 32 of the week
+
+    profiles = SegmentSpeedProfiles.from_histograms(rows)
+    p10, p50, p90 = profiles.lookup("RT-101", 0, 32)
+    assert p10 == pytest.approx(13, abs=1.5) and p50 == pytest.approx(25, abs=1.5) and p90 == pytest.approx(37, abs=1.5)
+    # Sparse hours fall back to the segment's whole-week distribution
+    np.testing.assert_allclose(profiles.lookup("RT-101", 0, 100), profiles.lookup("RT-101", 0, 32))
+    assert profiles.lookup("RT-101", 2, 32) is None and profiles.lookup("RT-999", 0, 32) is None
+
+
+def test_segment_profile_refresh_counts_hours_in_transit_timezone(monkeypatch):
+    import asyncio
+    import contextlib
+    from datetime import datetime, timezone
+    from ml_engine import segment_profiles
+
+    seen = {}
+
+    async def fake_windows(conn, since, until, **kwargs):
+        seen.update(kwargs)
+        return
+        yield
+
+    async def fake_stops(conn):
+        return {}
+
+    class _Conn:
+        async def fetchval(self, query, *args):
+            return True if "advisory_lock" in query else None
+
+        async def execute(self, query, *args):
+            pass
+
+        def transaction(self):
+            return contextlib.nullcontext()
+
+    monkeypatch.setattr(segment_profiles, "iter_log_windows", fake_windows)
+    monkeypatch.setattr(segment_profiles, "load_route_stops", fake_stops)
+    until = datetime(2025, 1, 7, tzinfo=timezone.utc)
+    assert asyncio.run(segment_profiles.refresh_segment_profiles(_Conn(), until=until, tz="Asia/Kolkata")) == 0
+    assert seen["tz"] == "Asia/Kolkata"
+
+
+def test_predictor_blends_segment_speed():
+    from ml_engine.segment_profiles import SegmentSpeedProfiles
+
+    p = ETAPredictor(model_path="NON_EXISTENT")
+    assert p.blend_segment_speed(0.0, "RT-101", 0, 32) == 0.0  # no profiles loaded
+    p.segment_profiles = SegmentSpeedProfiles.from_histograms([("RT-101", 0, 32, 4, 100)])
+    assert p.blend_segment_speed(0.0, "RT-101", 0, 32) == pytest.approx(0.5 * 22.5)
+    assert p.blend_segment_speed(10.0, "RT-101", 5, 32) == 10.0
+
+
+# --- ETA backtest ---
+
+def _route_trip(n_stops=4, spacing_m=1000.0, speed_m_s=10.0, interval_s=5.0, t0=0.0):
+    """Pings of a bus driving north through evenly spaced stops at constant speed."""
+    from ml_engine.geo import EARTH_RADIUS_M
+
+    meters = np.arange(0.0, (n_stops - 1) * spacing_m + 1, speed_m_s * interval_s)
+    lat = 12.97 + np.degrees(meters / EARTH_RADIUS_M)
+    stop_lat = 12.97 + np.degrees(np.arange(n_stops) * spacing_m / EARTH_RADIUS_M)
+    n = meters.shape[0]
+    return (t0 + np.arange(n) * interval_s, lat, np.full(n, 77.59), np.full(n, speed_m_s * 3.6),
+            np.full(n, 8.0), stop_lat, np.full(n_stops, 77.59))
+
+
+def test_replay_scores_every_stop_ahead():
+    from ml_engine.backtest import BacktestConfig, replay_run
+
+    t, lat, lng, speed, hour, stop_lat, stop_lng = _route_trip()
+    hours, actual, predicted = replay_run(
+        t, lat, lng, speed, hour, stop_lat, stop_lng, ETAPredictor(model_path="NON_EXISTENT"), BacktestConfig(),
+    )
+    # 60 pings before the last stop, each predicting 1-3 stops ahead
+    assert len(actual) == 20 * 3 + 20 * 2 + 20 * 1
+    # Constant speed: distance / speed is exactly right
+    np.testing.assert_allclose(predicted, actual, atol=1e-3)
+    assert actual.max() == pytest.approx(5.0) and set(hours) == {8.0}
+
+
+def test_replay_does_not_match_arrivals_across_trips():
+    from ml_engine.backtest import BacktestConfig, replay_run
+
+    first = _route_trip()
+    second = _route_trip(t0=first[0][-1] + 600)  # next run starts after a layover
+    t, lat, lng, speed, hour = (np.concatenate([a, b]) for a, b in zip(first[:5], second[:5]))
+    predictor = ETAPredictor(model_path="NON_EXISTENT")
+    _, actual, predicted = replay_run(t, lat, lng, speed, hour, first[5], first[6], predictor, BacktestConfig())
+
+    assert len(actual) == 2 * 120 and actual.max() == pytest.approx(5.0)
+    # Only origins in [start, end) are scored; stops are still reached after `end`
+    _, actual, _ = replay_run(t, lat, lng, speed, hour, first[5], first[6], predictor, BacktestConfig(), end=t[10])
+    assert len(actual) == 10 * 3
+
+
+def test_backtest_stats_merge_and_summarize():
+    from ml_engine.backtest import BacktestStats
+
+    stats, other = BacktestStats(), BacktestStats()
+    stats.add("RT-101", np.array([8, 8, 17]), np.array([1.0, 3.0, 12.0]), np.array([2.0, 3.0, 9.0]))
+    other.add("RT-101", np.array([8]), np.array([1.5]), np.array([1.0]))
+    other.add("RT-202", np.array([9]), np.array([50.0]), np.array([50.0]))
+    stats.merge(other)
+
+    assert stats.predictions == 5
+    by_horizon = stats.table(by=("horizon",)).set_index("horizon")
+    assert by_horizon.loc["0-2", "n"] == 2 and by_horizon.loc["0-2", "bias_min"] == pytest.approx(0.25)
+    assert by_horizon.loc["10-15", "mae_min"] == pytest.approx(3.0)
+    assert by_horizon.loc["45+", "rmse_min"] == 0.0
+    full = stats.table()
+    assert len(full) == 4 and set(full["route_id"]) == {"RT-101", "RT-202"}
+
+
+def test_backtest_replays_logs_on_a_process_pool():
+    import asyncio
+    from contextlib import asynccontextmanager
+    from datetime import datetime, timedelta, timezone
+    from ml_engine.backtest import run_backtest
+
+    since = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    t, lat, lng, speed, hour, stop_lat, stop_lng = _route_trip()
+
+    class _Cursor:
+        def __init__(self, rows):
+            self.rows = rows
+
+        async def fetch(self, n):
+            batch, self.rows = self.rows[:n], self.rows[n:]
+            return batch
+
+    class _Conn:
+        async def fetch(self, query):
+            return [{"route_id": "RT-101", "latitude": a, "longitude": b} for a, b in zip(stop_lat, stop_lng)]
+
+        @asynccontextmanager
+        async def transaction(self):
+            yield
+
+        async def cursor(self, query, start, end, tz):
+            base = start.timestamp()
+            return _Cursor([
+                (bus, "RT-101", base + ti, 8, la, ln, sp, 2)
+                for bus in ("BUS-1", "BUS-2") for ti, la, ln, sp in zip(t, lat, lng, speed)
+            ])
+
+    stats = asyncio.run(run_backtest(
+        _Conn(), since, since + timedelta(days=2), "NON_EXISTENT", workers=2, runs_per_task=1,
+    ))
+    # 2 days x 2 buses x 120 (ping, stop) pairs, all predicted exactly
+    assert stats.predictions == 480
+    summary = stats.table(by=("route_id",))
+    assert summary.loc[0, "mae_min"] < 0.01